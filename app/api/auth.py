@@ -1,10 +1,13 @@
+from typing import Optional
+
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from jose import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
-from app.db.db import get_db
-from app.models.user import User
+from app.core.config import settings
+from app.db.db import get_async_db
+from app.services.identity import Identity, decode_token_claims, resolve_identity
 import logging
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/token")
@@ -12,33 +15,46 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/token")
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "test-secret-key-for-development")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 
-def get_current_user(
+logger = logging.getLogger("app.api.auth")
+
+
+async def get_session_identity(request: Request, db: AsyncSession) -> Optional[Identity]:
+    # The logged-in session user, resolved at most once per request (then from request.state)
+    if not hasattr(request.state, "session_identity"):
+        username = request.session.get("username") if "session" in request.scope else None
+        request.state.session_identity = await resolve_identity(db, username)
+    return request.state.session_identity
+
+
+def is_admin(identity: Optional[Identity]) -> bool:
+    admins = {name.strip() for name in settings.admin_usernames.split(",") if name.strip()}
+    return identity is not None and identity.username in admins
+
+
+async def get_current_user(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: str = Depends(oauth2_scheme),
-):
-    logging.warning(f"Session content: {dict(request.session) if hasattr(request, 'session') else 'No session'}")
-    logging.warning(f"Authorization token: {token}")
-    username = request.session.get("username") if hasattr(request, 'session') else None
-    if username:
-        user = db.query(User).filter(User.username == username).first()
-        if user:
-            logging.warning(f"Authenticated via session as user: {username}")
-            return user
+) -> Identity:
+    identity = await get_session_identity(request, db)
+    if identity:
+        logger.debug(f"Authenticated via session as user: {identity.username}")
+        return identity
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
+        username: str = decode_token_claims(token, SECRET_KEY, ALGORITHM).get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    identity = await resolve_identity(db, username)
+    if identity is None:
         raise credentials_exception
-    logging.warning(f"Authenticated via JWT as user: {username}")
-    return user
+    logger.debug(f"Authenticated via JWT as user: {username}")
+    return identity
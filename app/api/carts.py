@@ -2,18 +2,21 @@ import logging
 import uuid
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.auth import get_current_user
-from app.db.db import get_db
-from app.models.user import User
-from app.schemas.cart import Cart, CartItemCreate
+from app.api.auth import get_current_user, get_session_identity, is_admin
+from app.core.config import settings
+from app.db.db import get_async_db
+from app.schemas.cart import Cart, CartBatch, CartClear, CartItemCreate
 from app.services.shop_services import (
-    get_cart, get_or_create_cart, add_item_to_cart,
+    get_cart, get_cart_data, get_cart_version, get_or_create_cart, add_item_to_cart,
     remove_item_from_cart, update_cart_item_quantity, remove_all_items_from_cart,
-    get_user, get_user_by_username_or_email,
+    apply_cart_operations, clear_carts, get_owned_cart_ids,
 )
+from app.services.identity import Identity, resolve_identity
+from app.utils.fast_json import fast_json_response
+from app.utils.http_cache import CART_CACHE_CONTROL, etag_matches, not_modified, set_cache_headers, version_etag
 
 router = APIRouter()
 
@@ -23,15 +26,29 @@ logger.setLevel(logging.DEBUG)
 
 
 @router.get("/{cart_id}", response_model=Cart)
-def read_cart(cart_id: int, db: Session = Depends(get_db)):
-    db_cart = get_cart(db, cart_id=cart_id)
+async def read_cart(cart_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    # The version is one narrow query; the lines are only loaded when the ETag changed.
+    # Read before the body: a write in between can only make the ETag older, never newer.
+    version = await get_cart_version(db, cart_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    etag = version_etag(version)
+    if etag_matches(request, etag):
+        return not_modified(etag, CART_CACHE_CONTROL)
+    set_cache_headers(response, etag, CART_CACHE_CONTROL)
+    if settings.fast_serialization:
+        cart_data = await get_cart_data(db, cart_id)
+        if cart_data is None:
+            raise HTTPException(status_code=404, detail="Cart not found")
+        return fast_json_response(cart_data, response)
+    db_cart = await get_cart(db, cart_id=cart_id)
     if db_cart is None:
         raise HTTPException(status_code=404, detail="Cart not found")
     return db_cart
 
 
 @router.post("/", response_model=Cart)
-def create_cart(request: Request, user_id: Optional[str] = None, session_id: Optional[str] = None, db: Session = Depends(get_db)):
+async def create_cart(request: Request, user_id: Optional[str] = None, session_id: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     # Log incoming session and provided identifiers for debugging (harmless)
     try:
         sess_snapshot = dict(request.session) if hasattr(request, 'session') else {}
@@ -39,43 +56,21 @@ def create_cart(request: Request, user_id: Optional[str] = None, session_id: Opt
         sess_snapshot = "<unavailable>"
     logger.debug(f"[create_cart] incoming session: {sess_snapshot}, provided user_id={user_id}, session_id={session_id}")
 
-    # If frontend provided a user_id, try to resolve it (it may be a username)
+    # If frontend provided a user_id, resolve it as a username (what clients send); it is never
+    # also tried as an internal id, so a username like "B0001" cannot reach another user's cart
     if user_id:
-        resolved_user = get_user(db, user_id)
-        if not resolved_user:
-            # try resolving by username or email
-            resolved_user = get_user_by_username_or_email(db, user_id)
-        if resolved_user:
-            user_id = resolved_user.id
-        else:
-            # If the provided user_id doesn't map to a real user, drop it so we fall back to session behavior
-            user_id = None
+        resolved_user = await resolve_identity(db, user_id)
+        # If the provided user_id doesn't map to a real user, drop it so we fall back to session behavior
+        user_id = resolved_user.id if resolved_user else None
 
     # If frontend did not provide user_id/session_id, try to use server session
     if not user_id and not session_id:
-        # If user is logged in, use their username/id stored in session
-        sess_user = None
-        try:
-            sess_user = request.session.get('username')
-        except Exception:
-            sess_user = None
+        # If user is logged in, use their user id (the session stores the username)
+        sess_user = request.session.get('username') if 'session' in request.scope else None
         if sess_user:
-            # The session may store either the internal user ID (e.g. 'B0001') or the username.
-            # Try to resolve to the internal user id before using it as a foreign key.
-            resolved_user = None
-            try:
-                # Try treat sess_user as an id first
-                resolved_user = get_user(db, sess_user)
-            except Exception:
-                resolved_user = None
-            if not resolved_user:
-                # Try lookup by username or email
-                resolved_user = get_user_by_username_or_email(db, sess_user)
-            if resolved_user:
-                user_id = resolved_user.id
-            else:
-                # Could not resolve the session user to a DB user; fall back to guest session behavior
-                user_id = None
+            resolved_user = await get_session_identity(request, db)
+            # Could not resolve the session user to a DB user; fall back to guest session behavior
+            user_id = resolved_user.id if resolved_user else None
         else:
             # ensure there is a session_id in the server session
             try:
@@ -91,19 +86,30 @@ def create_cart(request: Request, user_id: Optional[str] = None, session_id: Opt
 
     if not user_id and not session_id:
         raise HTTPException(status_code=400, detail="Either user_id or session_id must be provided")
-    cart = get_or_create_cart(db, user_id=user_id, session_id=session_id)
+    cart = await get_or_create_cart(db, user_id=user_id, session_id=session_id)
     if cart is None:
         raise HTTPException(status_code=500, detail="Failed to create or retrieve cart")
     return cart
 
 
-def get_current_user_dep(request: Request, db: Session = Depends(get_db)):
+async def get_current_user_dep(request: Request, db: AsyncSession = Depends(get_async_db)):
     # Extract token from Authorization header
     auth_header = request.headers.get("authorization")
     token = None
     if auth_header and auth_header.lower().startswith("bearer "):
         token = auth_header[7:]
-    return get_current_user(request, db, token=token)
+    return await get_current_user(request, db, token=token)
+
+
+async def ensure_cart_access(request: Request, db: AsyncSession, current_user: Identity, cart_ids) -> None:
+    # Admins (ADMIN_USERNAMES) may clear any cart; everyone else only their own carts and the
+    # guest cart of the session they are browsing with
+    if is_admin(current_user):
+        return
+    session_id = request.session.get('session_id') if 'session' in request.scope else None
+    owned = await get_owned_cart_ids(db, cart_ids, current_user.id, session_id)
+    if set(owned) != set(cart_ids):
+        raise HTTPException(status_code=403, detail="Not allowed to clear these carts")
 
 
 @router.post("/{cart_id}/items", response_model=Cart)
@@ -111,60 +117,96 @@ async def add_item_to_cart_endpoint(
     request: Request,
     cart_id: int,
     cart_item: CartItemCreate,  # <-- must come before Depends!
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_dep),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_user_dep),
 ):
-    import logging
-    logging.warning(f"[CART ENDPOINT] Session content: {dict(request.session) if hasattr(request, 'session') else 'No session'}")
-    logging.warning(f"[CART ENDPOINT] Current user: {getattr(current_user, 'username', None)}")
-    cart = get_cart(db, cart_id=cart_id)
+    logger.debug(f"[add_item_to_cart] current user: {current_user.username}")
+    cart = await get_cart(db, cart_id=cart_id)
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
     error = await add_item_to_cart(db, cart_id=cart_id, item_id=cart_item.item_id, quantity=cart_item.quantity)
     if error:
         raise HTTPException(status_code=400, detail=error)
-    return get_cart(db, cart_id=cart_id)
+    return await get_cart(db, cart_id=cart_id)
+
+
+@router.post("/clear")
+async def clear_carts_endpoint(
+    request: Request,
+    payload: CartClear,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_user_dep),
+):
+    # Bulk cleanup: empty every listed cart and return their stock in one transaction
+    await ensure_cart_access(request, db, current_user, payload.cart_ids)
+    removed = await clear_carts(db, payload.cart_ids)
+    return {"message": "Carts cleared successfully", "removed_lines": removed}
+
+
+@router.post("/{cart_id}/items:batch", response_model=Cart)
+async def batch_cart_items_endpoint(
+    cart_id: int,
+    batch: CartBatch,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_user_dep),
+):
+    # Apply many set/add/remove operations atomically (e.g. a guest cart merge) and return the cart once
+    error = await apply_cart_operations(db, cart_id=cart_id, operations=batch.operations)
+    if error == "Cart not found":
+        raise HTTPException(status_code=404, detail=error)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    return await get_cart(db, cart_id=cart_id)
 
 
 @router.delete("/{cart_id}/items/{item_id}")
-def remove_item_from_cart_endpoint(
+async def remove_item_from_cart_endpoint(
     request: Request,
     cart_id: int,
     item_id: int,
     quantity: int = Query(..., description="Quantity to remove."),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_dep),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_user_dep),
 ):
-    cart = get_cart(db, cart_id=cart_id)
+    cart = await get_cart(db, cart_id=cart_id)
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
-    error = remove_item_from_cart(db, cart_id=cart_id, item_id=item_id, quantity=quantity)
+    error = await remove_item_from_cart(db, cart_id=cart_id, item_id=item_id, quantity=quantity)
     if error == "Item(s) removed from cart successfully":
-        return get_cart(db, cart_id=cart_id)
+        return await get_cart(db, cart_id=cart_id)
     elif error:
         raise HTTPException(status_code=400, detail=error)
-    return get_cart(db, cart_id=cart_id)
+    return await get_cart(db, cart_id=cart_id)
 
 
 @router.delete("/{cart_id}/items")
-def remove_all_items_from_cart_endpoint(cart_id: int, db: Session = Depends(get_db)):
-    message = remove_all_items_from_cart(db, cart_id=cart_id)
+async def remove_all_items_from_cart_endpoint(
+    request: Request,
+    cart_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_user_dep),
+):
+    cart = await get_cart(db, cart_id=cart_id)
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    await ensure_cart_access(request, db, current_user, [cart_id])
+    message = await remove_all_items_from_cart(db, cart_id=cart_id)
     return {"message": message}
 
 
 @router.put("/{cart_id}/items/{item_id}")
-def update_cart_item_quantity_endpoint(
+async def update_cart_item_quantity_endpoint(
     request: Request,
     cart_id: int,
     item_id: int,
     quantity: int = Query(..., description="New quantity for the item."),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_dep),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_user_dep),
 ):
-    cart = get_cart(db, cart_id=cart_id)
+    cart = await get_cart(db, cart_id=cart_id)
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
-    error = update_cart_item_quantity(db, cart_id=cart_id, item_id=item_id, quantity=quantity)
+    error = await update_cart_item_quantity(db, cart_id=cart_id, item_id=item_id, quantity=quantity)
     if error:
         raise HTTPException(status_code=400, detail=error)
-    return get_cart(db, cart_id=cart_id)
+    return await get_cart(db, cart_id=cart_id)
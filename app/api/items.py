@@ -1,45 +1,101 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from app.db.db import get_db
-from app.schemas.item import Item, ItemCreate, ItemUpdate
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.core.config import settings
+from app.db.db import get_async_db
+from app.schemas.item import Item, ItemCreate, ItemUpdate, ItemFacets
+from app.utils.fast_json import ITEM_LIST_ADAPTER, fast_json_response
+from app.utils.http_cache import CATALOG_CACHE_CONTROL, content_etag, etag_matches, not_modified, set_cache_headers
+from app.utils.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 from app.services.shop_services import (
-    get_item, get_items, create_item, update_item, delete_item
+    get_item, get_items, create_item, update_item, delete_item, search_items, get_item_facets
 )
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[Item])
-def read_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    items = get_items(db, skip=skip, limit=limit)
+async def read_items(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    tag: Optional[List[str]] = Query(None, description="Only items having all of these tags (repeatable)."),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # `cursor` (from the X-Next-Cursor header of the previous page) enables keyset pagination
+    after_id = None
+    if cursor:
+        try:
+            after_id = decode_cursor(cursor)["id"]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    items = await get_items(db, skip=skip, limit=limit, after_id=after_id, tags=tag)
+    # The page is usually a catalog cache hit; its serialized form is both the ETag input and the body
+    body = ITEM_LIST_ADAPTER.dump_json(items)
+    etag = content_etag(body)
+    if etag_matches(request, etag):
+        return not_modified(etag, CATALOG_CACHE_CONTROL)
+    if limit and len(items) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor({"id": items[-1].id})
+    set_cache_headers(response, etag, CATALOG_CACHE_CONTROL)
+    # Always send the hashed bytes, so the strong ETag matches the body in both serialization modes
+    return fast_json_response(body, response)
+
+
+@router.get("/facets", response_model=ItemFacets)
+async def read_item_facets(
+    tag: Optional[List[str]] = Query(None, description="Current tag filter (repeatable)."),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await get_item_facets(db, tags=tag)
+
+
+@router.get("/search", response_model=List[Item])
+async def search_catalog(
+    response: Response,
+    q: str = Query(..., min_length=1, description="Words to look for in name, description and tags."),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Ranked by relevance; every word must match and the last one may be a prefix
+    items = await search_items(db, q, limit=limit, offset=offset)
+    if settings.fast_serialization:
+        return fast_json_response(ITEM_LIST_ADAPTER.dump_json(items), response)
     return items
 
 
 @router.get("/{item_id}", response_model=Item)
-def read_item(item_id: int, db: Session = Depends(get_db)):
-    db_item = get_item(db, item_id=item_id)
+async def read_item(item_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    db_item = await get_item(db, item_id=item_id)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    return db_item
+    body = db_item.model_dump_json().encode()
+    etag = content_etag(body)
+    if etag_matches(request, etag):
+        return not_modified(etag, CATALOG_CACHE_CONTROL)
+    set_cache_headers(response, etag, CATALOG_CACHE_CONTROL)
+    return fast_json_response(body, response)
 
 
 @router.post("/", response_model=Item)
-def create_new_item(item: ItemCreate, db: Session = Depends(get_db)):
-    return create_item(db=db, item=item)
+async def create_new_item(item: ItemCreate, db: AsyncSession = Depends(get_async_db)):
+    return await create_item(db=db, item=item)
 
 
 @router.put("/{item_id}", response_model=Item)
-def update_existing_item(item_id: int, item: ItemUpdate, db: Session = Depends(get_db)):
-    db_item = update_item(db, item_id=item_id, item_update=item)
+async def update_existing_item(item_id: int, item: ItemUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_item = await update_item(db, item_id=item_id, item_update=item)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
     return db_item
 
 
 @router.delete("/{item_id}")
-def delete_existing_item(item_id: int, db: Session = Depends(get_db)):
-    success = delete_item(db, item_id=item_id)
+async def delete_existing_item(item_id: int, db: AsyncSession = Depends(get_async_db)):
+    success = await delete_item(db, item_id=item_id)
     if not success:
         raise HTTPException(status_code=404, detail="Item not found")
     return {"message": "Item deleted successfully"}
@@ -1,27 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from typing import List
-from app.db.db import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.core.config import settings
+from app.db.db import get_async_db
 from app.schemas.order import Order as OrderSchema
-from app.services.shop_services import create_order_from_cart, get_orders_for_user, get_order_for_user
+from app.services.shop_services import (
+    create_order_from_cart, get_orders_for_user, get_orders_data_for_user, get_order_for_user,
+)
 from app.api.carts import get_current_user_dep
-from app.models.user import User
+from app.services.identity import Identity
+from app.utils.fast_json import fast_json_response
+from app.utils.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 
 router = APIRouter()
 
 @router.get('/my', response_model=List[OrderSchema])
-def list_my_orders(db: Session = Depends(get_db), current_user: User = Depends(get_current_user_dep)):
-    return get_orders_for_user(db, current_user.id)
+async def list_my_orders(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_user_dep),
+):
+    # Without limit/cursor all orders are returned (previous behavior)
+    before_id = None
+    if cursor:
+        try:
+            before_id = decode_cursor(cursor)["id"]
+        except ValueError:
+            raise HTTPException(status_code=400, detail='Invalid cursor')
+    if settings.fast_serialization:
+        orders = await get_orders_data_for_user(db, current_user.id, limit=limit, before_id=before_id)
+        if limit and len(orders) == limit:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor({"id": orders[-1]["id"]})
+        return fast_json_response(orders, response)
+    orders = await get_orders_for_user(db, current_user.id, limit=limit, before_id=before_id)
+    if limit and len(orders) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor({"id": orders[-1].id})
+    return orders
 
 @router.get('/{order_id}', response_model=OrderSchema)
-def get_order(order_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user_dep)):
-    order = get_order_for_user(db, current_user.id, order_id)
+async def get_order(order_id: int, db: AsyncSession = Depends(get_async_db), current_user: Identity = Depends(get_current_user_dep)):
+    order = await get_order_for_user(db, current_user.id, order_id)
     if not order:
         raise HTTPException(status_code=404, detail='Order not found')
     return order
 
 @router.post('/checkout', response_model=OrderSchema)
-async def checkout_order(request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_user_dep)):
+async def checkout_order(request: Request, db: AsyncSession = Depends(get_async_db), current_user: Identity = Depends(get_current_user_dep)):
     order, error = await create_order_from_cart(db, current_user.id)
     if error:
         raise HTTPException(status_code=400, detail=error)
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from app.db.db import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+import math
+from app.core.config import settings
+from app.db.db import get_async_db
 from app.schemas.user import User, UserCreate
-from app.services.shop_services import get_user, get_user_by_email, create_user, get_user_by_username_or_email
-from app.core.security import verify_password, create_access_token
+from app.services.shop_services import get_user, get_user_by_email, create_user, authenticate_user
+from app.core.security import PasswordHashingBusy, create_access_token
+from app.utils.rate_limit import TokenBucketLimiter
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi import status
 
@@ -13,6 +16,19 @@ router = APIRouter()
 
 templates = Jinja2Templates(directory="templates")
 
+# Login attempts are limited per client IP and per account before any password hashing
+login_ip_limiter = TokenBucketLimiter(settings.login_rate_ip_per_minute)
+login_account_limiter = TokenBucketLimiter(settings.login_rate_account_per_minute)
+
+BUSY_MESSAGE = "The server is busy, please try again in a moment."
+
+
+def login_retry_after(request: Request, identifier: str) -> int:
+    # Seconds until another login attempt is allowed (0: go ahead)
+    client = request.client.host if request.client else "unknown"
+    wait = max(login_ip_limiter.acquire(client), login_account_limiter.acquire(identifier.strip().lower()))
+    return math.ceil(wait)
+
 
 @router.get("/login", response_class=HTMLResponse)
 def login_form(request: Request):
@@ -20,14 +36,21 @@ def login_form(request: Request):
 
 
 @router.post("/login")
-def login(request: Request, db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(request: Request, db: AsyncSession = Depends(get_async_db), form_data: OAuth2PasswordRequestForm = Depends()):
     import logging
-    user = get_user_by_username_or_email(db, identifier=form_data.username)
+    retry_after = login_retry_after(request, form_data.username)
+    if retry_after:
+        logging.warning(f"Login rate limited for {form_data.username}")
+        error = f"Too many login attempts. Please try again in {retry_after} seconds."
+        return templates.TemplateResponse(request, "login.html", {"error": error}, status_code=429,
+                                          headers={"Retry-After": str(retry_after)})
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except PasswordHashingBusy:
+        return templates.TemplateResponse(request, "login.html", {"error": BUSY_MESSAGE}, status_code=503,
+                                          headers={"Retry-After": "1"})
     if not user:
-        logging.warning(f"Login failed: user not found for {form_data.username}")
-        return templates.TemplateResponse(request, "login.html", {"error": "Invalid credentials"})
-    if not verify_password(form_data.password, user.hashed_password):
-        logging.warning(f"Login failed: invalid password for {form_data.username}")
+        logging.warning(f"Login failed for {form_data.username}")
         return templates.TemplateResponse(request, "login.html", {"error": "Invalid credentials"})
     # Set username in session
     request.session['username'] = user.username
@@ -44,7 +67,7 @@ def register_form(request: Request):
 import unicodedata
 
 @router.post("/register", response_class=HTMLResponse)
-def register(request: Request, db: Session = Depends(get_db), username: str = Form(...), email: str = Form(...), password: str = Form(...)):
+async def register(request: Request, db: AsyncSession = Depends(get_async_db), username: str = Form(...), email: str = Form(...), password: str = Form(...)):
     # Normalize and strip whitespace from password to avoid extra bytes
     password = unicodedata.normalize('NFC', password.strip())
     # Check password length for bcrypt limitation (72 bytes)
@@ -52,46 +75,60 @@ def register(request: Request, db: Session = Depends(get_db), username: str = Fo
         error_msg = "Password cannot be longer than 72 bytes. Please choose a shorter password."
         return templates.TemplateResponse(request, "register.html", {"error": error_msg})
     # Check if user already exists
-    db_user = get_user_by_email(db, email=email)
+    db_user = await get_user_by_email(db, email=email)
     if db_user:
         return templates.TemplateResponse(request, "register.html", {"error": "Email already registered"})
     # Create user
     user_create = UserCreate(username=username, email=email, password=password)
-    create_user(db=db, user=user_create)
+    try:
+        await create_user(db=db, user=user_create)
+    except PasswordHashingBusy:
+        return templates.TemplateResponse(request, "register.html", {"error": BUSY_MESSAGE}, status_code=503,
+                                          headers={"Retry-After": "1"})
     # Redirect to login page after successful registration
     response = RedirectResponse(url="/login", status_code=303)
     return response
 
 
 @router.get("/{user_id}", response_model=User)
-def read_user(user_id: str, db: Session = Depends(get_db)):
-    db_user = get_user(db, user_id=user_id)
+async def read_user(user_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_user = await get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 
 @router.get("/email/{email}", response_model=User)
-def read_user_by_email(email: str, db: Session = Depends(get_db)):
-    db_user = get_user_by_email(db, email=email)
+async def read_user_by_email(email: str, db: AsyncSession = Depends(get_async_db)):
+    db_user = await get_user_by_email(db, email=email)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 
 @router.post("/", response_model=User)
-def create_new_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_new_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exists  
-    db_user = get_user_by_email(db, email=user.email)
+    db_user = await get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return create_user(db=db, user=user)
+    try:
+        return await create_user(db=db, user=user)
+    except PasswordHashingBusy:
+        raise HTTPException(status_code=503, detail=BUSY_MESSAGE, headers={"Retry-After": "1"})
 
 
 @router.post("/token")
-def api_login_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    user = get_user_by_username_or_email(db, identifier=form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def api_login_token(request: Request, db: AsyncSession = Depends(get_async_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    retry_after = login_retry_after(request, form_data.username)
+    if retry_after:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many login attempts",
+                            headers={"Retry-After": str(retry_after)})
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except PasswordHashingBusy:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=BUSY_MESSAGE, headers={"Retry-After": "1"})
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -7,6 +7,83 @@ class Settings(BaseSettings):
     # Database
     database_url: str = Field(default="sqlite:///./test.db", alias="DATABASE_URL")
 
+    # Connection pool (applies to both the sync and the async engine)
+    db_pool_size: int = Field(default=5, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, alias="DB_MAX_OVERFLOW")
+    db_pool_timeout: float = Field(default=30.0, alias="DB_POOL_TIMEOUT")
+    db_pool_recycle: int = Field(default=1800, alias="DB_POOL_RECYCLE")
+    db_pool_pre_ping: bool = Field(default=True, alias="DB_POOL_PRE_PING")
+
+    # SQLite tuning (ignored on other databases)
+    sqlite_journal_mode: str = Field(default="WAL", alias="SQLITE_JOURNAL_MODE")
+    sqlite_synchronous: str = Field(default="NORMAL", alias="SQLITE_SYNCHRONOUS")
+    sqlite_busy_timeout_ms: int = Field(default=5000, alias="SQLITE_BUSY_TIMEOUT_MS")
+    sqlite_mmap_size: int = Field(default=268435456, alias="SQLITE_MMAP_SIZE")
+
+    # In-process catalog cache (set the TTL to 0 to disable)
+    catalog_cache_ttl_seconds: float = Field(default=60.0, alias="CATALOG_CACHE_TTL_SECONDS")
+    catalog_cache_max_items: int = Field(default=10000, alias="CATALOG_CACHE_MAX_ITEMS")
+
+    # Item search index: auto (FTS5 on SQLite, tsvector/GIN on Postgres), fts5, postgres or memory
+    search_backend: str = Field(default="auto", alias="SEARCH_BACKEND")
+
+    # Cart reservations: a cart line holds its quantity until the hold expires; the sweeper
+    # releases expired holds in batches (set the interval to 0 to disable it)
+    cart_reservation_ttl_seconds: int = Field(default=900, alias="CART_RESERVATION_TTL_SECONDS")
+    reservation_sweep_interval_seconds: float = Field(default=30.0, alias="RESERVATION_SWEEP_INTERVAL_SECONDS")
+    reservation_sweep_batch_size: int = Field(default=500, alias="RESERVATION_SWEEP_BATCH_SIZE")
+
+    # WebSocket fan-out: per-connection send queue and what to do when a client falls behind
+    # (drop_oldest, drop_newest or disconnect)
+    ws_send_queue_size: int = Field(default=100, alias="WS_SEND_QUEUE_SIZE")
+    ws_slow_client_policy: str = Field(default="drop_oldest", alias="WS_SLOW_CLIENT_POLICY")
+    # Most item ids one client may watch with {"subscribe": [...]}
+    ws_max_subscriptions: int = Field(default=1000, alias="WS_MAX_SUBSCRIPTIONS")
+    # Stock changes are coalesced per item and sent as one stock_batch message per window (0: send at once)
+    stock_update_coalesce_seconds: float = Field(default=0.1, alias="STOCK_UPDATE_COALESCE_SECONDS")
+    # Cross-worker stock/catalog events: memory (single process), table (poll bus_events) or postgres (LISTEN/NOTIFY)
+    event_bus_backend: str = Field(default="memory", alias="EVENT_BUS_BACKEND")
+    event_bus_poll_seconds: float = Field(default=0.5, alias="EVENT_BUS_POLL_SECONDS")
+    event_bus_retention_seconds: float = Field(default=60.0, alias="EVENT_BUS_RETENTION_SECONDS")
+
+    # Response compression: gzip (and brotli when installed) above this many bytes; 0 disables it
+    compression_minimum_size: int = Field(default=1000, alias="COMPRESSION_MINIMUM_SIZE")
+    gzip_compresslevel: int = Field(default=6, alias="GZIP_COMPRESSLEVEL")
+    brotli_quality: int = Field(default=5, alias="BROTLI_QUALITY")
+
+    # Serialize item lists, carts and orders without response_model re-validation (orjson / prebuilt TypeAdapters)
+    fast_serialization: bool = Field(default=False, alias="FAST_SERIALIZATION")
+
+    # Identity cache: username or user id -> user (id, username, email) and JWT -> claims, shared by all requests of a worker (0: off)
+    identity_cache_ttl_seconds: float = Field(default=60.0, alias="IDENTITY_CACHE_TTL_SECONDS")
+    identity_cache_max_entries: int = Field(default=10000, alias="IDENTITY_CACHE_MAX_ENTRIES")
+    # Customer ids reserved per worker from the id_counters table at a time (unused ones are skipped on restart)
+    user_id_block_size: int = Field(default=20, alias="USER_ID_BLOCK_SIZE")
+
+    # Password hashing (scrypt): N = 2**SCRYPT_ROUNDS; stored hashes with other parameters are rehashed on login
+    scrypt_rounds: int = Field(default=16, alias="SCRYPT_ROUNDS")
+    scrypt_block_size: int = Field(default=8, alias="SCRYPT_BLOCK_SIZE")
+    scrypt_parallelism: int = Field(default=1, alias="SCRYPT_PARALLELISM")
+    # Dedicated hashing threads, so login bursts cannot take Starlette's shared threadpool
+    password_hash_workers: int = Field(default=2, alias="PASSWORD_HASH_WORKERS")
+    password_hash_queue_size: int = Field(default=32, alias="PASSWORD_HASH_QUEUE_SIZE")  # waiting jobs beyond this are refused
+    password_hash_timeout_seconds: float = Field(default=10.0, alias="PASSWORD_HASH_TIMEOUT_SECONDS")  # queueing included
+    # Login attempts (token buckets, burst = the per-minute rate); 0 disables a limit
+    login_rate_ip_per_minute: float = Field(default=30.0, alias="LOGIN_RATE_IP_PER_MINUTE")
+    login_rate_account_per_minute: float = Field(default=10.0, alias="LOGIN_RATE_ACCOUNT_PER_MINUTE")
+
+    # Comma-separated usernames allowed to run admin operations (e.g. clearing any carts)
+    admin_usernames: str = Field(default="", alias="ADMIN_USERNAMES")
+
+    # Prometheus text metrics at /metrics (per worker process)
+    metrics_enabled: bool = Field(default=True, alias="METRICS_ENABLED")
+
+    # Server-side sessions: memory (per process) or table (sessions table, shared by workers)
+    session_backend: str = Field(default="memory", alias="SESSION_BACKEND")
+    session_ttl_seconds: int = Field(default=14 * 24 * 60 * 60, alias="SESSION_TTL_SECONDS")  # idle expiry
+    session_touch_seconds: float = Field(default=300.0, alias="SESSION_TOUCH_SECONDS")  # unchanged sessions are rewritten at most this often
+    session_max_entries: int = Field(default=100000, alias="SESSION_MAX_ENTRIES")  # memory backend
+
     # Application
     secret_key: str = Field(alias="SECRET_KEY")
     jwt_secret_key: str = Field(default="test-secret-key-for-development", alias="JWT_SECRET_KEY")
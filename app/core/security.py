@@ -1,16 +1,105 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, UTC
 from jose import JWTError, jwt
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["scrypt"], deprecated="auto")
+logger = logging.getLogger("app.core.security")
+
+# Cost parameters come from Settings; min == max rounds makes needs_update() flag hashes made
+# with any other cost (raised or lowered), so they are upgraded on the next successful login
+pwd_context = CryptContext(
+    schemes=["scrypt"],
+    deprecated="auto",
+    scrypt__default_rounds=settings.scrypt_rounds,
+    scrypt__min_rounds=settings.scrypt_rounds,
+    scrypt__max_rounds=settings.scrypt_rounds,
+    scrypt__block_size=settings.scrypt_block_size,
+    scrypt__parallelism=settings.scrypt_parallelism,
+)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    # (matches, new hash when the stored one uses outdated parameters)
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+
+class PasswordHashingBusy(Exception):
+    # The hashing queue is full, or the job did not finish within the timeout
+    pass
+
+
+class PasswordHasher:
+    """Runs password hashing on its own bounded thread pool.
+
+    At most workers + queue_size jobs are accepted at a time; more are refused at once
+    with PasswordHashingBusy, and so are jobs that do not finish (queueing included)
+    within timeout_seconds. Other sync endpoints keep Starlette's threadpool to themselves.
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout_seconds: float):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout_seconds = timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _done(self, _future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise PasswordHashingBusy()
+            self.pending += 1
+        future = self._executor.submit(fn, *args)
+        # Released when the job ends or is cancelled, not when the caller stops waiting
+        future.add_done_callback(self._done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            # wait_for cancels the job if it is still queued; a running one finishes in the background
+            with self._lock:
+                self.timeouts += 1
+            logger.warning(f"Password hashing timed out after {self.timeout_seconds}s")
+            raise PasswordHashingBusy()
+
+    async def hash(self, password: str) -> str:
+        return await self.run(get_password_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self.run(verify_and_update_password, password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    queue_size=settings.password_hash_queue_size,
+    timeout_seconds=settings.password_hash_timeout_seconds,
+)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
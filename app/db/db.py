@@ -1,14 +1,120 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.core.config import settings
+from app.utils.metrics import count_query, timed_pool_class
+
+
+def get_async_database_url(database_url: str) -> str:
+    # Map the configured (sync) URL onto an async driver:
+    # sqlite -> aiosqlite, postgres -> asyncpg. Explicit drivers are kept as-is.
+    if database_url.startswith("sqlite+") or "+asyncpg" in database_url:
+        return database_url
+    if database_url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + database_url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if database_url.startswith(prefix):
+            return "postgresql+asyncpg://" + database_url[len(prefix):]
+    return database_url
+
+
+def is_sqlite_url(database_url: str) -> bool:
+    return database_url.startswith("sqlite")
+
+
+def get_engine_options(database_url: str) -> dict:
+    # In-memory SQLite uses a single shared connection; pool sizing does not apply there.
+    if is_sqlite_url(database_url) and make_url(database_url).database in (None, "", ":memory:"):
+        return {}
+    return dict(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside a writer; busy_timeout makes writers wait instead of
+    # failing with "database is locked"; synchronous=NORMAL is safe in WAL mode.
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(database_url: str):
+    options = get_engine_options(database_url)
+    if options:
+        # Same QueuePool as the default, timing checkouts for /metrics
+        options["poolclass"] = timed_pool_class(QueuePool, "sync")
+    db_engine = create_engine(database_url, **options)
+    if is_sqlite_url(database_url):
+        event.listen(db_engine, "connect", apply_sqlite_pragmas)
+    event.listen(db_engine, "before_cursor_execute", count_query)
+    return db_engine
+
+
+def create_async_db_engine(database_url: str):
+    async_url = get_async_database_url(database_url)
+    options = get_engine_options(async_url)
+    if options:
+        options["poolclass"] = timed_pool_class(AsyncAdaptedQueuePool, "async")
+    db_engine = create_async_engine(async_url, **options)
+    if is_sqlite_url(async_url):
+        # Pool events are registered on the sync facade of the async engine
+        event.listen(db_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    event.listen(db_engine.sync_engine, "before_cursor_execute", count_query)
+    return db_engine
+
+
+def dialect_insert(db, entity):
+    # INSERT construct with ON CONFLICT support for the session's database (SQLite or Postgres)
+    dialect_name = db.bind.dialect.name
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect_name}")
+    return insert(entity)
+
+
+def get_pool_stats() -> dict:
+    # Live pool usage for both engines, used to size DB_POOL_SIZE / DB_MAX_OVERFLOW
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        entry = {"pool_class": type(pool).__name__, "status": pool.status()}
+        if hasattr(pool, "checkedout"):
+            entry.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        stats[name] = entry
+    return stats
+
 
 # Create SQLAlchemy engine
-engine = create_engine(settings.database_url)
+engine = create_db_engine(settings.database_url)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine/session used by the request handlers so DB I/O never blocks the event loop.
+# expire_on_commit=False keeps loaded attributes usable after commit (no implicit lazy IO).
+async_engine = create_async_db_engine(settings.database_url)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 # Create Base class
 Base = declarative_base()
 
@@ -20,3 +126,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
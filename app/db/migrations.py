@@ -0,0 +1,134 @@
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger("app.db.migrations")
+
+# Data/schema migrations that Base.metadata.create_all cannot express (it only creates
+# missing tables). Each one runs once per database, recorded in schema_migrations, and
+# must be idempotent because several workers may start at the same time.
+MIGRATIONS = []
+
+
+def migration(name: str):
+    def register(fn):
+        MIGRATIONS.append((name, fn))
+        return fn
+    return register
+
+
+def split_tag_names(tags) -> list:
+    # Normalize a comma-separated string (or list) of tags: trimmed, lower-case, de-duplicated
+    if not tags:
+        return []
+    values = tags.split(",") if isinstance(tags, str) else tags
+    names = []
+    for value in values:
+        name = str(value).strip().lower()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def next_id_number(ids, prefix: str) -> int:
+    # First free number after the highest "<prefix><digits>" id (B0007 -> 8)
+    numbers = [int(value[len(prefix):]) for value in ids if value and value[len(prefix):].isdigit()]
+    return max(numbers, default=0) + 1
+
+
+def backfill_item_tags(conn) -> None:
+    # Rebuild tags/item_tags from the denormalized items.tags column
+    rows = conn.execute(text("SELECT id, tags FROM items WHERE tags IS NOT NULL AND tags <> ''")).all()
+    tag_ids = {name: tag_id for tag_id, name in conn.execute(text("SELECT id, name FROM tags"))}
+    links = []
+    for item_id, tags in rows:
+        for name in split_tag_names(tags):
+            if name not in tag_ids:
+                conn.execute(text("INSERT INTO tags (name) VALUES (:name)"), {"name": name})
+                tag_ids[name] = conn.execute(text("SELECT id FROM tags WHERE name = :name"), {"name": name}).scalar_one()
+            links.append({"item_id": item_id, "tag_id": tag_ids[name]})
+    conn.execute(text("DELETE FROM item_tags"))
+    if links:
+        conn.execute(text("INSERT INTO item_tags (item_id, tag_id) VALUES (:item_id, :tag_id)"), links)
+
+
+@migration("0001_normalize_item_tags")
+def _normalize_item_tags(conn):
+    backfill_item_tags(conn)
+
+
+@migration("0002_unique_cart_item_lines")
+def _unique_cart_item_lines(conn):
+    # Merge duplicate (cart_id, item_id) lines into the oldest one before adding the unique index
+    duplicates = conn.execute(text(
+        "SELECT cart_id, item_id, MIN(id), SUM(quantity) FROM cart_items "
+        "GROUP BY cart_id, item_id HAVING COUNT(*) > 1"
+    )).all()
+    for cart_id, item_id, keep_id, quantity in duplicates:
+        conn.execute(text("UPDATE cart_items SET quantity = :quantity WHERE id = :id"), {"quantity": quantity, "id": keep_id})
+        conn.execute(
+            text("DELETE FROM cart_items WHERE cart_id = :cart_id AND item_id = :item_id AND id <> :id"),
+            {"cart_id": cart_id, "item_id": item_id, "id": keep_id},
+        )
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_cart_items_cart_id_item_id ON cart_items (cart_id, item_id)"
+    ))
+
+
+@migration("0003_cart_item_reservations")
+def _cart_item_reservations(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("cart_items")}
+    if "reserved_until" not in columns:
+        column_type = "TIMESTAMP WITH TIME ZONE" if conn.dialect.name == "postgresql" else "TIMESTAMP"
+        conn.execute(text(f"ALTER TABLE cart_items ADD COLUMN reserved_until {column_type}"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_cart_items_item_id_reserved_until ON cart_items (item_id, reserved_until)"
+    ))
+    # Lines added before reservations existed took their stock for good: give it back (they hold nothing)
+    conn.execute(text(
+        "UPDATE items SET stock = stock + ("
+        "SELECT COALESCE(SUM(quantity), 0) FROM cart_items "
+        "WHERE cart_items.item_id = items.id AND cart_items.reserved_until IS NULL) "
+        "WHERE id IN (SELECT item_id FROM cart_items WHERE reserved_until IS NULL)"
+    ))
+
+
+@migration("0004_cart_revision")
+def _cart_revision(conn):
+    # Bumped on every change to a cart's lines; part of the cart ETag
+    columns = {column["name"] for column in inspect(conn).get_columns("carts")}
+    if "revision" not in columns:
+        conn.execute(text("ALTER TABLE carts ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"))
+
+
+@migration("0005_user_id_counter")
+def _user_id_counter(conn):
+    # users.id was VARCHAR(5) (B0001..B9999); ids now come from the "users" row of id_counters.
+    # SQLite does not enforce VARCHAR lengths, so only Postgres needs the wider column.
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE users ALTER COLUMN id TYPE VARCHAR(32)"))
+    ids = conn.execute(text("SELECT id FROM users WHERE id LIKE 'B%'")).scalars().all()
+    conn.execute(
+        text("INSERT INTO id_counters (name, next_value) VALUES ('users', :next_value) ON CONFLICT (name) DO NOTHING"),
+        {"next_value": next_id_number(ids, "B")},
+    )
+
+
+def run_migrations(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (name VARCHAR PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+    for name, fn in MIGRATIONS:
+        if name in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                fn(conn)
+                conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+            logger.info(f"Applied migration {name}")
+        except IntegrityError:
+            # Another worker recorded it first
+            logger.info(f"Migration {name} already applied by another process")
@@ -1,24 +1,32 @@
 import os
-from datetime import datetime, UTC
 import logging
 
-from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from starlette.middleware.sessions import SessionMiddleware
-from starlette.types import ASGIApp, Receive, Scope, Send
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.websockets import WebSocketState
 
 from app.api import users, carts, items, orders
+from app.api.auth import get_session_identity
 from app.core.config import settings
-from app.db.db import engine, Base, SessionLocal
-from app.models.item import Item
-from app.services.shop_services import get_user, get_user_by_username_or_email, get_or_create_cart
-from app.utils.images import resolve_picture_path  # NEW import
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from app.core.security import password_hasher
+from app.db.db import engine, Base, AsyncSessionLocal, get_async_db, get_pool_stats
+from app.db.migrations import run_migrations
+from app.services.catalog_cache import catalog_cache
+from app.services.catalog_view import get_home_catalog
+from app.services.event_bus import event_bus
+from app.services.identity import identity_cache
+from app.services.reservations import reservation_sweeper
+from app.services.search import search_index
+from app.services.shop_services import get_or_create_cart
+from app.utils.compression import CompressionMiddleware, PrecompressedStaticFiles
+from app.utils.images import resolve_picture_path, image_manifest  # NEW import
+from app.utils.metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, metrics
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.utils.sessions import ServerSessionMiddleware, create_session_store
+from app.websocket_manager import manager
 
 # Keep the FastAPI instance available as `app` so tests can override dependencies.
 app = FastAPI(
@@ -31,41 +39,11 @@ app = FastAPI(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("app.main")
 
-SESSION_TIMEOUT_SECONDS = 3600  # 1 hour
-
-class AutoLogoutASGIMiddleware:
-    def __init__(self, app: ASGIApp):
-        self.app = app
-
-    async def __call__(self, scope: Scope, receive: Receive, send: Send):
-        if scope["type"] == "http":
-            async def send_wrapper(message):
-                await send(message)
-            async def receive_wrapper():
-                return await receive()
-            request = Request(scope, receive_wrapper)
-            try:
-                session = request.session
-                username = session.get("username")
-                now = datetime.now(UTC).timestamp()
-                last_activity = session.get("last_activity")
-                if username:
-                    if last_activity and now - last_activity > SESSION_TIMEOUT_SECONDS:
-                        session.clear()
-                        response = RedirectResponse(url="/", status_code=302)
-                        await response(scope, receive, send)
-                        return
-                    else:
-                        session["last_activity"] = now
-            except Exception:
-                pass
-        await self.app(scope, receive, send)
-
 # Add middlewares to the FastAPI instance (keeps app as FastAPI for tests)
 # Determine environment (production vs. development)
 DEBUG = os.environ.get("DEBUG", "False").lower() == "true"
 
-# Add SessionMiddleware with secure settings in production
+# Add the server-side session middleware with secure cookies in production
 # Allow overriding cookie SameSite via env var (COOKIE_SAMESITE), defaulting to 'lax'
 COOKIE_SAMESITE = os.environ.get("COOKIE_SAMESITE", "lax").lower()
 
@@ -74,12 +52,21 @@ def get_session_middleware_settings():
     # This keeps production behavior (https_only=True) unless DEBUG is True or INSECURE_SESSIONS is set.
     force_insecure = os.environ.get("INSECURE_SESSIONS", "0").lower() in ("1", "true", "yes")
     if DEBUG or force_insecure:
-        return dict(secret_key=settings.secret_key, same_site=COOKIE_SAMESITE, https_only=False)
+        return dict(same_site=COOKIE_SAMESITE, https_only=False)
     else:
         # Railway/production: secure cookies
-        return dict(secret_key=settings.secret_key, same_site=COOKIE_SAMESITE, https_only=True)
+        return dict(same_site=COOKIE_SAMESITE, https_only=True)
 
-app.add_middleware(SessionMiddleware, **get_session_middleware_settings())
+# The cookie only carries a session id; data is written back when it changed or every
+# SESSION_TOUCH_SECONDS (sliding the expiry), and /static, /health and /metrics skip sessions entirely
+app.add_middleware(
+    ServerSessionMiddleware,
+    store=create_session_store(settings.session_backend, settings.session_ttl_seconds, settings.session_max_entries),
+    max_age=settings.session_ttl_seconds,
+    touch_seconds=settings.session_touch_seconds,
+    skip_paths=("/static", "/health", "/metrics"),
+    **get_session_middleware_settings(),
+)
 
 # Configure CORS origins from environment variable ALLOWED_ORIGINS
 # - If ALLOWED_ORIGINS is provided (comma-separated), use that list (required when allow_credentials=True)
@@ -97,16 +84,67 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
+# Compress dynamic responses (JSON, rendered pages) above the size threshold
+if settings.compression_minimum_size > 0:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        compresslevel=settings.gzip_compresslevel,
+        brotli_quality=settings.brotli_quality,
+    )
+
+# Outermost: request latency includes every other middleware
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
+# Create missing tables and apply migrations before anything else touches the database
+# (at startup, not at import: importing the app, e.g. in tests, never writes to DATABASE_URL)
+@app.on_event("startup")
+def _prepare_database():
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
 # Log effective settings at startup (non-sensitive values only)
 @app.on_event("startup")
 def _log_startup():
     logger.info(f"Startup config: ALLOWED_ORIGINS={allowed_origins}, DEBUG={DEBUG}, INSECURE_SESSIONS={os.environ.get('INSECURE_SESSIONS','0')}, COOKIE_SAMESITE={COOKIE_SAMESITE}")
 
+# Index static/images/items once so picture lookups never probe the filesystem per request
+@app.on_event("startup")
+def _build_image_manifest():
+    image_manifest.refresh()
+
+# Create (or load) the item search index before the first query
+@app.on_event("startup")
+async def _prepare_search_index():
+    async with AsyncSessionLocal() as db:
+        await search_index.ensure_ready(db)
+
+# Release expired cart reservations in the background
+@app.on_event("startup")
+def _start_reservation_sweeper():
+    reservation_sweeper.start()
+
+@app.on_event("shutdown")
+async def _stop_reservation_sweeper():
+    await reservation_sweeper.stop()
+
+# Share stock/catalog changes with the other worker processes
+@app.on_event("startup")
+async def _start_event_bus():
+    await event_bus.start()
+
+@app.on_event("shutdown")
+async def _stop_event_bus():
+    await event_bus.stop()
+
 templates = Jinja2Templates(directory="templates")
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Serves the .br/.gz files written by scripts/precompress_static.py when the client accepts them
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(carts.router, prefix="/api/carts", tags=["carts"])
@@ -114,80 +152,63 @@ app.include_router(items.router, prefix="/api/items", tags=["items"])
 app.include_router(orders.router, prefix="/api/orders", tags=["orders"])
 
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request):
+async def home(request: Request, db: AsyncSession = Depends(get_async_db)):
     username = request.session.get("username")
-    db = SessionLocal()
-    items = db.query(Item).all()
-    # Convert items to dicts and split tags into lists
-    items_dicts = []
-    for item in items:
-        final_path = resolve_picture_path(item.picture_path, item.name)
-        item_dict = {
-            "id": item.id,
-            "name": item.name,
-            "description": item.description,
-            "price": item.price,
-            "stock": item.stock,
-            "picture_path": final_path,
-            "tags": item.tags.split(",") if item.tags else [],
-            "created_at": item.created_at.isoformat() if item.created_at else None,
-            "updated_at": item.updated_at.isoformat() if item.updated_at else None,
-        }
-        items_dicts.append(item_dict)
+    # The catalog part of the page is shared by all users and rebuilt only when items change
+    catalog = await get_home_catalog(db)
 
     # Resolve the logged-in user's email (if available) so the template can show it in the user menu
     email = None
     if username:
         try:
-            resolved_user = get_user_by_username_or_email(db, username)
+            resolved_user = await get_session_identity(request, db)
             if resolved_user:
                 email = resolved_user.email
         except Exception:
             email = None
 
-    db.close()
-    return templates.TemplateResponse(request, "home.html", {"username": username, "email": email, "items": items_dicts})
+    return templates.TemplateResponse(request, "home.html", {
+        "username": username,
+        "email": email,
+        "items": catalog.items,
+        "catalog_html": catalog.html,
+        "catalog_json": catalog.json,
+    })
 
 @app.get("/cart")
-async def cart(request: Request):
+async def cart(request: Request, db: AsyncSession = Depends(get_async_db)):
     username = request.session.get("username")
     items = []
-    db = SessionLocal()
 
-    try:
-        user_id = None
-        session_id = None
-        if username:
-            resolved_user = get_user(db, username)
-            if not resolved_user:
-                resolved_user = get_user_by_username_or_email(db, username)
-            if resolved_user:
-                user_id = resolved_user.id
-        if not user_id:
-            session_id = request.session.get('session_id')
-            if not session_id:
-                import uuid
-                session_id = uuid.uuid4().hex
-                request.session['session_id'] = session_id
-
-        cart = get_or_create_cart(db, user_id=user_id, session_id=session_id)
-        if cart:
-            for cart_item in cart.items:
-                item = cart_item.item
-                if not item:
-                    continue
-                final_path = resolve_picture_path(item.picture_path, item.name)
-                items.append({
-                    "id": item.id,
-                    "name": item.name,
-                    "description": item.description,
-                    "price": item.price,
-                    "quantity": cart_item.quantity,
-                    "picture_path": final_path,
-                    "tags": item.tags.split(",") if item.tags else [],
-                })
-    finally:
-        db.close()
+    user_id = None
+    session_id = None
+    if username:
+        resolved_user = await get_session_identity(request, db)
+        if resolved_user:
+            user_id = resolved_user.id
+    if not user_id:
+        session_id = request.session.get('session_id')
+        if not session_id:
+            import uuid
+            session_id = uuid.uuid4().hex
+            request.session['session_id'] = session_id
+
+    cart = await get_or_create_cart(db, user_id=user_id, session_id=session_id)
+    if cart:
+        for cart_item in cart.items:
+            item = cart_item.item
+            if not item:
+                continue
+            final_path = resolve_picture_path(item.picture_path, item.name)
+            items.append({
+                "id": item.id,
+                "name": item.name,
+                "description": item.description,
+                "price": item.price,
+                "quantity": cart_item.quantity,
+                "picture_path": final_path,
+                "tags": item.tags.split(",") if item.tags else [],
+            })
 
     return templates.TemplateResponse(request, "cart.html", {"username": username, "items": items})
 
@@ -214,19 +235,58 @@ def login_redirect():
 def health_check():
     return {"status": "healthy"}
 
-connected_clients = []
+@app.get("/health/pool")
+def pool_stats():
+    # Live connection pool usage (sync + async engines) for sizing DB_POOL_SIZE / DB_MAX_OVERFLOW
+    return get_pool_stats()
+
+def _runtime_metrics():
+    # Gauges read at scrape time from the components' own stats
+    pool_samples = {"checked_out": [], "size": [], "overflow": []}
+    for engine_name, pool in get_pool_stats().items():
+        for key, samples in pool_samples.items():
+            if key in pool:
+                samples.append(({"engine": engine_name}, pool[key]))
+    ws = manager.stats()
+    caches = {"catalog": catalog_cache.stats(), "identity": identity_cache.stats()}
+    hashing = password_hasher.stats()
+    return [
+        ("db_pool_checked_out", "gauge", "Connections checked out of the pool", pool_samples["checked_out"]),
+        ("db_pool_size", "gauge", "Configured pool size", pool_samples["size"]),
+        ("db_pool_overflow", "gauge", "Connections beyond the pool size", pool_samples["overflow"]),
+        ("websocket_connections", "gauge", "Open /ws/stock-updates connections", [({}, ws["connections"])]),
+        ("websocket_queued_messages", "gauge", "Messages waiting in per-client send queues", [({}, ws["queued"])]),
+        ("websocket_dropped_messages_total", "counter", "Messages dropped for slow clients", [({}, ws["dropped_messages"])]),
+        ("websocket_slow_disconnects_total", "counter", "Clients disconnected for being slow", [({}, ws["slow_disconnects"])]),
+        ("cache_hits_total", "counter", "In-process cache hits", [({"cache": name}, c["hits"]) for name, c in caches.items()]),
+        ("cache_misses_total", "counter", "In-process cache misses", [({"cache": name}, c["misses"]) for name, c in caches.items()]),
+        ("cache_hit_ratio", "gauge", "Hits / lookups since start",
+         [({"cache": name}, c["hits"] / (c["hits"] + c["misses"]) if c["hits"] + c["misses"] else 0.0) for name, c in caches.items()]),
+        ("password_hash_pending", "gauge", "Password hashing jobs running or queued", [({}, hashing["pending"])]),
+        ("password_hash_rejected_total", "counter", "Hashing jobs refused because the queue was full", [({}, hashing["rejected"])]),
+        ("password_hash_timeouts_total", "counter", "Hashing jobs that timed out", [({}, hashing["timeouts"])]),
+    ]
+
+if settings.metrics_enabled:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        # Prometheus text format; per worker process
+        return PlainTextResponse(metrics.render(_runtime_metrics()), media_type=PROMETHEUS_CONTENT_TYPE)
 
 @app.websocket("/ws/stock-updates")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    connected_clients.append(websocket)
+    # Stock updates are pushed through the shared manager (one writer task per client).
+    # Clients send {"subscribe": [item_ids]} to receive only the items they display.
+    await manager.connect(websocket)
     try:
-        while True:
+        while websocket.application_state == WebSocketState.CONNECTED:
             data = await websocket.receive_text()
-            for client in connected_clients:
-                await client.send_text(data)
-    except WebSocketDisconnect:
-        connected_clients.remove(websocket)
+            manager.handle_client_message(websocket, data)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the manager already closed the socket (slow client) while we waited
+        pass
+    finally:
+        manager.disconnect(websocket)
 
 @app.get("/purchases", response_class=HTMLResponse)
 async def purchases(request: Request):
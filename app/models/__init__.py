@@ -4,4 +4,9 @@ from .cart import Cart
 from .cart_item import CartItem
 from .order import Order
 from .order_item import OrderItem
+from .tag import Tag
+from .item_tag import ItemTag
 
+from .bus_event import BusEvent
+from .server_session import ServerSession
+from .id_counter import IdCounter
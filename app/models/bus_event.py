@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.db.db import Base
+
+
+class BusEvent(Base):
+    # Outbox/inbox of the "table" event bus backend: workers append events and poll for newer ids
+    __tablename__ = "bus_events"
+
+    id = Column(Integer, primary_key=True)
+    origin = Column(String, nullable=False)
+    channel = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -12,6 +12,8 @@ class Cart(Base):
     session_id = Column(String, nullable=True)  # For guest carts
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Incremented whenever the cart's lines change (see the cart ETag in app/api/carts.py)
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationships
     user = relationship("User", back_populates="carts")
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index, func, select
+from sqlalchemy.orm import column_property, relationship
 from app.db.db import Base
+from app.models.item import Item
 
 
 class CartItem(Base):
@@ -10,7 +11,25 @@ class CartItem(Base):
     cart_id = Column(Integer, ForeignKey("carts.id"), nullable=False)
     item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
     quantity = Column(Integer, nullable=False, default=1)
+    # The line holds `quantity` units of stock until this time (NULL: no hold)
+    reserved_until = Column(DateTime(timezone=True), nullable=True)
 
     # Relationships
     cart = relationship("Cart", back_populates="items")
     item = relationship("Item")
+
+    # One line per (cart, item); also the conflict target for add-to-cart upserts
+    __table_args__ = (
+        Index("uq_cart_items_cart_id_item_id", "cart_id", "item_id", unique=True),
+        Index("ix_cart_items_item_id_reserved_until", "item_id", "reserved_until"),
+    )
+
+
+# Stock not held by an active cart reservation. Expired holds stop counting on their own,
+# so reads never depend on the sweeper having run.
+Item.available = column_property(
+    Item.stock - select(func.coalesce(func.sum(CartItem.quantity), 0))
+    .where(CartItem.item_id == Item.id, CartItem.reserved_until > func.now())
+    .correlate_except(CartItem)
+    .scalar_subquery()
+)
@@ -0,0 +1,10 @@
+from sqlalchemy import BigInteger, Column, String
+from app.db.db import Base
+
+
+class IdCounter(Base):
+    # Named counters for generated ids (e.g. "users" -> next B#### number); workers reserve blocks from it
+    __tablename__ = "id_counters"
+
+    name = Column(String, primary_key=True)
+    next_value = Column(BigInteger, nullable=False)
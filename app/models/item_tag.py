@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, ForeignKey, Index
+from app.db.db import Base
+
+
+class ItemTag(Base):
+    __tablename__ = "item_tags"
+
+    # (item_id, tag_id) primary key serves item -> tags; the (tag_id, item_id) index serves tag -> items
+    item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_item_tags_tag_id_item_id", "tag_id", "item_id"),
+    )
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Float, String, Text
+from app.db.db import Base
+
+
+class ServerSession(Base):
+    # Server-side session data for SESSION_BACKEND=table; the cookie only carries the id
+    __tablename__ = "sessions"
+
+    id = Column(String(64), primary_key=True)
+    data = Column(Text, nullable=False)  # JSON
+    expires_at = Column(Float, nullable=False, index=True)  # epoch seconds
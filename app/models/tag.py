@@ -0,0 +1,9 @@
+from sqlalchemy import Column, Integer, String
+from app.db.db import Base
+
+
+class Tag(Base):
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False, index=True)
@@ -7,7 +7,7 @@ from app.db.db import Base
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(String(5), primary_key=True, index=True)
+    id = Column(String(32), primary_key=True, index=True)  # "B" + zero-padded number, see id_allocator
     username = Column(String, unique=True, nullable=False, index=True)
     email = Column(String, unique=True, nullable=False, index=True)
     hashed_password = Column(String, nullable=False)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Literal, Optional
 from datetime import datetime
 from .item import Item
 
@@ -21,6 +21,21 @@ class CartItem(CartItemBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class CartItemOperation(BaseModel):
+    # set: line quantity becomes `quantity` (0 removes it); add/remove: change it by `quantity`
+    op: Literal["set", "add", "remove"]
+    item_id: int
+    quantity: int = Field(1, ge=0)
+
+
+class CartBatch(BaseModel):
+    operations: List[CartItemOperation] = Field(..., max_length=500)
+
+
+class CartClear(BaseModel):
+    cart_ids: List[int] = Field(..., max_length=1000)
+
+
 class CartBase(BaseModel):
     user_id: Optional[str] = None
     session_id: Optional[str] = None
@@ -1,8 +1,19 @@
-from pydantic import BaseModel, ConfigDict, field_validator
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
 
 
+def split_tags(value) -> List[str]:
+    # DB stores tags as a comma-separated string; convert to list for the API
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [t.strip() for t in value.split(',') if t.strip()]
+    if isinstance(value, list):
+        return value
+    return []
+
+
 class ItemBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -10,13 +21,14 @@ class ItemBase(BaseModel):
 
 
 class ItemCreate(ItemBase):
-    pass
+    tags: Optional[List[str]] = None
 
 
 class ItemUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     price: Optional[float] = None
+    tags: Optional[List[str]] = None
 
 
 class Item(ItemBase):
@@ -25,7 +37,8 @@ class Item(ItemBase):
     updated_at: Optional[datetime] = None
 
     # Additional fields present in the DB model that the frontend expects
-    stock: int = 0
+    # Available stock: on-hand stock minus active cart reservations
+    stock: int = Field(0, validation_alias=AliasChoices("available", "stock"))
     picture_path: Optional[str] = None
     tags: Optional[List[str]] = None
 
@@ -33,11 +46,15 @@ class Item(ItemBase):
 
     @field_validator('tags', mode='before')
     def _split_tags(cls, v):
-        # DB stores tags as a comma-separated string; convert to list for the API
-        if v is None:
-            return []
-        if isinstance(v, str):
-            return [t.strip() for t in v.split(',') if t.strip()]
-        if isinstance(v, list):
-            return v
-        return []
+        return split_tags(v)
+
+
+class TagFacet(BaseModel):
+    name: str
+    count: int
+
+
+class ItemFacets(BaseModel):
+    # Number of items matching the tag filter and tag counts among them
+    total: int
+    tags: List[TagFacet] = []
@@ -0,0 +1,135 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable, List, Optional
+
+from app.core.config import settings
+from app.schemas.item import Item as ItemSchema
+
+
+class CatalogCache:
+    """In-process TTL + LRU cache for catalog reads.
+
+    Items are stored once by id; cached listing pages only keep ids, so patching
+    one item is visible in every page. Only touched from the event loop (no locks).
+    """
+
+    def __init__(self, ttl_seconds: float, max_items: int, max_pages: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.max_pages = max_pages
+        self._items: "OrderedDict[int, tuple[float, ItemSchema]]" = OrderedDict()
+        self._pages: "OrderedDict[Hashable, tuple[float, List[int]]]" = OrderedDict()
+        # Bumped on every catalog write
+        self.version = 0
+        # Bumped on writes other than stock patches (the home page patches stock in place)
+        self.structure_version = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_items > 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return time.monotonic() - stored_at > self.ttl_seconds
+
+    def get_item(self, item_id: int) -> Optional[ItemSchema]:
+        entry = self._items.get(item_id)
+        if entry is None or self._expired(entry[0]):
+            if entry is not None:
+                del self._items[item_id]
+            self.misses += 1
+            return None
+        self._items.move_to_end(item_id)
+        self.hits += 1
+        return entry[1]
+
+    def get_page(self, key: Hashable) -> Optional[List[ItemSchema]]:
+        entry = self._pages.get(key)
+        if entry is None or self._expired(entry[0]):
+            if entry is not None:
+                del self._pages[key]
+            self.misses += 1
+            return None
+        page = []
+        for item_id in entry[1]:
+            item_entry = self._items.get(item_id)
+            if item_entry is None or self._expired(item_entry[0]):
+                # An item of the page was evicted or expired; reload the whole page
+                del self._pages[key]
+                self.misses += 1
+                return None
+            page.append(item_entry[1])
+        self._pages.move_to_end(key)
+        self.hits += 1
+        return page
+
+    def put_item(self, item: ItemSchema, version: Optional[int] = None) -> None:
+        # version: the cache version read before the item was loaded. If a write or stock patch
+        # landed while the query ran, the row may predate it, so it is not stored.
+        if not self.enabled or (version is not None and version != self.version):
+            return
+        self._items[item.id] = (time.monotonic(), item)
+        self._items.move_to_end(item.id)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def put_page(self, key: Hashable, items: Iterable[ItemSchema], version: Optional[int] = None) -> None:
+        if not self.enabled or (version is not None and version != self.version):
+            return
+        ids = []
+        for item in items:
+            self.put_item(item)
+            ids.append(item.id)
+        self._pages[key] = (time.monotonic(), ids)
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+
+    def item_written(self, item: ItemSchema, membership_changed: bool = False) -> None:
+        # Replace the cached copy; pages are dropped only when the set of items changed
+        self.version += 1
+        self.structure_version += 1
+        self.put_item(item)
+        if membership_changed:
+            self._pages.clear()
+
+    def item_deleted(self, item_id: int) -> None:
+        self.invalidate_item(item_id)
+
+    def invalidate_item(self, item_id: int) -> None:
+        # Used when another worker changed the item: drop our copy and any page it may appear on
+        self.version += 1
+        self.structure_version += 1
+        self._items.pop(item_id, None)
+        self._pages.clear()
+
+    def patch_stock(self, item_id: int, stock: int) -> None:
+        # Stock changes patch the cached item in place instead of invalidating it
+        self.version += 1
+        entry = self._items.get(item_id)
+        if entry is not None:
+            entry[1].stock = stock
+
+    def clear(self) -> None:
+        self.version += 1
+        self.structure_version += 1
+        self._items.clear()
+        self._pages.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "items": len(self._items),
+            "pages": len(self._pages),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+            "version": self.version,
+        }
+
+
+catalog_cache = CatalogCache(
+    ttl_seconds=settings.catalog_cache_ttl_seconds,
+    max_items=settings.catalog_cache_max_items,
+)
@@ -0,0 +1,99 @@
+import time
+from typing import Dict, List, Optional
+
+from fastapi.templating import Jinja2Templates
+from jinja2.utils import htmlsafe_json_dumps
+from markupsafe import Markup
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.item import Item
+from app.services.catalog_cache import catalog_cache
+from app.services.event_bus import STOCK_CHANNEL, event_bus
+from app.utils.images import resolve_picture_path
+
+templates = Jinja2Templates(directory="templates")
+
+
+class HomeCatalogSnapshot:
+    # Precomputed, user-independent part of the home page for one catalog structure version.
+    # Stock changes patch the items in place and re-render without going back to the database.
+    def __init__(self, version: int, items: List[dict]):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.items = items
+        self.by_id = {item["id"]: item for item in items}
+        self.render()
+
+    def render(self) -> None:
+        self.html = Markup(templates.get_template("_catalog_cards.html").render(items=self.items))
+        self.json = htmlsafe_json_dumps(self.items)
+        self.stale = False
+
+    def patch_stock(self, stock: Dict[int, int]) -> None:
+        for item_id, available in stock.items():
+            item = self.by_id.get(item_id)
+            if item is not None and item["stock"] != available:
+                item["stock"] = available
+                self.stale = True
+
+
+_snapshot: Optional[HomeCatalogSnapshot] = None
+# Stock patches seen while snapshots are being rebuilt (the rows may have been read before them)
+_patches_during_rebuild: List[Dict[int, int]] = []
+
+
+def build_item_view(item: Item) -> dict:
+    # Convert an item row to the dict the home template and `window.shopItems` expect
+    return {
+        "id": item.id,
+        "name": item.name,
+        "description": item.description,
+        "price": item.price,
+        "stock": item.available,
+        "picture_path": resolve_picture_path(item.picture_path, item.name),
+        "tags": item.tags.split(",") if item.tags else [],
+        "created_at": item.created_at.isoformat() if item.created_at else None,
+        "updated_at": item.updated_at.isoformat() if item.updated_at else None,
+    }
+
+
+def _is_fresh(snapshot: Optional[HomeCatalogSnapshot]) -> bool:
+    if snapshot is None or snapshot.version != catalog_cache.structure_version:
+        return False
+    # The TTL bounds staleness from writes made by other workers
+    return time.monotonic() - snapshot.built_at <= catalog_cache.ttl_seconds
+
+
+async def get_home_catalog(db: AsyncSession) -> HomeCatalogSnapshot:
+    global _snapshot
+    if _is_fresh(_snapshot):
+        if _snapshot.stale:
+            _snapshot.render()
+        return _snapshot
+    # Stamp with the version seen before loading: a write during the rebuild forces another one
+    version = catalog_cache.structure_version
+    patches: Dict[int, int] = {}
+    _patches_during_rebuild.append(patches)
+    try:
+        rows = (await db.execute(select(Item))).scalars().all()
+    finally:
+        _patches_during_rebuild.remove(patches)
+    snapshot = HomeCatalogSnapshot(version, [build_item_view(item) for item in rows])
+    if patches:
+        snapshot.patch_stock(patches)
+        snapshot.render()
+    _snapshot = snapshot
+    return _snapshot
+
+
+def _patch_stock(payload: dict) -> None:
+    # Remote payloads went through JSON, so item ids arrive as strings
+    stock = {int(item_id): available for item_id, available in payload["items"].items()}
+    for patches in _patches_during_rebuild:
+        patches.update(stock)
+    if _snapshot is not None:
+        _snapshot.patch_stock(stock)
+
+
+event_bus.subscribe(STOCK_CHANNEL, _patch_stock)
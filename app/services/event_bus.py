@@ -0,0 +1,329 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, or_, select
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+from app.db.db import AsyncSessionLocal, get_async_database_url
+from app.models.bus_event import BusEvent
+from app.services.catalog_cache import catalog_cache
+from app.websocket_manager import manager
+
+logger = logging.getLogger("app.services.event_bus")
+
+# Channels
+STOCK_CHANNEL = "stock"      # {"items": {item_id: available stock}}
+CATALOG_CHANNEL = "catalog"  # {"item_id": id} after an item was created, updated or deleted
+
+# Deliver a remote event: (origin, channel, payload)
+RemoteCallback = Callable[[str, str, dict], None]
+
+
+class InMemoryBackend:
+    # Single process: local delivery is all there is
+    name = "memory"
+
+    async def start(self, origin: str, deliver: RemoteCallback) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, origin: str, channel: str, payload: dict) -> None:
+        pass
+
+
+async def prune_bus_events(session_factory, retention_seconds: float) -> None:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=retention_seconds)
+    async with session_factory() as db:
+        await db.execute(delete(BusEvent).where(BusEvent.created_at < cutoff))
+        await db.commit()
+
+
+class TableBackend:
+    # Works on SQLite and Postgres: events are appended to bus_events (batched, one INSERT per
+    # poll interval) and every worker polls for ids it has not seen yet.
+    # Ids are assigned at INSERT but become visible at COMMIT, so a lower id can appear after a
+    # higher one was read: each poll also re-reads the last lookback_seconds of events and
+    # skips the ids it already delivered.
+    name = "table"
+
+    def __init__(self, session_factory=AsyncSessionLocal, poll_seconds: float = 0.5, retention_seconds: float = 60.0,
+                 lookback_seconds: float = 10.0):
+        self.session_factory = session_factory
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self.lookback_seconds = lookback_seconds
+        self._outbox: List[dict] = []
+        self._last_id = 0
+        self._seen: Dict[int, float] = {}  # event id -> monotonic time it was read
+        self._task: Optional[asyncio.Task] = None
+
+    def _lookback_start(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self.lookback_seconds)
+
+    async def start(self, origin: str, deliver: RemoteCallback) -> None:
+        async with self.session_factory() as db:
+            self._last_id = await db.scalar(select(func.coalesce(func.max(BusEvent.id), 0)))
+            # Events from before this worker started are not replayed by the lookback
+            recent = await db.scalars(select(BusEvent.id).where(BusEvent.created_at >= self._lookback_start()))
+            now = time.monotonic()
+            self._seen = {event_id: now for event_id in recent}
+        self._task = asyncio.create_task(self._run(origin, deliver))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._flush()
+
+    async def publish(self, origin: str, channel: str, payload: dict) -> None:
+        self._outbox.append({"origin": origin, "channel": channel, "payload": json.dumps(payload)})
+
+    async def _flush(self) -> None:
+        if not self._outbox:
+            return
+        rows, self._outbox = self._outbox, []
+        async with self.session_factory() as db:
+            await db.execute(insert(BusEvent), rows)
+            await db.commit()
+
+    async def poll(self, origin: str, deliver: RemoteCallback) -> None:
+        await self._flush()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(BusEvent.id, BusEvent.origin, BusEvent.channel, BusEvent.payload)
+                .where(or_(BusEvent.id > self._last_id, BusEvent.created_at >= self._lookback_start()))
+                .order_by(BusEvent.id)
+            )
+            now = time.monotonic()
+            for event_id, event_origin, channel, payload in result:
+                if event_id in self._seen:
+                    continue
+                self._seen[event_id] = now
+                self._last_id = max(self._last_id, event_id)
+                if event_origin != origin:
+                    deliver(event_origin, channel, json.loads(payload))
+        # Past twice the lookback an id can no longer come back (its created_at is out of the window)
+        forget_before = now - 2 * self.lookback_seconds
+        self._seen = {event_id: seen_at for event_id, seen_at in self._seen.items() if seen_at >= forget_before}
+
+    async def prune(self) -> None:
+        await prune_bus_events(self.session_factory, self.retention_seconds)
+
+    async def _run(self, origin: str, deliver: RemoteCallback) -> None:
+        polls = 0
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.poll(origin, deliver)
+                polls += 1
+                if self.poll_seconds * polls >= self.retention_seconds:
+                    polls = 0
+                    await self.prune()
+            except Exception:
+                logger.exception("Event bus poll failed")
+
+
+class PostgresNotifyBackend:
+    # LISTEN/NOTIFY on a dedicated asyncpg connection; events are delivered as soon as they commit.
+    # NOTIFY payloads are capped at 8000 bytes, so the event itself goes to bus_events and the
+    # notification only carries "origin:id"; the other workers read the rows by id.
+    name = "postgres"
+    PG_CHANNEL = "app_events"
+
+    def __init__(self, database_url: str, session_factory=AsyncSessionLocal, retention_seconds: float = 60.0,
+                 reconnect_seconds: float = 5.0):
+        url = make_url(get_async_database_url(database_url)).set(drivername="postgresql")
+        self.dsn = url.render_as_string(hide_password=False)
+        self.session_factory = session_factory
+        self.retention_seconds = retention_seconds
+        self.reconnect_seconds = reconnect_seconds
+        self._connection = None
+        self._pending: List[int] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._catch_up = False
+        self._last_id = 0
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, origin: str, deliver: RemoteCallback) -> None:
+        async with self.session_factory() as db:
+            self._last_id = await db.scalar(select(func.coalesce(func.max(BusEvent.id), 0)))
+        self._wakeup = asyncio.Event()
+        await self._connect(origin)
+        self._tasks = [
+            asyncio.create_task(self._deliver_pending(origin, deliver)),
+            asyncio.create_task(self._watch_connection(origin)),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    async def publish(self, origin: str, channel: str, payload: dict) -> None:
+        # The notification is sent when the row commits, so listeners can always read it
+        async with self.session_factory() as db:
+            event_id = await db.scalar(
+                insert(BusEvent).values(origin=origin, channel=channel, payload=json.dumps(payload))
+                .returning(BusEvent.id)
+            )
+            await db.execute(select(func.pg_notify(self.PG_CHANNEL, f"{origin}:{event_id}")))
+            await db.commit()
+
+    async def _connect(self, origin: str) -> None:
+        import asyncpg
+
+        def on_notify(connection, pid, channel, message):
+            event_origin, _, event_id = message.partition(":")
+            if event_origin != origin:
+                self._pending.append(int(event_id))
+                self._wakeup.set()
+
+        connection = await asyncpg.connect(self.dsn)
+        await connection.add_listener(self.PG_CHANNEL, on_notify)
+        self._connection = connection
+
+    async def _watch_connection(self, origin: str) -> None:
+        # Reconnect when the LISTEN connection drops, then catch up on the events it missed
+        polls = 0
+        while True:
+            await asyncio.sleep(self.reconnect_seconds)
+            try:
+                if self._connection is None or self._connection.is_closed():
+                    logger.warning("Event bus LISTEN connection lost; reconnecting")
+                    self._connection = None
+                    await self._connect(origin)
+                    self._catch_up = True
+                    self._wakeup.set()
+                else:
+                    await self._connection.execute("SELECT 1")
+                polls += 1
+                if self.reconnect_seconds * polls >= self.retention_seconds:
+                    polls = 0
+                    await prune_bus_events(self.session_factory, self.retention_seconds)
+            except Exception:
+                logger.exception("Event bus connection check failed")
+                if self._connection is not None:
+                    self._connection.terminate()
+
+    async def _deliver_pending(self, origin: str, deliver: RemoteCallback) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            event_ids, self._pending = self._pending, []
+            criteria = BusEvent.id.in_(event_ids)
+            if self._catch_up:
+                # After a reconnect, also everything committed while the connection was down
+                # (an event may then arrive twice; stock and catalog events are idempotent)
+                self._catch_up = False
+                criteria = or_(criteria, BusEvent.id > self._last_id)
+            try:
+                async with self.session_factory() as db:
+                    result = await db.execute(
+                        select(BusEvent.id, BusEvent.origin, BusEvent.channel, BusEvent.payload)
+                        .where(criteria)
+                        .order_by(BusEvent.id)
+                    )
+                    for event_id, event_origin, channel, payload in result:
+                        self._last_id = max(self._last_id, event_id)
+                        if event_origin != origin:
+                            deliver(event_origin, channel, json.loads(payload))
+            except Exception:
+                logger.exception("Event bus delivery failed")
+
+
+def create_event_bus_backend(backend: str, database_url: str):
+    if backend == "table":
+        return TableBackend(
+            poll_seconds=settings.event_bus_poll_seconds,
+            retention_seconds=settings.event_bus_retention_seconds,
+        )
+    if backend == "postgres":
+        return PostgresNotifyBackend(database_url, retention_seconds=settings.event_bus_retention_seconds)
+    return InMemoryBackend()
+
+
+class EventBus:
+    """Publish/subscribe for stock and catalog events across worker processes.
+
+    Events are dispatched to this worker's handlers right away and handed to the backend
+    for the other workers; a worker ignores its own events when they come back.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Tuple[Callable[[dict], None], bool]]] = defaultdict(list)
+        self._started = False
+
+    def subscribe(self, channel: str, handler: Callable[[dict], None], local: bool = True) -> None:
+        # local=False: only events published by other workers (this one already applied them)
+        self._handlers[channel].append((handler, local))
+
+    def dispatch(self, channel: str, payload: dict, local: bool) -> None:
+        for handler, wants_local in self._handlers[channel]:
+            if local and not wants_local:
+                continue
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception(f"Event handler failed for channel {channel}")
+
+    def _deliver_remote(self, origin: str, channel: str, payload: dict) -> None:
+        if origin != self.origin:
+            self.dispatch(channel, payload, local=False)
+
+    async def publish(self, channel: str, payload: dict) -> None:
+        # Callers publish after their transaction committed: a backend failure must not turn
+        # a completed write into an error response, so it is logged and the event dropped
+        self.dispatch(channel, payload, local=True)
+        if self._started:
+            try:
+                await self.backend.publish(self.origin, channel, payload)
+            except Exception:
+                logger.exception(f"Event bus publish failed for channel {channel}")
+
+    async def start(self) -> None:
+        if not self._started:
+            await self.backend.start(self.origin, self._deliver_remote)
+            self._started = True
+
+    async def stop(self) -> None:
+        if self._started:
+            self._started = False
+            await self.backend.stop()
+
+
+def _apply_stock(payload: dict) -> None:
+    # Remote payloads went through JSON, so item ids arrive as strings
+    for item_id, stock in payload["items"].items():
+        catalog_cache.patch_stock(int(item_id), stock)
+        manager.stock_changed(int(item_id), stock)
+
+
+def _invalidate_item(payload: dict) -> None:
+    catalog_cache.invalidate_item(int(payload["item_id"]))
+
+
+event_bus = EventBus(create_event_bus_backend(settings.event_bus_backend, settings.database_url))
+event_bus.subscribe(STOCK_CHANNEL, _apply_stock)
+event_bus.subscribe(CATALOG_CHANNEL, _invalidate_item, local=False)
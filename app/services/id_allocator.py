@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.db import dialect_insert
+from app.db.migrations import next_id_number
+from app.models.id_counter import IdCounter
+from app.models.user import User
+
+logger = logging.getLogger("app.services.id_allocator")
+
+
+class IdAllocator:
+    """Hands out prefixed sequential ids ("B0001", "B0002", ...) from a row of id_counters.
+
+    Each worker reserves block_size numbers with one atomic UPDATE and serves them from
+    memory, so most allocations need no query and concurrent workers never collide. Numbers
+    left in a block when a worker stops are skipped: ids stay unique, not gapless.
+    """
+
+    def __init__(self, name: str, prefix: str, block_size: int, id_column=User.id):
+        self.name = name
+        self.prefix = prefix
+        self.block_size = max(1, block_size)
+        self.id_column = id_column  # existing ids, used to seed a missing counter
+        self._lock = asyncio.Lock()
+        self._next = 0
+        self._end = 0
+
+    async def _reserve(self, bind) -> Tuple[int, int]:
+        # Separate session on the caller's engine: the block stays reserved even if the caller's insert fails
+        stmt = (
+            update(IdCounter)
+            .where(IdCounter.name == self.name)
+            .values(next_value=IdCounter.next_value + self.block_size)
+            .returning(IdCounter.next_value)
+        )
+        async with AsyncSession(bind=bind, expire_on_commit=False) as db:
+            end = (await db.execute(stmt)).scalar_one_or_none()
+            if end is None:
+                # Normally seeded by migration 0005; start after the highest existing id
+                ids = (await db.execute(select(self.id_column).where(self.id_column.like(f"{self.prefix}%")))).scalars().all()
+                await db.execute(
+                    dialect_insert(db, IdCounter)
+                    .values(name=self.name, next_value=next_id_number(ids, self.prefix))
+                    .on_conflict_do_nothing(index_elements=[IdCounter.name])
+                )
+                end = (await db.execute(stmt)).scalar_one()
+            await db.commit()
+        logger.debug(f"Reserved {self.name} ids {end - self.block_size}..{end - 1}")
+        return end - self.block_size, end
+
+    async def next_id(self, db: AsyncSession) -> str:
+        async with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = await self._reserve(db.bind)
+            number = self._next
+            self._next += 1
+        # Four digits as before (B0001); longer numbers just grow past B9999
+        return f"{self.prefix}{number:04d}"
+
+
+# Site is customer-only: customer user ids use the fixed prefix 'B'
+user_id_allocator = IdAllocator("users", "B", settings.user_id_block_size)
@@ -0,0 +1,131 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from jose import jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.user import User
+
+
+@dataclass(frozen=True)
+class Identity:
+    # What request handlers need to know about the authenticated user (no password hash, no ORM state)
+    id: str
+    username: str
+    email: str
+
+
+class IdentityCache:
+    """Process-wide TTL + LRU cache for identity lookups.
+
+    Maps a user id or username (each keyed by its own column) to the user's Identity, and a
+    JWT to its claims, so repeated requests of the same user skip the users query and the
+    token decode. Misses are not cached; user writes call invalidate().
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._identities: "OrderedDict[tuple[str, str], tuple[float, Identity]]" = OrderedDict()
+        self._claims: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def _get(self, entries: OrderedDict, key):
+        entry = entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del entries[key]
+            self.misses += 1
+            return None
+        entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def _put(self, entries: OrderedDict, key, value, expires_at: float) -> None:
+        if not self.enabled:
+            return
+        entries[key] = (expires_at, value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get_identity(self, by: str, identifier: str) -> Optional[Identity]:
+        return self._get(self._identities, (by, identifier))
+
+    def put_identity(self, by: str, identifier: str, identity: Identity) -> None:
+        # Keyed by column and value: the same string may be one user's id and another's username
+        self._put(self._identities, (by, identifier), identity, time.monotonic() + self.ttl_seconds)
+
+    def get_claims(self, token: str) -> Optional[dict]:
+        return self._get(self._claims, token)
+
+    def put_claims(self, token: str, claims: dict) -> None:
+        # Never keep a token past its own expiry
+        expires_at = time.monotonic() + self.ttl_seconds
+        if isinstance(claims.get("exp"), (int, float)):
+            expires_at = min(expires_at, time.monotonic() + claims["exp"] - time.time())
+        self._put(self._claims, token, claims, expires_at)
+
+    def invalidate(self, *identifiers: str) -> None:
+        # Drop every cached lookup that resolves to, or could now resolve to, a different user
+        for key in [key for key, (_, identity) in self._identities.items()
+                    if key[1] in identifiers or identity.id in identifiers]:
+            del self._identities[key]
+
+    def clear(self) -> None:
+        self._identities.clear()
+        self._claims.clear()
+
+    def stats(self) -> dict:
+        return {
+            "identities": len(self._identities),
+            "tokens": len(self._claims),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+identity_cache = IdentityCache(
+    ttl_seconds=settings.identity_cache_ttl_seconds,
+    max_entries=settings.identity_cache_max_entries,
+)
+
+
+IDENTITY_COLUMNS = {"id": User.id, "username": User.username}
+
+
+async def resolve_identity(db: AsyncSession, identifier: Optional[str], by: str = "username") -> Optional[Identity]:
+    # A username (session/JWT subject) or, with by="id", a user id -> Identity; one query on a
+    # cache miss. Only ever one column: a username like "B0001" must not match user B0001.
+    if not identifier:
+        return None
+    identity = identity_cache.get_identity(by, identifier)
+    if identity is not None:
+        return identity
+    row = (await db.execute(
+        select(User.id, User.username, User.email).where(IDENTITY_COLUMNS[by] == identifier)
+    )).first()
+    if row is None:
+        return None
+    identity = Identity(id=row.id, username=row.username, email=row.email)
+    identity_cache.put_identity(by, identifier, identity)
+    return identity
+
+
+def decode_token_claims(token: str, secret_key: str, algorithm: str) -> dict:
+    # Raises JWTError for invalid or expired tokens; valid ones are decoded once per TTL
+    claims = identity_cache.get_claims(token)
+    if claims is not None:
+        return claims
+    claims = jwt.decode(token, secret_key, algorithms=[algorithm])
+    identity_cache.put_claims(token, claims)
+    return claims
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.db import AsyncSessionLocal
+from app.models.cart_item import CartItem
+from app.models.item import Item
+from app.services.event_bus import STOCK_CHANNEL, event_bus
+
+logger = logging.getLogger("app.services.reservations")
+
+# Cart lines hold stock until `reserved_until`; Item.stock is only decremented at checkout.
+# Available stock (Item.available) is stock minus the holds that have not expired yet.
+
+
+def hold_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=settings.cart_reservation_ttl_seconds)
+
+
+def held_quantity(item_id, exclude_cart_id: Optional[int] = None):
+    # Units of `item_id` held by active reservations, optionally ignoring one cart's own line
+    query = select(func.coalesce(func.sum(CartItem.quantity), 0)).where(
+        CartItem.item_id == item_id, CartItem.reserved_until > func.now()
+    )
+    if exclude_cart_id is not None:
+        query = query.where(CartItem.cart_id != exclude_cart_id)
+    return query.correlate_except(CartItem).scalar_subquery()
+
+
+async def lock_items(db: AsyncSession, item_ids: Iterable[int]) -> None:
+    # Postgres: serialize reservations of the same items with row locks (no row is written).
+    # SQLite already serializes writers, and the reservation statement is the first write.
+    item_ids = sorted(set(item_ids))
+    if item_ids and db.bind.dialect.name == "postgresql":
+        await db.execute(select(Item.id).where(Item.id.in_(item_ids)).order_by(Item.id).with_for_update())
+
+
+async def available_stock(db: AsyncSession, item_ids: Iterable[int]) -> Dict[int, int]:
+    item_ids = list(set(item_ids))
+    if not item_ids:
+        return {}
+    result = await db.execute(select(Item.id, Item.available).where(Item.id.in_(item_ids)))
+    return dict(result.all())
+
+
+async def publish_available(available: Dict[int, int]) -> None:
+    # Every worker patches its catalog cache and pushes the new stock to its own clients
+    if available:
+        await event_bus.publish(STOCK_CHANNEL, {"items": available})
+
+
+async def release_expired_holds(db: AsyncSession, batch_size: int) -> int:
+    # Clear expired holds in batches (one short transaction each) and publish the stock they free
+    released = 0
+    while True:
+        expired = (
+            select(CartItem.id)
+            .where(CartItem.reserved_until <= func.now())
+            .limit(batch_size)
+        )
+        result = await db.execute(
+            update(CartItem)
+            .where(CartItem.id.in_(expired))
+            .values(reserved_until=None)
+            .returning(CartItem.item_id)
+            .execution_options(synchronize_session=False)
+        )
+        item_ids = result.scalars().all()
+        await db.commit()
+        if item_ids:
+            released += len(item_ids)
+            await publish_available(await available_stock(db, item_ids))
+            await db.commit()
+        if len(item_ids) < batch_size:
+            return released
+
+
+class ReservationSweeper:
+    # Background task started with the app; one sweep every `interval_seconds`
+    def __init__(self, interval_seconds: float, batch_size: int):
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def sweep(self) -> int:
+        async with AsyncSessionLocal() as db:
+            return await release_expired_holds(db, self.batch_size)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                released = await self.sweep()
+                if released:
+                    logger.info(f"Released expired holds on {released} cart line(s)")
+            except Exception:
+                logger.exception("Reservation sweep failed")
+
+
+reservation_sweeper = ReservationSweeper(
+    interval_seconds=settings.reservation_sweep_interval_seconds,
+    batch_size=settings.reservation_sweep_batch_size,
+)
@@ -0,0 +1,212 @@
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.item import Item
+
+logger = logging.getLogger("app.services.search")
+
+_token_regex = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    return _token_regex.findall(value.lower()) if value else []
+
+
+class SQLiteFTSSearchBackend:
+    # External-content FTS5 table over items, kept in sync by triggers in the same transaction
+    # as every insert/update/delete of an item.
+    name = "fts5"
+
+    _DDL = [
+        # IF NOT EXISTS: workers starting together may all find the table missing
+        "CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5("
+        "name, description, tags, content='items', content_rowid='id', tokenize='unicode61')",
+        "CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN "
+        "INSERT INTO items_fts(rowid, name, description, tags) VALUES (new.id, new.name, new.description, new.tags); END",
+        "CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN "
+        "INSERT INTO items_fts(items_fts, rowid, name, description, tags) "
+        "VALUES ('delete', old.id, old.name, old.description, old.tags); END",
+        "CREATE TRIGGER IF NOT EXISTS items_fts_au AFTER UPDATE OF name, description, tags ON items BEGIN "
+        "INSERT INTO items_fts(items_fts, rowid, name, description, tags) "
+        "VALUES ('delete', old.id, old.name, old.description, old.tags); "
+        "INSERT INTO items_fts(rowid, name, description, tags) VALUES (new.id, new.name, new.description, new.tags); END",
+        # Index the rows that existed before the table was created
+        "INSERT INTO items_fts(items_fts) VALUES ('rebuild')",
+    ]
+
+    async def setup(self, db: AsyncSession) -> None:
+        exists = (await db.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'items_fts'"
+        ))).first()
+        if not exists:
+            for statement in self._DDL:
+                await db.execute(text(statement))
+            await db.commit()
+
+    async def search(self, db: AsyncSession, tokens: List[str], limit: int, offset: int) -> List[int]:
+        # Every token must match (implicit AND); the last one as a prefix for search-as-you-type
+        match = " ".join(f'"{t}"' for t in tokens[:-1]) + f' "{tokens[-1]}"*'
+        # bm25 column weights: name, description, tags (lower score = better)
+        result = await db.execute(
+            text(
+                "SELECT rowid FROM items_fts WHERE items_fts MATCH :match "
+                "ORDER BY bm25(items_fts, 10.0, 1.0, 5.0), rowid LIMIT :limit OFFSET :offset"
+            ),
+            {"match": match.strip(), "limit": limit, "offset": offset},
+        )
+        return [row[0] for row in result]
+
+
+# Weighted document expression shared by the GIN index and the queries (they must match exactly)
+_PG_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(tags, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+
+class PostgresSearchBackend:
+    # tsvector expression GIN index on items; Postgres maintains it on every write
+    name = "postgres"
+
+    async def setup(self, db: AsyncSession) -> None:
+        await db.execute(text(f"CREATE INDEX IF NOT EXISTS ix_items_search ON items USING GIN (({_PG_DOCUMENT}))"))
+        await db.commit()
+
+    async def search(self, db: AsyncSession, tokens: List[str], limit: int, offset: int) -> List[int]:
+        query = " & ".join(tokens[:-1] + [f"{tokens[-1]}:*"])
+        result = await db.execute(
+            text(
+                f"SELECT id FROM items WHERE ({_PG_DOCUMENT}) @@ to_tsquery('simple', :query) "
+                f"ORDER BY ts_rank(({_PG_DOCUMENT}), to_tsquery('simple', :query)) DESC, id "
+                "LIMIT :limit OFFSET :offset"
+            ),
+            {"query": query, "limit": limit, "offset": offset},
+        )
+        return [row[0] for row in result]
+
+
+class InMemorySearchBackend:
+    # Inverted index (token -> item id -> weight), loaded from the DB on first use and
+    # updated by the item services after each committed write.
+    name = "memory"
+    FIELD_WEIGHTS = {"name": 3.0, "tags": 2.0, "description": 1.0}
+
+    def __init__(self):
+        self._loaded = False
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._doc_tokens: Dict[int, List[str]] = {}
+
+    def index_item(self, item_id: int, name: Optional[str], description: Optional[str], tags: Optional[str]) -> None:
+        self.remove_item(item_id)
+        weights: Dict[str, float] = defaultdict(float)
+        for field, value in (("name", name), ("description", description), ("tags", tags)):
+            for token in tokenize(value):
+                weights[token] += self.FIELD_WEIGHTS[field]
+        for token, weight in weights.items():
+            self._postings[token][item_id] = weight
+        self._doc_tokens[item_id] = list(weights)
+
+    def remove_item(self, item_id: int) -> None:
+        for token in self._doc_tokens.pop(item_id, []):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(item_id, None)
+                if not postings:
+                    del self._postings[token]
+
+    async def setup(self, db: AsyncSession) -> None:
+        if self._loaded:
+            return
+        rows = await db.execute(select(Item.id, Item.name, Item.description, Item.tags))
+        for item_id, name, description, tags in rows:
+            self.index_item(item_id, name, description, tags)
+        self._loaded = True
+
+    async def search(self, db: AsyncSession, tokens: List[str], limit: int, offset: int) -> List[int]:
+        scores: Optional[Dict[int, float]] = None
+        for i, token in enumerate(tokens):
+            if i == len(tokens) - 1:
+                # Prefix match for the last token
+                matches: Dict[int, float] = defaultdict(float)
+                for indexed, postings in self._postings.items():
+                    if indexed.startswith(token):
+                        for item_id, weight in postings.items():
+                            matches[item_id] += weight
+            else:
+                matches = self._postings.get(token, {})
+            if scores is None:
+                scores = dict(matches)
+            else:
+                scores = {item_id: score + matches[item_id] for item_id, score in scores.items() if item_id in matches}
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))
+        return [item_id for item_id, _ in ranked[offset:offset + limit]]
+
+
+def create_search_backend(database_url: str, backend: str = "auto"):
+    if backend == "auto":
+        if database_url.startswith("sqlite"):
+            backend = "fts5"
+        elif database_url.startswith("postgres"):
+            backend = "postgres"
+        else:
+            backend = "memory"
+            logger.info("No database search for this database; using the in-memory index")
+    if backend == "fts5":
+        return SQLiteFTSSearchBackend()
+    if backend == "postgres":
+        return PostgresSearchBackend()
+    return InMemorySearchBackend()
+
+
+class SearchIndex:
+    # Facade used by the routers and services. Falls back to the in-memory index when the
+    # database cannot provide one (e.g. SQLite built without FTS5).
+    def __init__(self, backend):
+        self.backend = backend
+        self._ready = False
+
+    async def ensure_ready(self, db: AsyncSession) -> None:
+        if self._ready:
+            return
+        try:
+            await self.backend.setup(db)
+        except Exception as exc:
+            if isinstance(self.backend, InMemorySearchBackend):
+                raise
+            logger.warning(
+                f"Search backend '{self.backend.name}' unavailable ({exc}); using the in-memory index "
+                "(per worker, loaded from the database now)"
+            )
+            await db.rollback()
+            self.backend = InMemorySearchBackend()
+            await self.backend.setup(db)
+        self._ready = True
+
+    def item_written(self, item: Item) -> None:
+        # Database-backed indexes are maintained by the database itself
+        if isinstance(self.backend, InMemorySearchBackend) and self._ready:
+            self.backend.index_item(item.id, item.name, item.description, item.tags)
+
+    def item_deleted(self, item_id: int) -> None:
+        if isinstance(self.backend, InMemorySearchBackend) and self._ready:
+            self.backend.remove_item(item_id)
+
+    async def search(self, db: AsyncSession, query: str, limit: int = 20, offset: int = 0) -> List[int]:
+        # Ranked ids of the items matching every token of `query`
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        await self.ensure_ready(db)
+        return await self.backend.search(db, tokens, limit, offset)
+
+
+search_index = SearchIndex(create_search_backend(settings.database_url, settings.search_backend))
@@ -1,311 +1,739 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, String, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, bindparam, DateTime, Integer, or_, select, delete, func, insert, update, literal
 from app.models.item import Item
 from app.models.cart import Cart
 from app.models.cart_item import CartItem
 from app.models.user import User
 from app.models.order import Order
 from app.models.order_item import OrderItem
-from app.schemas.item import ItemCreate, ItemUpdate
+from app.models.tag import Tag
+from app.models.item_tag import ItemTag
+from app.db.db import dialect_insert
+from app.db.migrations import split_tag_names
+from app.schemas.item import Item as ItemSchema, ItemCreate, ItemUpdate, ItemFacets, TagFacet, split_tags
 from app.schemas.user import UserCreate
-from app.core.security import get_password_hash
+from app.core.security import password_hasher
 from typing import List, Optional
 import logging
-from app.websocket_manager import manager  # Import the WebSocket manager from the new module
-from sqlalchemy.orm import joinedload
-import re, os
+from app.services.catalog_cache import catalog_cache
+from app.services.event_bus import CATALOG_CHANNEL, event_bus
+from app.services.id_allocator import user_id_allocator
+from app.services.identity import identity_cache
+from app.services.search import search_index
+from app.services.reservations import available_stock, held_quantity, hold_expiry, lock_items, publish_available
+from sqlalchemy.orm import selectinload
+from app.utils.images import image_manifest
 
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
-# New helper: slugify item names for deterministic image filenames
-_slug_regex = re.compile(r'[^a-z0-9]+')
 
-def slugify(name: str) -> str:
-    if not name:
-        return 'item'
-    name = name.lower().strip()
-    name = _slug_regex.sub('-', name)
-    name = re.sub(r'-{2,}', '-', name).strip('-')
-    return name or 'item'
+# Item services
+# Read paths select the Item schema's columns directly and build the schema without
+# validation (trusted DB output): no ORM objects, no per-field validators.
+ITEM_FIELDS = ("id", "name", "description", "price", "created_at", "updated_at", "stock", "picture_path", "tags")
+ITEM_COLUMNS = (
+    Item.id, Item.name, Item.description, Item.price, Item.created_at, Item.updated_at,
+    Item.available, Item.picture_path, Item.tags,
+)
 
-# Directory where item images live (relative to static/). We keep this centralized.
-ITEM_IMAGE_DIR = os.path.join('static', 'images', 'items')
-DEFAULT_IMAGE_REL = 'images/items/default.png'  # relative path used by templates
 
+def item_data(values) -> dict:
+    # One item as plain data, from ITEM_COLUMNS values
+    data = dict(zip(ITEM_FIELDS, values))
+    data["tags"] = split_tags(data["tags"])
+    return data
 
-# Item services
-def get_item(db: Session, item_id: int) -> Optional[Item]:
-    return db.query(Item).filter(Item.id == item_id).first()  # type: ignore
+
+def _item_from_row(values) -> ItemSchema:
+    return ItemSchema.model_construct(**item_data(values))
 
 
-def get_items(db: Session, skip: int = 0, limit: int = 100) -> List[Item]:
-    return db.query(Item).offset(skip).limit(limit).all()  # type: ignore
+async def _get_item_row(db: AsyncSession, item_id: int) -> Optional[Item]:
+    # ORM row for write paths; reads go through the catalog cache below
+    result = await db.execute(select(Item).where(Item.id == item_id))
+    return result.scalars().first()
 
 
-def create_item(db: Session, item: ItemCreate) -> Item:
-    db_item = Item(**item.model_dump())
+async def get_item(db: AsyncSession, item_id: int) -> Optional[ItemSchema]:
+    cached = catalog_cache.get_item(item_id)
+    if cached is not None:
+        return cached
+    # Stamp with the version seen before loading: a write during the query keeps the row out of the cache
+    version = catalog_cache.version
+    row = (await db.execute(select(*ITEM_COLUMNS).where(Item.id == item_id))).first()
+    if row is None:
+        return None
+    item = _item_from_row(row)
+    catalog_cache.put_item(item, version)
+    return item
+
+
+def _items_with_tags(tag_names: List[str]):
+    # Ids of the items carrying every one of tag_names, resolved through the item_tags index
+    return (
+        select(ItemTag.item_id)
+        .join(Tag, Tag.id == ItemTag.tag_id)
+        .where(Tag.name.in_(tag_names))
+        .group_by(ItemTag.item_id)
+        .having(func.count(ItemTag.tag_id) == len(tag_names))
+    )
+
+
+async def get_items(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None,
+                    tags: Optional[List[str]] = None) -> List[ItemSchema]:
+    # after_id selects keyset pagination (id > after_id), which costs the same on every page;
+    # skip/limit is kept for existing clients. tags restricts to items having all of them.
+    tag_names = split_tag_names(tags)
+    query = select(*ITEM_COLUMNS)
+    if tag_names:
+        query = query.where(Item.id.in_(_items_with_tags(tag_names)))
+    if after_id is not None:
+        page_key = ("after", after_id, limit, tuple(tag_names))
+        query = query.where(Item.id > after_id).order_by(Item.id).limit(limit)
+    else:
+        page_key = ("offset", skip, limit, tuple(tag_names))
+        query = query.order_by(Item.id).offset(skip).limit(limit)
+    cached = catalog_cache.get_page(page_key)
+    if cached is not None:
+        return cached
+    version = catalog_cache.version
+    result = await db.execute(query)
+    items = [_item_from_row(row) for row in result]
+    catalog_cache.put_page(page_key, items, version)
+    return items
+
+
+async def get_item_facets(db: AsyncSession, tags: Optional[List[str]] = None) -> ItemFacets:
+    # Tag counts over the items matching the filter, aggregated in SQL
+    tag_names = split_tag_names(tags)
+    counts = (
+        select(Tag.name, func.count(ItemTag.item_id).label("count"))
+        .join(ItemTag, ItemTag.tag_id == Tag.id)
+        .group_by(Tag.name)
+        .order_by(func.count(ItemTag.item_id).desc(), Tag.name)
+    )
+    if tag_names:
+        matching = _items_with_tags(tag_names)
+        total = await db.scalar(select(func.count()).select_from(matching.subquery()))
+        counts = counts.where(ItemTag.item_id.in_(matching))
+    else:
+        total = await db.scalar(select(func.count(Item.id)))
+    rows = (await db.execute(counts)).all()
+    return ItemFacets(total=total or 0, tags=[TagFacet(name=name, count=count) for name, count in rows])
+
+
+async def _set_item_tags(db: AsyncSession, item_id: int, tag_names: List[str]) -> None:
+    # Replace the item's rows in item_tags, creating missing tags; runs in the caller's transaction
+    await db.execute(delete(ItemTag).where(ItemTag.item_id == item_id))
+    if not tag_names:
+        return
+    result = await db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(tag_names)))
+    tag_ids = {name: tag_id for name, tag_id in result.all()}
+    for name in tag_names:
+        if name not in tag_ids:
+            tag = Tag(name=name)
+            db.add(tag)
+            await db.flush()
+            tag_ids[name] = tag.id
+    await db.execute(insert(ItemTag), [{"item_id": item_id, "tag_id": tag_ids[name]} for name in tag_names])
+
+
+async def get_items_by_ids(db: AsyncSession, item_ids: List[int]) -> List[ItemSchema]:
+    # Items in the given order (e.g. search ranking); cache hits skip the database
+    found = {}
+    missing = []
+    for item_id in item_ids:
+        cached = catalog_cache.get_item(item_id)
+        if cached is not None:
+            found[item_id] = cached
+        else:
+            missing.append(item_id)
+    if missing:
+        version = catalog_cache.version
+        result = await db.execute(select(*ITEM_COLUMNS).where(Item.id.in_(missing)))
+        for row in result:
+            item = _item_from_row(row)
+            catalog_cache.put_item(item, version)
+            found[item.id] = item
+    return [found[item_id] for item_id in item_ids if item_id in found]
+
+
+async def search_items(db: AsyncSession, query: str, limit: int = 20, offset: int = 0) -> List[ItemSchema]:
+    item_ids = await search_index.search(db, query, limit=limit, offset=offset)
+    return await get_items_by_ids(db, item_ids)
+
+
+async def create_item(db: AsyncSession, item: ItemCreate) -> Item:
+    item_data = item.model_dump()
+    # Tags are stored normalized in item_tags and denormalized (comma-separated) on the item
+    tag_names = split_tag_names(item_data.pop('tags', None))
+    db_item = Item(**item_data, tags=",".join(tag_names) or None)
     # If stock wasn't provided (defaults to None), set a sensible default so items can be added to carts in tests
     if not db_item.stock:
         db_item.stock = 100
-    # Auto assign picture_path if missing using slug convention <slug>.png under images/items/
+    # Auto assign picture_path if missing using the slug convention <slug>.<ext> under images/items/
     if not db_item.picture_path:
-        slug = slugify(str(db_item.name or ''))
-        candidate_rel = f"images/items/{slug}.png"  # path relative to /static
-        # If the file actually exists, use it; else keep None (will resolve to default later in view layer)
-        if os.path.exists(os.path.join('static', candidate_rel)):
-            db_item.picture_path = candidate_rel
-        else:
-            # Leave as None so frontend can fallback; optionally could set to candidate regardless
-            db_item.picture_path = None
+        # An image may have been uploaded together with the item; pick it up right away
+        image_manifest.refresh()
+        # If a matching file exists, use it; else keep None (will resolve to default later in view layer)
+        db_item.picture_path = image_manifest.find(str(db_item.name or ''))
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    await db.flush()
+    await _set_item_tags(db, db_item.id, tag_names)
+    await db.commit()
+    await db.refresh(db_item)
+    catalog_cache.item_written(ItemSchema.model_validate(db_item), membership_changed=True)
+    search_index.item_written(db_item)
+    await event_bus.publish(CATALOG_CHANNEL, {"item_id": db_item.id})
     return db_item
 
 
-def update_item(db: Session, item_id: int, item_update: ItemUpdate) -> Optional[Item]:
-    db_item = db.query(Item).filter(Item.id == item_id).first()  # type: ignore
+async def update_item(db: AsyncSession, item_id: int, item_update: ItemUpdate) -> Optional[Item]:
+    db_item = await _get_item_row(db, item_id)
     if db_item:
         update_data = item_update.model_dump(exclude_unset=True)
+        tags_changed = 'tags' in update_data
+        if tags_changed:
+            tag_names = split_tag_names(update_data.pop('tags'))
+            db_item.tags = ",".join(tag_names) or None
+            await _set_item_tags(db, item_id, tag_names)
         name_changed = 'name' in update_data and update_data['name'] and update_data['name'] != db_item.name
         for field, value in update_data.items():
             setattr(db_item, field, value)
         # If name changed and picture_path is empty / None, attempt to set new slug-based path
         if name_changed and not getattr(db_item, 'picture_path', None):
-            slug = slugify(str(db_item.name or ''))
-            candidate_rel = f"images/items/{slug}.png"
-            if os.path.exists(os.path.join('static', candidate_rel)):
-                db_item.picture_path = candidate_rel
-        db.commit()
-        db.refresh(db_item)
+            image_manifest.refresh()
+            db_item.picture_path = image_manifest.find(str(db_item.name or ''))
+        await db.commit()
+        await db.refresh(db_item)
+        # A tag change moves the item in or out of tag-filtered pages
+        catalog_cache.item_written(ItemSchema.model_validate(db_item), membership_changed=tags_changed)
+        search_index.item_written(db_item)
+        await event_bus.publish(CATALOG_CHANNEL, {"item_id": item_id})
     return db_item
 
 
-def delete_item(db: Session, item_id: int) -> bool:
-    db_item = db.query(Item).filter(Item.id == item_id).first()  # type: ignore
+async def delete_item(db: AsyncSession, item_id: int) -> bool:
+    db_item = await _get_item_row(db, item_id)
     if db_item:
-        db.delete(db_item)
-        db.commit()
+        await db.execute(delete(ItemTag).where(ItemTag.item_id == item_id))
+        await db.delete(db_item)
+        await db.commit()
+        catalog_cache.item_deleted(item_id)
+        search_index.item_deleted(item_id)
+        await event_bus.publish(CATALOG_CHANNEL, {"item_id": item_id})
         return True
     return False
 
 
 # Cart services
-def get_cart(db: Session, cart_id: int) -> Optional[Cart]:
-    return db.query(Cart).filter(Cart.id == cart_id).options(
-        joinedload(Cart.items).joinedload(CartItem.item)  # Eagerly load CartItem and Item relationships
-    ).first()  # type: ignore
+async def get_cart(db: AsyncSession, cart_id: int) -> Optional[Cart]:
+    # Eagerly load CartItem and Item relationships (lazy loads are not allowed on AsyncSession).
+    # populate_existing refreshes objects already in the identity map after a mutation.
+    result = await db.execute(
+        select(Cart).where(Cart.id == cart_id)
+        .options(selectinload(Cart.items).selectinload(CartItem.item))
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+
+async def get_cart_version(db: AsyncSession, cart_id: int) -> Optional[tuple]:
+    # What the cart body depends on, from one narrow query: the cart revision (its lines) and, per
+    # line, the item's last update and available stock (which other carts' holds also change)
+    result = await db.execute(
+        select(Cart.revision, CartItem.item_id, func.coalesce(Item.updated_at, Item.created_at), Item.available)
+        .select_from(Cart)
+        .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+        .outerjoin(Item, Item.id == CartItem.item_id)
+        .where(Cart.id == cart_id)
+        .order_by(CartItem.item_id)
+    )
+    rows = result.all()
+    if not rows:
+        return None
+    return rows[0][0], tuple(tuple(row[1:]) for row in rows if row[1] is not None)
 
 
-def get_or_create_cart(db: Session, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Optional[Cart]:
+async def get_cart_data(db: AsyncSession, cart_id: int) -> Optional[dict]:
+    # The Cart schema as plain data, from two column selects (fast serialization path)
+    cart = (await db.execute(
+        select(Cart.id, Cart.user_id, Cart.session_id, Cart.created_at, Cart.updated_at).where(Cart.id == cart_id)
+    )).first()
+    if cart is None:
+        return None
+    result = await db.execute(
+        select(CartItem.id, CartItem.item_id, CartItem.quantity, *ITEM_COLUMNS)
+        .join(Item, Item.id == CartItem.item_id)
+        .where(CartItem.cart_id == cart_id)
+        .order_by(CartItem.id)
+    )
+    data = dict(cart._mapping)
+    data["items"] = [
+        {"id": line_id, "cart_id": cart_id, "item_id": item_id, "quantity": quantity, "item": item_data(values)}
+        for line_id, item_id, quantity, *values in result
+    ]
+    return data
+
+
+async def get_or_create_cart(db: AsyncSession, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Optional[Cart]:
     # Always prefer user_id if present (for authenticated users)
     if user_id:
-        cart = db.query(Cart).filter(Cart.user_id == user_id).first()  # type: ignore
-        if not cart:
-            cart = Cart(user_id=user_id)
-            db.add(cart)
-            db.commit()
-            db.refresh(cart)
-        return cart
+        criteria = Cart.user_id == user_id
     elif session_id:
-        cart = db.query(Cart).filter(Cart.session_id == session_id).first()  # type: ignore
-        if not cart:
-            cart = Cart(session_id=session_id)
-            db.add(cart)
-            db.commit()
-            db.refresh(cart)
-        return cart
+        criteria = Cart.session_id == session_id
     else:
         return None
+    result = await db.execute(
+        select(Cart).where(criteria)
+        .options(selectinload(Cart.items).selectinload(CartItem.item))
+        .execution_options(populate_existing=True)
+    )
+    cart = result.scalars().first()
+    if not cart:
+        cart = Cart(user_id=user_id) if user_id else Cart(session_id=session_id)
+        db.add(cart)
+        await db.commit()
+        # Reload through get_cart so server defaults and the (empty) items collection are populated
+        cart = await get_cart(db, cart.id)
+    return cart
+
+
+def _cart_line(cart_id: int, item_id: int):
+    return and_(CartItem.cart_id == cart_id, CartItem.item_id == item_id)
+
+
+def _touch_carts(cart_ids: List[int]):
+    # Every change to a cart's lines gives the cart a new revision (its ETag changes with it)
+    return (
+        update(Cart)
+        .where(Cart.id.in_(cart_ids))
+        .values(updated_at=func.now(), revision=Cart.revision + 1)
+        .execution_options(synchronize_session=False)
+    )
 
 
-async def add_item_to_cart(db: Session, cart_id: int, item_id: int, quantity: int = 1) -> Optional[str]:
-    # Check if item exists
-    item = db.query(Item).filter(Item.id == item_id).first()  # type: ignore
-    if not item:
+async def _reservation_error(db: AsyncSession, item_id: int) -> str:
+    exists = await db.scalar(select(Item.id).where(Item.id == item_id))
+    await db.rollback()
+    if exists is None:
         return "Item not found"
-    if item.stock < quantity:
-        return "Item is out of stock or not enough stock available"
+    return "Item is out of stock or not enough stock available"
 
-    # Check if cart item already exists
-    cart_item = db.query(CartItem).filter(
-        and_(CartItem.cart_id == cart_id, CartItem.item_id == item_id)  # type: ignore
-    ).first()
 
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        cart_item = CartItem(
-            cart_id=cart_id,
-            item_id=item_id,
-            quantity=quantity
+async def add_item_to_cart(db: AsyncSession, cart_id: int, item_id: int, quantity: int = 1) -> Optional[str]:
+    if quantity is None or quantity < 1:
+        return "Invalid quantity provided"
+    await lock_items(db, [item_id])
+    # Reserve instead of decrementing stock: insert the line (or grow the existing one) only
+    # if the stock not held by other carts covers the whole new line quantity.
+    line_quantity = select(CartItem.quantity).where(_cart_line(cart_id, item_id)).scalar_subquery()
+    candidate = (
+        select(
+            literal(cart_id, Integer), Item.id, literal(quantity, Integer),
+            literal(hold_expiry(), DateTime(timezone=True)),
         )
-        db.add(cart_item)
-
-    # Reduce stock
-    item.stock -= quantity
-    db.commit()
-    db.refresh(cart_item)
+        .where(
+            Item.id == item_id,
+            Item.stock - held_quantity(Item.id, exclude_cart_id=cart_id) >= func.coalesce(line_quantity, 0) + quantity,
+        )
+    )
+    stmt = dialect_insert(db, CartItem).from_select(
+        [CartItem.cart_id, CartItem.item_id, CartItem.quantity, CartItem.reserved_until], candidate
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.cart_id, CartItem.item_id],
+        set_={"quantity": CartItem.quantity + stmt.excluded.quantity, "reserved_until": stmt.excluded.reserved_until},
+    )
+    result = await db.execute(stmt)
+    if not result.rowcount:
+        return await _reservation_error(db, item_id)
+    await db.execute(_touch_carts([cart_id]))
+    available = await available_stock(db, [item_id])
+    await db.commit()
 
-    # Notify clients about the stock update
-    await manager.broadcast(f"Stock updated: Item {item.id} now has {item.stock} units remaining.")
-    await manager.broadcast({"type": "stock_update", "item_id": item.id, "stock": item.stock})
+    # Update the catalog cache and notify clients about the stock update
+    await publish_available(available)
 
     # Log the broadcast message for debugging
-    print(f"Broadcasting stock update: Item {item.id}, Stock {item.stock}")
+    print(f"Broadcasting stock update: Item {item_id}, Stock {available[item_id]}")
 
     return None  # None means success
 
 
-def remove_item_from_cart(db: Session, cart_id: int, item_id: int, quantity: int = None, remove_all: bool = False) -> str:
+async def remove_item_from_cart(db: AsyncSession, cart_id: int, item_id: int, quantity: int = None, remove_all: bool = False) -> str:
     logging.debug(f"Attempting to remove item {item_id} from cart {cart_id} with quantity {quantity} and remove_all={remove_all}")
-    cart_item = db.query(CartItem).filter(
-        and_(CartItem.cart_id == cart_id, CartItem.item_id == item_id)  # type: ignore
-    ).first()
-    item = db.query(Item).filter(Item.id == item_id).first()  # type: ignore
-    if not cart_item or not item:
-        logging.debug("Item not found in cart or item does not exist.")
-        return "Item not found in cart"
-
-    if remove_all:
-        logging.debug(f"Removing all of item {item_id} from cart {cart_id}.")
-        # Restore all stock
-        item.stock += cart_item.quantity
-        db.delete(cart_item)
-    elif quantity is not None and quantity >= cart_item.quantity:
-        logging.debug(f"Removing all of item {item_id} from cart {cart_id} due to quantity >= cart_item.quantity.")
-        # Restore all stock
-        item.stock += cart_item.quantity
-        db.delete(cart_item)
-    elif quantity is not None:
-        logging.debug(f"Reducing quantity of item {item_id} in cart {cart_id} by {quantity}.")
-        cart_item.quantity -= quantity
-        item.stock += quantity
-    else:
-        logging.debug("Invalid quantity: None. Cannot proceed with removal.")
+    if not remove_all and (quantity is None or quantity < 1):
+        logging.debug(f"Invalid quantity: {quantity}. Cannot proceed with removal.")
         return "Invalid quantity provided"
 
-    db.commit()
+    # Removing units releases their hold; Item.stock is not touched
+    reduced = False
+    if not remove_all:
+        # Shrink the line when some of it remains; otherwise fall through and delete it
+        result = await db.execute(
+            update(CartItem)
+            .where(_cart_line(cart_id, item_id), CartItem.quantity > quantity)
+            .values(quantity=CartItem.quantity - quantity)
+            .returning(CartItem.id)
+            .execution_options(synchronize_session=False)
+        )
+        reduced = result.first() is not None
+        if reduced:
+            logging.debug(f"Reducing quantity of item {item_id} in cart {cart_id} by {quantity}.")
+    if not reduced:
+        result = await db.execute(
+            delete(CartItem)
+            .where(_cart_line(cart_id, item_id))
+            .returning(CartItem.id)
+            .execution_options(synchronize_session=False)
+        )
+        if result.first() is None:
+            await db.rollback()
+            logging.debug("Item not found in cart or item does not exist.")
+            return "Item not found in cart"
+        logging.debug(f"Removing all of item {item_id} from cart {cart_id}.")
+
+    await db.execute(_touch_carts([cart_id]))
+    available = await available_stock(db, [item_id])
+    await db.commit()
+    await publish_available(available)
     logging.debug("Item(s) removed from cart successfully.")
     return "Item(s) removed from cart successfully"
 
 
-def remove_all_items_from_cart(db: Session, cart_id: int) -> str:
-    cart_items = db.query(CartItem).filter(CartItem.cart_id == cart_id).all()  # type: ignore
-    for cart_item in cart_items:
-        item = db.query(Item).filter(Item.id == cart_item.item_id).first()  # type: ignore
-        if item:
-            item.stock += cart_item.quantity
-        db.delete(cart_item)
-    db.commit()
+async def apply_cart_operations(db: AsyncSession, cart_id: int, operations) -> Optional[str]:
+    # Apply a list of set/add/remove operations in one transaction: the final quantity per
+    # item is folded in Python, then the cart lines are written with bulk statements.
+    # Touch the cart first: this takes the write lock up front and serializes batches on the same cart
+    touched = await db.execute(_touch_carts([cart_id]).returning(Cart.id))
+    if touched.first() is None:
+        await db.rollback()
+        return "Cart not found"
+    if not operations:
+        await db.commit()
+        return None
+
+    item_ids = list(dict.fromkeys(op.item_id for op in operations))
+    result = await db.execute(
+        select(CartItem.item_id, CartItem.quantity)
+        .where(CartItem.cart_id == cart_id, CartItem.item_id.in_(item_ids))
+    )
+    current = dict(result.all())
+    target = dict(current)
+    for op in operations:
+        quantity = target.get(op.item_id, 0)
+        if op.op == "set":
+            quantity = op.quantity
+        elif op.op == "add":
+            quantity += op.quantity
+        else:
+            quantity = max(quantity - op.quantity, 0)
+        target[op.item_id] = quantity
+    changed = [item_id for item_id in item_ids if target[item_id] != current.get(item_id, 0)]
+    if not changed:
+        await db.commit()
+        return None
+    existing = set((await db.execute(select(Item.id).where(Item.id.in_(changed)))).scalars())
+    missing = [item_id for item_id in changed if item_id not in existing]
+    if missing:
+        await db.rollback()
+        return f"Item {missing[0]} not found"
+
+    # Only growing lines need stock and get a fresh hold; a shrunk line keeps its hold as it is
+    # (like remove_item_from_cart), so shrinking an expired line never fails or revives it
+    renewed = [item_id for item_id in changed if target[item_id] > current.get(item_id, 0)]
+    await lock_items(db, renewed)
+    removed = [item_id for item_id in changed if target[item_id] == 0]
+    shrunk = [item_id for item_id in changed if 0 < target[item_id] < current.get(item_id, 0)]
+    kept = [
+        {"cart_id": cart_id, "item_id": item_id, "quantity": target[item_id], "reserved_until": hold_expiry()}
+        for item_id in renewed
+    ]
+    if removed:
+        await db.execute(delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.item_id.in_(removed)))
+    if shrunk:
+        # executemany on the table: one statement, one parameter set per line
+        await db.execute(
+            update(CartItem.__table__)
+            .where(CartItem.cart_id == cart_id, CartItem.item_id == bindparam("line_item_id"))
+            .values(quantity=bindparam("line_quantity")),
+            [{"line_item_id": item_id, "line_quantity": target[item_id]} for item_id in shrunk],
+        )
+    if kept:
+        stmt = dialect_insert(db, CartItem).values(kept)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.cart_id, CartItem.item_id],
+            set_={"quantity": stmt.excluded.quantity, "reserved_until": stmt.excluded.reserved_until},
+        )
+        await db.execute(stmt)
+
+    # Every grown hold must still fit: no item may end up with more held than in stock
+    available = await available_stock(db, changed)
+    oversold = [item_id for item_id in renewed if available[item_id] < 0]
+    if oversold:
+        await db.rollback()
+        return f"Not enough stock for item {oversold[0]}"
+    await db.commit()
+    await publish_available(available)
+    return None
+
+
+async def clear_carts(db: AsyncSession, cart_ids: List[int]) -> int:
+    # Empty many carts with one DELETE for all their lines; their holds go with them.
+    # Returns the number of lines removed.
+    cart_ids = list(dict.fromkeys(cart_ids))
+    if not cart_ids:
+        return 0
+    result = await db.execute(
+        delete(CartItem)
+        .where(CartItem.cart_id.in_(cart_ids))
+        .returning(CartItem.item_id)
+        .execution_options(synchronize_session=False)
+    )
+    item_ids = result.scalars().all()
+    if item_ids:
+        await db.execute(_touch_carts(cart_ids))
+    available = await available_stock(db, item_ids)
+    await db.commit()
+    await publish_available(available)
+    return len(item_ids)
+
+
+async def get_owned_cart_ids(db: AsyncSession, cart_ids: List[int], user_id: str, session_id: Optional[str] = None) -> List[int]:
+    # The listed carts that belong to the user, or to their (guest) session
+    criteria = Cart.user_id == user_id
+    if session_id:
+        criteria = or_(criteria, Cart.session_id == session_id)
+    result = await db.execute(select(Cart.id).where(Cart.id.in_(cart_ids), criteria))
+    return result.scalars().all()
+
+
+async def remove_all_items_from_cart(db: AsyncSession, cart_id: int) -> str:
+    await clear_carts(db, [cart_id])
     return "All items removed from cart successfully"
 
 
-def update_cart_item_quantity(db: Session, cart_id: int, item_id: int, quantity: int) -> Optional[str]:
-    cart_item = db.query(CartItem).filter(
-        and_(CartItem.cart_id == cart_id, CartItem.item_id == item_id)
-    ).first()
-    item = db.query(Item).filter(Item.id == item_id).first()
-    if not cart_item or not item:
-        return "Item not found in cart"
-    diff = quantity - cart_item.quantity
-    if diff > 0:
-        if item.stock < diff:
-            return "Not enough stock"
-        item.stock -= diff
-    else:
-        item.stock += abs(diff)
+async def update_cart_item_quantity(db: AsyncSession, cart_id: int, item_id: int, quantity: int) -> Optional[str]:
+    if quantity is None or quantity < 0:
+        return "Invalid quantity provided"
     if quantity == 0:
-        db.delete(cart_item)
+        result = await db.execute(
+            delete(CartItem).where(_cart_line(cart_id, item_id)).returning(CartItem.id)
+            .execution_options(synchronize_session=False)
+        )
+        updated = result.first() is not None
     else:
-        cart_item.quantity = quantity
-    db.commit()
+        # Lowering (or keeping) the quantity needs no stock and leaves the hold as it is
+        result = await db.execute(
+            update(CartItem)
+            .where(_cart_line(cart_id, item_id), CartItem.quantity >= quantity)
+            .values(quantity=quantity)
+            .returning(CartItem.id)
+            .execution_options(synchronize_session=False)
+        )
+        updated = result.first() is not None
+        if not updated:
+            await lock_items(db, [item_id])
+            # Grow the line and renew its hold if the stock not held by other carts covers it
+            not_held = select(Item.stock).where(Item.id == item_id).scalar_subquery() - held_quantity(
+                item_id, exclude_cart_id=cart_id
+            )
+            result = await db.execute(
+                update(CartItem)
+                .where(_cart_line(cart_id, item_id), not_held >= quantity)
+                .values(quantity=quantity, reserved_until=hold_expiry())
+                .returning(CartItem.id)
+                .execution_options(synchronize_session=False)
+            )
+            updated = result.first() is not None
+    if not updated:
+        in_cart = await db.scalar(select(CartItem.id).where(_cart_line(cart_id, item_id)))
+        await db.rollback()
+        return "Not enough stock" if in_cart is not None else "Item not found in cart"
+    await db.execute(_touch_carts([cart_id]))
+    available = await available_stock(db, [item_id])
+    await db.commit()
+    await publish_available(available)
     return None
 
 
 # User services (basic)
-def get_user(db: Session, user_id: str) -> Optional[User]:
-    return db.query(User).filter(User.id == user_id).first()  # type: ignore
+async def get_user(db: AsyncSession, user_id: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.id == user_id))
+    return result.scalars().first()
 
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
-    return db.query(User).filter(User.email == email).first()  # type: ignore
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
 
 
-def get_user_by_username_or_email(db: Session, identifier: str) -> Optional[User]:
-    return db.query(User).filter(or_(User.username == identifier, User.email == identifier)).first()  # type: ignore
+async def get_user_by_username_or_email(db: AsyncSession, identifier: str) -> Optional[User]:
+    result = await db.execute(select(User).where(or_(User.username == identifier, User.email == identifier)))
+    return result.scalars().first()
 
 
-def create_user(db: Session, user: UserCreate) -> User:
-    # Site is customer-only. Use fixed prefix 'B' for customer user IDs.
-    prefix = "B"
-    # Get the max existing user id with the same prefix
-    max_id_user = (
-        db.query(User)
-        .filter(User.id.cast(String).like(f"{prefix}%"))
-        .order_by(User.id.desc())
-        .first()
-    )
-    if max_id_user:
-        # Ensure we cast to str in case the ORM returns a ColumnElement; slicing requires a string
-        max_num = int(str(max_id_user.id)[1:])
-        new_num = max_num + 1
-    else:
-        new_num = 1
-    new_id = f"{prefix}{new_num:04d}"
-
+async def authenticate_user(db: AsyncSession, identifier: str, password: str) -> Optional[User]:
+    # Username or email + password -> User, or None; raises PasswordHashingBusy when hashing is saturated
+    user = await get_user_by_username_or_email(db, identifier=identifier)
+    if not user:
+        logging.debug(f"Login failed: user not found for {identifier}")
+        return None
+    matches, new_hash = await password_hasher.verify(password, user.hashed_password)
+    if not matches:
+        logging.debug(f"Login failed: invalid password for {identifier}")
+        return None
+    if new_hash:
+        # Stored with other scrypt parameters than configured: upgrade it while the password is at hand
+        user.hashed_password = new_hash
+        try:
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logging.exception(f"Could not rehash the password of user {user.id}")
+    return user
+
+
+async def create_user(db: AsyncSession, user: UserCreate) -> User:
+    # Ids come in blocks from the id_counters table: no scan of users, no clash between concurrent sign-ups
+    new_id = await user_id_allocator.next_id(db)
+
+    # Hashing is CPU-bound; it runs on the bounded hashing pool (raises PasswordHashingBusy when saturated)
+    hashed_password = await password_hasher.hash(user.password)
     db_user = User(
         id=new_id,
         username=user.username,
         email=user.email,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=hashed_password,
     )
     db.add(db_user)
     try:
-        db.commit()
+        await db.commit()
     except Exception:
         # Ensure the session is rolled back so subsequent queries in the same request
         # are not executed in an aborted transaction.
-        db.rollback()
+        await db.rollback()
         raise
-    db.refresh(db_user)
+    await db.refresh(db_user)
+    # A cached lookup may have resolved one of these identifiers to another user
+    identity_cache.invalidate(db_user.id, db_user.username, db_user.email)
     return db_user
 
 
-def get_orders_for_user(db: Session, user_id: str):
-    return db.query(Order).filter(Order.user_id == user_id).order_by(Order.created_at.desc()).all()
+def _user_orders_query(query, limit: Optional[int], before_id: Optional[int]):
+    if limit is None and before_id is None:
+        return query.order_by(Order.created_at.desc())
+    # Keyset pages walk the primary key backwards: ids are allocated in insertion order,
+    # so id DESC is newest first and each page is an index range scan.
+    if before_id is not None:
+        query = query.where(Order.id < before_id)
+    query = query.order_by(Order.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
 
 
-def get_order_for_user(db: Session, user_id: str, order_id: int):
-    return db.query(Order).filter(Order.user_id == user_id, Order.id == order_id).first()
+async def get_orders_for_user(db: AsyncSession, user_id: str, limit: Optional[int] = None, before_id: Optional[int] = None):
+    query = (
+        select(Order).where(Order.user_id == user_id)
+        .options(selectinload(Order.items).selectinload(OrderItem.item))
+    )
+    return list((await db.execute(_user_orders_query(query, limit, before_id))).scalars().all())
+
+
+async def get_orders_data_for_user(db: AsyncSession, user_id: str, limit: Optional[int] = None,
+                                   before_id: Optional[int] = None) -> List[dict]:
+    # get_orders_for_user as plain data (fast serialization path): one select for the orders,
+    # one for all their lines with the item columns
+    query = select(
+        Order.id, Order.user_id, Order.total_amount, Order.status, Order.created_at, Order.updated_at
+    ).where(Order.user_id == user_id)
+    orders = [dict(row._mapping) for row in await db.execute(_user_orders_query(query, limit, before_id))]
+    if not orders:
+        return []
+    lines = {order["id"]: [] for order in orders}
+    result = await db.execute(
+        select(OrderItem.id, OrderItem.order_id, OrderItem.item_id, OrderItem.quantity, OrderItem.unit_price, *ITEM_COLUMNS)
+        .join(Item, Item.id == OrderItem.item_id)
+        .where(OrderItem.order_id.in_(list(lines)))
+        .order_by(OrderItem.id)
+    )
+    for line_id, order_id, item_id, quantity, unit_price, *values in result:
+        lines[order_id].append({
+            "id": line_id, "order_id": order_id, "item_id": item_id, "quantity": quantity,
+            "unit_price": unit_price, "item": item_data(values),
+        })
+    for order in orders:
+        order["items"] = lines[order["id"]]
+    return orders
+
+
+async def get_order_for_user(db: AsyncSession, user_id: str, order_id: int):
+    result = await db.execute(
+        select(Order).where(Order.user_id == user_id, Order.id == order_id)
+        .options(selectinload(Order.items).selectinload(OrderItem.item))
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
 
 
-async def create_order_from_cart(db: Session, user_id: str):
-    # Ensure cart exists and has items
-    cart = get_or_create_cart(db, user_id=user_id)
-    if not cart or not cart.items:
+async def create_order_from_cart(db: AsyncSession, user_id: str):
+    # Set-based checkout: a fixed number of statements however many lines the cart has
+    cart_id = await db.scalar(select(Cart.id).where(Cart.user_id == user_id).order_by(Cart.id).limit(1))
+    if cart_id is None:
         return None, 'Cart is empty'
-    # Build order
-    total = 0.0
+    # Touch the cart first so concurrent checkouts of the same cart run one after the other
+    await db.execute(_touch_carts([cart_id]))
     order = Order(user_id=user_id, total_amount=0.0, status='completed')
     db.add(order)
-    db.flush()  # get order.id before adding items
-    for ci in cart.items:
-        item = ci.item
-        if not item:
-            continue
-        unit_price = float(item.price or 0.0)
-        quantity = int(ci.quantity or 0)
-        line_total = unit_price * quantity
-        total += line_total
-        oi = OrderItem(order_id=order.id, item_id=item.id, quantity=quantity, unit_price=unit_price)
-        db.add(oi)
-    order.total_amount = total
-    # Clear cart items (stock not restored because already decremented on add)
-    for ci in list(cart.items):
-        db.delete(ci)
-    db.commit()
-    db.refresh(order)
-    return order, None
+    await db.flush()  # get order.id before adding items
+
+    # Copy the cart lines with their current prices into the order
+    lines = (
+        select(literal(order.id), CartItem.item_id, CartItem.quantity, func.coalesce(Item.price, 0.0))
+        .join(Item, Item.id == CartItem.item_id)
+        .where(CartItem.cart_id == cart_id)
+    )
+    result = await db.execute(
+        insert(OrderItem).from_select(
+            [OrderItem.order_id, OrderItem.item_id, OrderItem.quantity, OrderItem.unit_price], lines
+        )
+    )
+    if not result.rowcount:
+        await db.rollback()
+        return None, 'Cart is empty'
+    ordered = select(OrderItem.item_id).where(OrderItem.order_id == order.id)
+    item_ids = (await db.execute(ordered)).scalars().all()
+    await lock_items(db, item_ids)
+    total = (
+        select(func.coalesce(func.sum(OrderItem.quantity * OrderItem.unit_price), 0.0))
+        .where(OrderItem.order_id == order.id)
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(Order).where(Order.id == order.id).values(total_amount=total)
+        .execution_options(synchronize_session=False)
+    )
+    # Stock is committed here: take the ordered quantities and drop the lines (and their holds)
+    ordered_quantity = (
+        select(OrderItem.quantity)
+        .where(OrderItem.order_id == order.id, OrderItem.item_id == Item.id)
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(Item).where(Item.id.in_(ordered)).values(stock=Item.stock - ordered_quantity)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.item_id.in_(ordered)))
+    # A line whose hold expired may no longer fit next to other carts' holds
+    available = await available_stock(db, item_ids)
+    oversold = [item_id for item_id in item_ids if available[item_id] < 0]
+    if oversold:
+        await db.rollback()
+        return None, f'Not enough stock for item {oversold[0]}'
+    await db.commit()
+    await publish_available(available)
+    return await get_order_for_user(db, user_id, order.id), None
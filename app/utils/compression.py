@@ -0,0 +1,107 @@
+import mimetypes
+import os
+from typing import Dict, Tuple
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:  # optional: pip install brotli
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Precompressed variants written next to the originals by scripts/precompress_static.py,
+# in order of preference
+STATIC_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    # Good enough for browsers: "gzip, deflate, br, zstd" (a q=0 entry counts as refused)
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int = 5) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        return data + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+class CompressionMiddleware(GZipMiddleware):
+    # Starlette's gzip middleware (size threshold, Vary, skips responses that already carry a
+    # Content-Encoding such as precompressed static files) plus brotli when it is installed
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000, compresslevel: int = 6, brotli_quality: int = 5) -> None:
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and brotli is not None:
+            if accepts_encoding(Headers(scope=scope).get("accept-encoding", ""), "br"):
+                responder = BrotliResponder(self.app, self.minimum_size, quality=self.brotli_quality)
+                await responder(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves `name.br` / `name.gz` instead of `name` when the client accepts it.
+
+    Variants are indexed once at startup (no extra filesystem probes per request); a variant
+    older than its original is ignored.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.variants: Dict[str, Dict[str, Tuple[str, os.stat_result]]] = {}
+        if self.directory is not None and os.path.isdir(self.directory):
+            self.refresh()
+
+    def refresh(self) -> None:
+        variants: Dict[str, Dict[str, Tuple[str, os.stat_result]]] = {}
+        for root, _, files in os.walk(self.directory):
+            names = set(files)
+            for name in files:
+                for encoding, suffix in STATIC_ENCODINGS:
+                    original = name[:-len(suffix)]
+                    if not name.endswith(suffix) or original not in names:
+                        continue
+                    variant_path = os.path.realpath(os.path.join(root, name))
+                    variant_stat = os.stat(variant_path)
+                    if variant_stat.st_mtime < os.stat(os.path.join(root, original)).st_mtime:
+                        continue
+                    original_path = os.path.realpath(os.path.join(root, original))
+                    variants.setdefault(original_path, {})[encoding] = (variant_path, variant_stat)
+        self.variants = variants
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        # lookup_path() already returns resolved paths, the same form the index uses
+        available = self.variants.get(str(full_path))
+        if not available:
+            return super().file_response(full_path, stat_result, scope, status_code)
+        request_headers = Headers(scope=scope)
+        accept_encoding = request_headers.get("accept-encoding", "")
+        for encoding, _ in STATIC_ENCODINGS:
+            if encoding in available and accepts_encoding(accept_encoding, encoding):
+                variant_path, variant_stat = available[encoding]
+                media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+                response = FileResponse(variant_path, status_code=status_code, stat_result=variant_stat, media_type=media_type)
+                response.headers["Content-Encoding"] = encoding
+                response.headers["Vary"] = "Accept-Encoding"
+                if self.is_not_modified(response.headers, request_headers):
+                    return NotModifiedResponse(response.headers)
+                return response
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
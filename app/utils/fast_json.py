@@ -0,0 +1,22 @@
+from typing import List, Union
+
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import TypeAdapter
+
+from app.schemas.item import Item as ItemSchema
+
+# Fast serialization path (FAST_SERIALIZATION=true): list endpoints return their data
+# serialized in one pass instead of letting FastAPI re-validate it against response_model.
+# Items (already schema objects, possibly from the catalog cache) are dumped by a TypeAdapter
+# built once here; carts and orders are built as plain data from selected columns and written
+# with orjson.
+
+ITEM_LIST_ADAPTER = TypeAdapter(List[ItemSchema])
+
+
+def fast_json_response(content: Union[bytes, list, dict], response: Response) -> Response:
+    # Returning a response bypasses `response`, so carry over the headers the endpoint set on it
+    headers = dict(response.headers)
+    if isinstance(content, bytes):
+        return Response(content, media_type="application/json", headers=headers)
+    return ORJSONResponse(content, headers=headers)
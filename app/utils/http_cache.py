@@ -0,0 +1,40 @@
+import hashlib
+
+from fastapi import Request, Response
+
+# Conditional GET: strong ETags derived from database state, so every worker gives the same
+# data the same ETag. Catalog ETags hash the response body (usually a catalog cache hit, so a
+# 304 costs no database rows); cart ETags hash a version read by one narrow query, and the
+# cart body is only loaded when it does not match.
+
+# Clients may keep a copy but must revalidate it; carts are per user, so never in shared caches
+CATALOG_CACHE_CONTROL = "public, no-cache"
+CART_CACHE_CONTROL = "private, no-cache"
+
+
+def content_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def version_etag(version) -> str:
+    # Any value with a stable repr (ints, strings, datetimes and tuples of them)
+    return content_etag(repr(version).encode())
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison: W/"x" matches "x"
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def set_cache_headers(response: Response, etag: str, cache_control: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
@@ -1,6 +1,8 @@
 import os
 import re
-from typing import Optional
+import time
+from functools import lru_cache
+from typing import Dict, Optional
 
 _slug_regex = re.compile(r'[^a-z0-9]+')
 
@@ -9,6 +11,10 @@ DEFAULT_IMAGE_REL = 'images/items/default.png'
 
 SUPPORTED_EXTS = ['png', 'jpg', 'jpeg', 'webp', 'svg', 'gif']
 
+# How often (seconds) lookups may stat IMAGE_DIR to notice added/removed files
+MANIFEST_CHECK_INTERVAL = 1.0
+
+@lru_cache(maxsize=4096)
 def slugify(name: str) -> str:
     if not name:
         return 'item'
@@ -17,6 +23,61 @@ def slugify(name: str) -> str:
     name = re.sub(r'-{2,}', '-', name).strip('-')
     return name or 'item'
 
+class ImageManifest:
+    # In-memory index of IMAGE_DIR keyed by slug, so resolving a picture is a dict lookup
+    # instead of one os.path.exists per supported extension.
+    def __init__(self, directory: str = IMAGE_DIR):
+        self.directory = directory
+        self._by_slug: Dict[str, str] = {}
+        self._dir_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._loaded = False
+
+    def refresh(self) -> None:
+        by_slug: Dict[str, str] = {}
+        ranks: Dict[str, tuple] = {}
+        try:
+            self._dir_mtime = os.stat(self.directory).st_mtime
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            self._dir_mtime = None
+            entries = []
+        for entry in entries:
+            stem, _, ext = entry.name.rpartition('.')
+            ext = ext.lower()
+            if not stem or ext not in SUPPORTED_EXTS or not entry.is_file():
+                continue
+            slug = slugify(stem)
+            # Prefer a file named exactly <slug>.<ext>, then SUPPORTED_EXTS order
+            rank = (stem != slug, SUPPORTED_EXTS.index(ext), entry.name)
+            if slug not in ranks or rank < ranks[slug]:
+                ranks[slug] = rank
+                by_slug[slug] = f"images/items/{entry.name}"
+        self._by_slug = by_slug
+        self._checked_at = time.monotonic()
+        self._loaded = True
+
+    def _refresh_if_changed(self) -> None:
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < MANIFEST_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.directory).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if not self._loaded or mtime != self._dir_mtime:
+            self.refresh()
+
+    def find(self, name: Optional[str]) -> Optional[str]:
+        # Path (relative to static/) of the image for an item name, or None
+        if not name:
+            return None
+        self._refresh_if_changed()
+        return self._by_slug.get(slugify(name))
+
+image_manifest = ImageManifest()
+
 def normalize_stored_path(pic_path: str) -> str:
     # Normalize any stored DB value to relative path under images/
     if not pic_path:
@@ -34,12 +95,8 @@ def resolve_picture_path(pic_path: Optional[str], name: Optional[str]) -> str:
         normalized = normalize_stored_path(pic_path)
         return normalized
     # 2) Try to infer from slug and available files
-    if name:
-        slug = slugify(name)
-        for ext in SUPPORTED_EXTS:
-            candidate = f"images/items/{slug}.{ext}"
-            if os.path.exists(os.path.join('static', candidate)):
-                return candidate
+    found = image_manifest.find(name)
+    if found:
+        return found
     # 3) Fallback
     return DEFAULT_IMAGE_REL
-
@@ -0,0 +1,180 @@
+import contextvars
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Prometheus text-format metrics for this process (each worker exposes its own /metrics).
+# Counters are plain ints/lists updated without locks: the request path runs on the event
+# loop, and the rare increment from a sync-engine thread may at worst be lost under the GIL.
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+# Sample = (labels, value); a family = (name, type, help, samples)
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, Iterable[Sample]]
+
+# Queries run by the current request (set by MetricsMiddleware, counted by the engine event)
+_request_queries: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_queries", default=None)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot: above the highest bound
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: Dict[str, str]) -> List[Tuple[str, Dict[str, str], float]]:
+        rows = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            rows.append((name + "_bucket", {**labels, "le": format_value(bound)}, cumulative))
+        cumulative += self.counts[-1]
+        rows.append((name + "_bucket", {**labels, "le": "+Inf"}, cumulative))
+        rows.append((name + "_sum", labels, self.sum))
+        rows.append((name + "_count", labels, cumulative))
+        return rows
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.queries_per_request = Histogram(QUERY_COUNT_BUCKETS)
+        self.pool_wait: Dict[str, Histogram] = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, queries: int) -> None:
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+        self.queries_per_request.observe(queries)
+
+    def observe_pool_wait(self, engine: str, seconds: float) -> None:
+        histogram = self.pool_wait.get(engine)
+        if histogram is None:
+            histogram = self.pool_wait[engine] = Histogram(POOL_WAIT_BUCKETS)
+        histogram.observe(seconds)
+
+    def families(self) -> List[Family]:
+        return [
+            ("http_requests_total", "counter", "HTTP requests by route template and status",
+             [({"method": m, "route": r, "status": str(s)}, n) for (m, r, s), n in list(self.requests.items())]),
+            ("http_request_duration_seconds", "histogram", "HTTP request latency, until the response is sent",
+             [({"method": m, "route": r}, h) for (m, r), h in list(self.latency.items())]),
+            ("http_requests_in_flight", "gauge", "HTTP requests being handled", [({}, self.in_flight)]),
+            ("db_queries_per_request", "histogram", "SQL statements executed per HTTP request",
+             [({}, self.queries_per_request)]),
+            ("db_pool_checkout_wait_seconds", "histogram", "Time to get a pooled connection (including opening one)",
+             [({"engine": e}, h) for e, h in list(self.pool_wait.items())]),
+        ]
+
+    def render(self, extra: Iterable[Family] = ()) -> str:
+        lines = []
+        for name, kind, help_text, samples in [*self.families(), *extra]:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                rows = value.samples(name, labels) if isinstance(value, Histogram) else [(name, labels, value)]
+                for row_name, row_labels, row_value in rows:
+                    lines.append(f"{row_name}{format_labels(row_labels)} {format_value(row_value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def count_query(*_args) -> None:
+    # before_cursor_execute listener (registered on every engine in app.db.db)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+def timed_pool_class(pool_class, engine: str):
+    # SQLAlchemy has no event for the start of a checkout, so time the pool's own _do_get
+    class TimedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                metrics.observe_pool_wait(engine, time.perf_counter() - start)
+
+    TimedPool.__name__ = pool_class.__name__
+    return TimedPool
+
+
+def route_label(scope: Scope, root_path: str) -> str:
+    # Route templates (/api/items/{item_id}), not raw paths, keep the label set small
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    mounted = scope.get("root_path", "")
+    if mounted != root_path:
+        return mounted[len(root_path):]  # a mounted app, e.g. /static
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    # Pure ASGI: times each HTTP request and counts its SQL statements; no Request objects, no locks
+    def __init__(self, app: ASGIApp, registry: Metrics = metrics) -> None:
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        registry = self.registry
+        root_path = scope.get("root_path", "")
+        queries = [0]
+        token = _request_queries.set(queries)
+        status = 500  # unless a response starts
+        registry.in_flight += 1
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.in_flight -= 1
+            _request_queries.reset(token)
+            registry.observe_request(scope["method"], route_label(scope, root_path), status,
+                                     time.perf_counter() - start, queries[0])
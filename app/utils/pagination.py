@@ -0,0 +1,22 @@
+import base64
+import json
+
+# Opaque keyset-pagination cursors: base64url-encoded JSON of the last row's sort key.
+# Clients must treat them as opaque and pass them back unchanged via ?cursor=.
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+def encode_cursor(key: dict) -> str:
+    raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> dict:
+    # Raises ValueError for anything that is not a cursor we produced
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception as exc:
+        raise ValueError('Invalid cursor') from exc
+    if not isinstance(key, dict) or not isinstance(key.get('id'), int):
+        raise ValueError('Invalid cursor')
+    return key
@@ -0,0 +1,211 @@
+import json
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, select
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db.db import AsyncSessionLocal, dialect_insert
+from app.models.server_session import ServerSession
+
+logger = logging.getLogger("app.utils.sessions")
+
+# Server-side sessions: the cookie carries an opaque random id, the data lives in a store.
+# A session is written back only when it changed, or when its last write is older than the
+# touch interval (which also slides its expiry), instead of on every response.
+
+
+class SessionRecord(NamedTuple):
+    data: dict
+    touched_at: float
+
+
+class Session(dict):
+    # request.session; remembers whether it was changed. In-place changes of nested values
+    # (session["x"].append(...)) are not seen: assign the key again.
+    modified = False
+
+    def __setitem__(self, key, value):
+        self.modified = True
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.modified = True
+        super().__delitem__(key)
+
+    def clear(self):
+        self.modified = True
+        super().clear()
+
+    def pop(self, key, *default):
+        self.modified = True
+        return super().pop(key, *default)
+
+    def popitem(self):
+        self.modified = True
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.modified = True
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self.modified = True
+        super().update(*args, **kwargs)
+
+
+class MemorySessionStore:
+    # Per-process LRU with idle expiry; sessions are lost on restart and not shared between workers
+    def __init__(self, ttl_seconds: float, max_entries: int = 100000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._sessions: "OrderedDict[str, Tuple[float, SessionRecord]]" = OrderedDict()
+
+    async def get(self, session_id: str) -> Optional[SessionRecord]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return entry[1]
+
+    async def set(self, session_id: str, data: dict) -> None:
+        now = time.time()
+        self._sessions[session_id] = (now + self.ttl_seconds, SessionRecord(dict(data), now))
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+
+    async def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+
+class TableSessionStore:
+    # Sessions in the `sessions` table (SQLite or Postgres): shared by all workers, kept across restarts
+    def __init__(self, ttl_seconds: float, session_factory=AsyncSessionLocal, prune_every: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.session_factory = session_factory
+        self.prune_every = prune_every
+        self._writes = 0
+
+    async def get(self, session_id: str) -> Optional[SessionRecord]:
+        async with self.session_factory() as db:
+            row = (await db.execute(
+                select(ServerSession.data, ServerSession.expires_at)
+                .where(ServerSession.id == session_id, ServerSession.expires_at > time.time())
+            )).first()
+        if row is None:
+            return None
+        return SessionRecord(json.loads(row.data), row.expires_at - self.ttl_seconds)
+
+    async def set(self, session_id: str, data: dict) -> None:
+        values = {"id": session_id, "data": json.dumps(data), "expires_at": time.time() + self.ttl_seconds}
+        async with self.session_factory() as db:
+            stmt = dialect_insert(db, ServerSession).values(values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ServerSession.id],
+                set_={"data": stmt.excluded.data, "expires_at": stmt.excluded.expires_at},
+            )
+            await db.execute(stmt)
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                await db.execute(delete(ServerSession).where(ServerSession.expires_at <= time.time()))
+            await db.commit()
+
+    async def delete(self, session_id: str) -> None:
+        async with self.session_factory() as db:
+            await db.execute(delete(ServerSession).where(ServerSession.id == session_id))
+            await db.commit()
+
+
+def create_session_store(backend: str, ttl_seconds: float, max_entries: int):
+    if backend == "table":
+        return TableSessionStore(ttl_seconds)
+    return MemorySessionStore(ttl_seconds, max_entries=max_entries)
+
+
+class ServerSessionMiddleware:
+    # Drop-in for Starlette's SessionMiddleware (request.session is a dict) backed by a session store
+    def __init__(
+        self,
+        app: ASGIApp,
+        store,
+        session_cookie: str = "session",
+        max_age: int = 14 * 24 * 60 * 60,
+        same_site: str = "lax",
+        https_only: bool = False,
+        touch_seconds: float = 300.0,
+        skip_paths: Tuple[str, ...] = ("/static", "/health"),
+        rotate_keys: Tuple[str, ...] = ("username",),
+    ) -> None:
+        self.app = app
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.touch_seconds = touch_seconds
+        self.skip_paths = skip_paths
+        self.rotate_keys = rotate_keys  # auth state: a change gets a new session id (no fixation)
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+
+    def _skipped(self, path: str) -> bool:
+        return any(path == prefix or path.startswith(prefix + "/") for prefix in self.skip_paths)
+
+    def _cookie(self, value: str, max_age: int) -> str:
+        return f"{self.session_cookie}={value}; path=/; Max-Age={max_age}; {self.security_flags}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        if self._skipped(scope["path"]):
+            # Static files and health checks never need the session: no lookup, no cookie
+            scope["session"] = Session()
+            await self.app(scope, receive, send)
+            return
+
+        session_id = HTTPConnection(scope).cookies.get(self.session_cookie)
+        record = await self.store.get(session_id) if session_id else None
+        session = Session(record.data if record else {})
+        scope["session"] = session
+        if scope["type"] == "websocket":
+            # Read-only: there is no response to carry a cookie
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                cookie = await self._save(session_id, record, session)
+                if cookie:
+                    MutableHeaders(scope=message).append("Set-Cookie", cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _save(self, session_id: Optional[str], record: Optional[SessionRecord], session: Session) -> Optional[str]:
+        # Returns the Set-Cookie value to send, if any
+        if not session:
+            if record is not None:
+                await self.store.delete(session_id)
+                return self._cookie("null", 0)
+            return None
+        if record is not None and any(record.data.get(key) != session.get(key) for key in self.rotate_keys):
+            # Logged in or out: never keep an id that existed before (it may have been planted)
+            await self.store.delete(session_id)
+            record = None
+        if record is None:
+            session_id = secrets.token_urlsafe(32)
+        elif not session.modified and time.time() - record.touched_at < self.touch_seconds:
+            return None
+        await self.store.set(session_id, dict(session))
+        # Re-sent with every write so the cookie expiry slides with the stored session
+        return self._cookie(session_id, self.max_age)
@@ -1,19 +1,183 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import List
+import asyncio
+import json
+import logging
+from typing import Dict, Iterable, Optional, Set, Union
+
+from fastapi import WebSocket
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.websocket_manager")
+
+SLOW_CLIENT_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+
+class ClientConnection:
+    # One watcher: a bounded outbound queue drained by its own writer task, so a slow or
+    # dead client only ever delays itself.
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        # Item ids this client watches; None until it subscribes (then it gets every stock change)
+        self.subscriptions: Optional[Set[int]] = None
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, queue_size: int = 100, slow_client_policy: str = "drop_oldest", coalesce_seconds: float = 0.0,
+                 max_subscriptions: int = 1000):
+        if slow_client_policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy: {slow_client_policy}")
+        self.queue_size = queue_size
+        self.slow_client_policy = slow_client_policy
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.dropped_messages = 0
+        self.slow_disconnects = 0
+        # Per-item subscriber index; clients that never subscribed are in _watch_all
+        self.max_subscriptions = max_subscriptions
+        self._subscribers: Dict[int, Set[ClientConnection]] = {}
+        self._watch_all: Set[ClientConnection] = set()
+        # Stock changes buffered per item until the coalescing window closes
+        self.coalesce_seconds = coalesce_seconds
+        self._pending_stock: Dict[int, int] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_loop: Optional[asyncio.AbstractEventLoop] = None
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        connection = ClientConnection(websocket, self.queue_size)
+        connection.writer = asyncio.create_task(self._write(connection))
+        self.active_connections[websocket] = connection
+        self._watch_all.add(connection)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        connection = self.active_connections.pop(websocket, None)
+        if connection is None:
+            return
+        self._unindex(connection)
+        self._watch_all.discard(connection)
+        if connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    def _unindex(self, connection: ClientConnection):
+        for item_id in connection.subscriptions or ():
+            subscribers = self._subscribers.get(item_id)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self._subscribers[item_id]
+
+    def subscribe(self, websocket: WebSocket, item_ids: Iterable[int]):
+        # Replace the client's watched items; from now on it only gets stock for these
+        connection = self.active_connections.get(websocket)
+        if connection is None:
+            return
+        self._unindex(connection)
+        self._watch_all.discard(connection)
+        connection.subscriptions = set(list(item_ids)[:self.max_subscriptions])
+        for item_id in connection.subscriptions:
+            self._subscribers.setdefault(item_id, set()).add(connection)
+
+    def handle_client_message(self, websocket: WebSocket, message: str):
+        # Clients only send {"subscribe": [item_ids]}; anything else is ignored
+        try:
+            data = json.loads(message)
+            if not isinstance(data["subscribe"], list):
+                raise TypeError("subscribe must be a list")  # a string would subscribe to its digits
+            item_ids = [int(item_id) for item_id in data["subscribe"]]
+        except (ValueError, TypeError, KeyError):
+            logger.debug("Ignoring unexpected websocket message")
+            return
+        self.subscribe(websocket, item_ids)
+
+    async def _write(self, connection: ClientConnection):
+        while True:
+            message = await connection.queue.get()
+            try:
+                await connection.websocket.send_text(message)
+            except Exception as exc:
+                # Dead socket: forget it; the endpoint's receive loop ends on its own
+                logger.debug(f"Dropping websocket after failed send: {exc}")
+                self.disconnect(connection.websocket)
+                return
+
+    def _enqueue(self, connection: ClientConnection, message: str):
+        try:
+            connection.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        self.dropped_messages += 1
+        connection.dropped += 1
+        if self.slow_client_policy == "drop_oldest":
+            connection.queue.get_nowait()
+            connection.queue.put_nowait(message)
+        elif self.slow_client_policy == "disconnect":
+            self.slow_disconnects += 1
+            self.disconnect(connection.websocket)
+            # 1013: try again later
+            asyncio.create_task(self._close(connection.websocket, code=1013))
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    def _fan_out(self, message: str):
+        for connection in list(self.active_connections.values()):
+            self._enqueue(connection, message)
+
+    async def broadcast(self, message: Union[str, dict]):
+        # Non-blocking fan-out: serialize once and enqueue for every connection; the writer
+        # tasks do the sending, so the caller never waits for a client.
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        self._fan_out(message)
+
+    def stock_changed(self, item_id: int, stock: int):
+        # Keep only the latest stock per item; one stock_batch message goes out per window
+        self._pending_stock[item_id] = stock
+        if self.coalesce_seconds <= 0:
+            self.flush_stock()
+            return
+        loop = asyncio.get_running_loop()
+        if self._flush_handle is None or self._flush_loop is not loop:
+            self._flush_loop = loop
+            self._flush_handle = loop.call_later(self.coalesce_seconds, self.flush_stock)
+
+    def flush_stock(self):
+        self._flush_handle = None
+        if not self._pending_stock:
+            return
+        items, self._pending_stock = self._pending_stock, {}
+        if self._watch_all:
+            message = json.dumps({"type": "stock_batch", "items": items})
+            for connection in list(self._watch_all):
+                self._enqueue(connection, message)
+        # Subscribed clients get only the items they watch
+        per_connection: Dict[ClientConnection, Dict[int, int]] = {}
+        for item_id, stock in items.items():
+            for connection in self._subscribers.get(item_id, ()):
+                per_connection.setdefault(connection, {})[item_id] = stock
+        for connection, watched in per_connection.items():
+            if connection.websocket in self.active_connections:
+                self._enqueue(connection, json.dumps({"type": "stock_batch", "items": watched}))
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.active_connections),
+            "queued": sum(c.queue.qsize() for c in self.active_connections.values()),
+            "dropped_messages": self.dropped_messages,
+            "slow_disconnects": self.slow_disconnects,
+            "watched_items": len(self._subscribers),
+        }
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
 
-manager = ConnectionManager()
+manager = ConnectionManager(
+    queue_size=settings.ws_send_queue_size,
+    slow_client_policy=settings.ws_slow_client_policy,
+    coalesce_seconds=settings.stock_update_coalesce_seconds,
+    max_subscriptions=settings.ws_max_subscriptions,
+)
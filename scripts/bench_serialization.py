@@ -0,0 +1,85 @@
+"""Compare the default and the fast (FAST_SERIALIZATION) serialization paths of GET /api/items.
+
+Builds a throwaway SQLite catalog of 10k items and times full requests through the app, with the
+catalog cache off (rows read and built on every request) and on (cached schema objects).
+
+Usage (from project root):
+  python scripts/bench_serialization.py [item_count] [repeats]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+DB_DIR = tempfile.mkdtemp(prefix="bench-serialization-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ["CATALOG_CACHE_MAX_ITEMS"] = "100000"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db.db import Base, engine  # noqa: E402
+from app.db.migrations import run_migrations  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.item import Item  # noqa: E402
+from app.services.catalog_cache import catalog_cache  # noqa: E402
+
+
+def populate(count: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    rows = [
+        {
+            "name": f"Item {i}",
+            "description": f"Description of item {i}, long enough to look like a real one.",
+            "price": 1.0 + i % 100,
+            "stock": 100,
+            "tags": "demo,bench,tag-%d" % (i % 50),
+        }
+        for i in range(count)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Item), rows)
+
+
+def time_requests(client: TestClient, url: str, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return statistics.median(timings) * 1000
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    populate(count)
+    client = TestClient(app)
+    url = f"/api/items/?limit={count}"
+    ttl = catalog_cache.ttl_seconds
+
+    print(f"GET {url} ({count} items, median of {repeats} requests)")
+    for cached in (False, True):
+        catalog_cache.ttl_seconds = ttl if cached else 0
+        results = {}
+        for fast in (False, True):
+            settings.fast_serialization = fast
+            catalog_cache.clear()
+            client.get(url)  # warm-up (fills the cache when it is on)
+            results[fast] = time_requests(client, url, repeats)
+        label = "catalog cache on " if cached else "catalog cache off"
+        print(f"  {label}: default {results[False]:8.1f} ms   fast {results[True]:8.1f} ms   "
+              f"({results[False] / results[True]:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@ from app.models.cart_item import CartItem  # noqa: E402
 from app.models.cart import Cart  # noqa: E402
 from app.models.order_item import OrderItem  # noqa: E402
 from app.models.order import Order  # noqa: E402
+from app.models.item_tag import ItemTag  # noqa: E402
+from app.db.migrations import backfill_item_tags  # noqa: E402
 # Note: If you are using relationships that require User metadata during population,
 # you can import it here: from app.models.user import User  # noqa: E402
 
@@ -88,7 +90,7 @@ def random_stock():
 
 def clear_tables(db):
     """Clear dependent tables in proper FK order to avoid violations."""
-    # Order: cart_items -> carts -> order_items -> orders -> items
+    # Order: cart_items -> carts -> order_items -> orders -> item_tags -> items
     # (Actually orders/order_items reference items, so we must delete order_items first, then orders, then items.)
     try:
         db.query(CartItem).delete()
@@ -99,6 +101,8 @@ def clear_tables(db):
         db.commit()
         db.query(Order).delete()
         db.commit()
+        db.query(ItemTag).delete()
+        db.commit()
         db.query(Item).delete()
         db.commit()
     except Exception as e:
@@ -117,6 +121,9 @@ def insert_items(db):
             tags=item["tags"],
         )
         db.add(db_item)
+    db.flush()
+    # Keep the normalized tags/item_tags tables in sync with the comma-separated tags
+    backfill_item_tags(db.connection())
     db.commit()
 
 
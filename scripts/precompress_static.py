@@ -0,0 +1,70 @@
+"""Write .gz (and .br, when brotli is installed) variants next to compressible files under static/.
+
+The /static mount serves them instead of the originals to clients that accept the encoding.
+Run it whenever static files change; deployments run it as their build step (see README):
+
+  python scripts/precompress_static.py [--min-size 512]
+
+Variants that are not at least 5% smaller than the original are not written (and stale ones are removed).
+"""
+import argparse
+import gzip
+import os
+import sys
+
+try:  # optional: pip install brotli
+    import brotli
+except ImportError:
+    brotli = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(PROJECT_ROOT, "static")
+
+# Images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".json", ".svg", ".html", ".txt", ".xml", ".map", ".ico"}
+
+
+def write_variant(path: str, suffix: str, data: bytes, original_size: int) -> bool:
+    variant = path + suffix
+    if len(data) > original_size * 0.95:
+        if os.path.exists(variant):
+            os.remove(variant)
+        return False
+    with open(variant, "wb") as f:
+        f.write(data)
+    # Same mtime as the original: the static mount ignores variants older than their original
+    stat_result = os.stat(path)
+    os.utime(variant, (stat_result.st_atime, stat_result.st_mtime))
+    return True
+
+
+def precompress(directory: str, min_size: int) -> int:
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                raw = f.read()
+            if len(raw) < min_size:
+                continue
+            written += write_variant(path, ".gz", gzip.compress(raw, compresslevel=9, mtime=0), len(raw))
+            if brotli is not None:
+                written += write_variant(path, ".br", brotli.compress(raw, quality=11), len(raw))
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompress static assets")
+    parser.add_argument("--dir", default=STATIC_DIR)
+    parser.add_argument("--min-size", type=int, default=512, help="skip files smaller than this (bytes)")
+    args = parser.parse_args()
+    written = precompress(args.dir, args.min_size)
+    if brotli is None:
+        print("brotli not installed: only .gz variants were written", file=sys.stderr)
+    print(f"Wrote {written} precompressed file(s) under {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import pytest
+
+from app.main import app
+from tests.support import drop_test_database, prepare_test_database
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_database():
+    prepare_test_database(app)
+    yield
+    drop_test_database(app)
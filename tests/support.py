@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.db.db import Base, create_async_db_engine, get_async_db, get_db
+from app.db.migrations import run_migrations
+
+# All test modules share one throwaway SQLite database: never DATABASE_URL, never the tracked test.db
+TEST_DB_DIR = tempfile.mkdtemp(prefix="shop-tests-")
+TEST_DATABASE_URL = f"sqlite:///{os.path.join(TEST_DB_DIR, 'test.db')}"
+
+engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_db_engine(TEST_DATABASE_URL)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()  # type: ignore
+
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+def prepare_test_database(app) -> None:
+    # Same schema as production: create the tables, then apply the migrations
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+
+
+def drop_test_database(app) -> None:
+    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_async_db, None)
+    engine.dispose()
+    shutil.rmtree(TEST_DB_DIR, ignore_errors=True)
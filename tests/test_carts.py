@@ -1,34 +1,14 @@
-import os
+import asyncio
 import unittest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 from app.main import app
-from app.db.db import Base, get_db
-
-# Ensure test.db exists
-TEST_DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'test.db')
-if not os.path.exists(TEST_DB_PATH):
-    open(TEST_DB_PATH, 'a').close()
-
-# Use SQLite for testing
-TEST_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
-
-engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Recreate schema to ensure it's up-to-date with models
-# Base.metadata.drop_all(bind=engine)  # Commented out for safety on real DB
-Base.metadata.create_all(bind=engine)
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()  # type: ignore
-
-app.dependency_overrides[get_db] = override_get_db
+from app.core.config import settings
+from app.db.db import Base
+from app.services.catalog_cache import catalog_cache
+from app.services.reservations import release_expired_holds
+from app.services.shop_services import add_item_to_cart
+from tests.support import TestingAsyncSessionLocal, async_engine, engine
 
 client = TestClient(app)
 
@@ -147,6 +127,202 @@ class TestCartsAPI(unittest.TestCase):
         data = response.json()
         self.assertEqual(data["id"], cart_id)
 
+    def test_cart_etag_changes_with_its_lines(self):
+        headers = self.authenticate()
+        item_id = client.post("/api/items/", json={"name": "Cart Item", "price": 5.99}, headers=headers).json()["id"]
+        cart_id = client.post("/api/carts/?session_id=test_session", headers=headers).json()["id"]
+        response = client.get(f"/api/carts/{cart_id}")
+        etag = response.headers["ETag"]
+        self.assertEqual(response.headers["Cache-Control"], "private, no-cache")
+        self.assertEqual(client.get(f"/api/carts/{cart_id}", headers={"If-None-Match": etag}).status_code, 304)
+        client.post(f"/api/carts/{cart_id}/items", json={"item_id": item_id, "quantity": 1}, headers=headers)
+        response = client.get(f"/api/carts/{cart_id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(len(response.json()["items"]), 1)
+        # Another cart holding the same item changes the embedded stock, and so the ETag
+        etag = response.headers["ETag"]
+        self.assertEqual(client.get(f"/api/carts/{cart_id}", headers={"If-None-Match": etag}).status_code, 304)
+        other_id = client.post("/api/carts/?session_id=etag_other", headers=headers).json()["id"]
+        client.post(f"/api/carts/{other_id}/items", json={"item_id": item_id, "quantity": 1}, headers=headers)
+        self.assertEqual(client.get(f"/api/carts/{cart_id}", headers={"If-None-Match": etag}).status_code, 200)
+        client.delete(f"/api/carts/{other_id}/items/{item_id}?quantity=1", headers=headers)
+
+    def test_batch_cart_operations(self):
+        headers = self.authenticate()
+        first_id = client.post("/api/items/", json={"name": "Batch One", "price": 1.0}, headers=headers).json()["id"]
+        second_id = client.post("/api/items/", json={"name": "Batch Two", "price": 2.0}, headers=headers).json()["id"]
+        cart_id = client.post("/api/carts/?session_id=test_session", headers=headers).json()["id"]
+        client.post(f"/api/carts/{cart_id}/items", json={"item_id": first_id, "quantity": 2}, headers=headers)
+        stock = client.get(f"/api/items/{second_id}").json()["stock"]
+
+        operations = [
+            {"op": "add", "item_id": first_id, "quantity": 3},
+            {"op": "set", "item_id": second_id, "quantity": 4},
+            {"op": "remove", "item_id": second_id, "quantity": 1},
+        ]
+        response = client.post(f"/api/carts/{cart_id}/items:batch", json={"operations": operations}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        quantities = {line["item_id"]: line["quantity"] for line in response.json()["items"]}
+        self.assertEqual(quantities, {first_id: 5, second_id: 3})
+        self.assertEqual(client.get(f"/api/items/{second_id}").json()["stock"], stock - 3)
+
+        # All-or-nothing: one failing operation leaves the cart and stock untouched
+        operations = [
+            {"op": "set", "item_id": first_id, "quantity": 0},
+            {"op": "add", "item_id": second_id, "quantity": stock * 10},
+        ]
+        response = client.post(f"/api/carts/{cart_id}/items:batch", json={"operations": operations}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        quantities = {line["item_id"]: line["quantity"] for line in client.get(f"/api/carts/{cart_id}").json()["items"]}
+        self.assertEqual(quantities, {first_id: 5, second_id: 3})
+        self.assertEqual(client.get(f"/api/items/{second_id}").json()["stock"], stock - 3)
+
+    def test_shrinking_an_expired_line_keeps_it_expired(self):
+        headers = self.authenticate()
+        item_id = client.post("/api/items/", json={"name": "Scarce Item", "price": 1.0}, headers=headers).json()["id"]
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE items SET stock = 5 WHERE id = :id"), {"id": item_id})
+        catalog_cache.clear()
+        first_cart = client.post("/api/carts/?session_id=expired_hold", headers=headers).json()["id"]
+        client.post(f"/api/carts/{first_cart}/items", json={"item_id": item_id, "quantity": 4}, headers=headers)
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE cart_items SET reserved_until = '2000-01-01 00:00:00' WHERE cart_id = :id"), {"id": first_cart})
+        # The expired hold no longer counts, so another cart can take 4 of the 5
+        second_cart = client.post("/api/carts/?session_id=live_hold", headers=headers).json()["id"]
+        response = client.post(f"/api/carts/{second_cart}/items", json={"item_id": item_id, "quantity": 4}, headers=headers)
+        self.assertEqual(response.status_code, 200, response.text)
+
+        # Shrinking needs no stock, so it succeeds, and the hold stays expired (it is not revived)
+        operations = [{"op": "remove", "item_id": item_id, "quantity": 1}]
+        response = client.post(f"/api/carts/{first_cart}/items:batch", json={"operations": operations}, headers=headers)
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["items"][0]["quantity"], 3)
+        response = client.put(f"/api/carts/{first_cart}/items/{item_id}?quantity=2", headers=headers)
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(client.get(f"/api/items/{item_id}").json()["stock"], 1)
+        # Growing it again needs the stock, which the other cart now holds
+        response = client.put(f"/api/carts/{first_cart}/items/{item_id}?quantity=3", headers=headers)
+        self.assertEqual(response.status_code, 400)
+        operations = [{"op": "add", "item_id": item_id, "quantity": 1}]
+        response = client.post(f"/api/carts/{first_cart}/items:batch", json={"operations": operations}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_clear_many_carts_restores_stock(self):
+        headers = self.authenticate()
+        item_ids = [
+            client.post("/api/items/", json={"name": f"Clear Item {i}", "price": 1.0}, headers=headers).json()["id"]
+            for i in range(2)
+        ]
+        stock = client.get(f"/api/items/{item_ids[0]}").json()["stock"]
+        # The user's own cart plus the guest cart of the session they are browsing with
+        user_cart_id = client.post("/api/carts/?user_id=testuser").json()["id"]
+        client.delete(f"/api/carts/{user_cart_id}/items", headers=headers)
+        guest = TestClient(app, base_url="https://testserver")  # the session cookie is secure-only
+        cart_ids = [user_cart_id, guest.post("/api/carts/").json()["id"]]
+        for cart_id in cart_ids:
+            for item_id in item_ids:
+                client.post(f"/api/carts/{cart_id}/items", json={"item_id": item_id, "quantity": 2}, headers=headers)
+        self.assertEqual(client.get(f"/api/items/{item_ids[0]}").json()["stock"], stock - 4)
+
+        # Somebody else's cart cannot be cleared, not even alongside the caller's own
+        other_cart_id = client.post("/api/carts/?session_id=clear_other").json()["id"]
+        client.post(f"/api/carts/{other_cart_id}/items", json={"item_id": item_ids[0], "quantity": 1}, headers=headers)
+        response = guest.post("/api/carts/clear", json={"cart_ids": [*cart_ids, other_cart_id]}, headers=headers)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(client.delete(f"/api/carts/{other_cart_id}/items", headers=headers).status_code, 403)
+        self.assertEqual(len(client.get(f"/api/carts/{other_cart_id}").json()["items"]), 1)
+        # An admin may clear any carts
+        settings.admin_usernames = "testuser"
+        try:
+            response = client.post("/api/carts/clear", json={"cart_ids": [other_cart_id]}, headers=headers)
+        finally:
+            settings.admin_usernames = ""
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["removed_lines"], 1)
+
+        response = guest.post("/api/carts/clear", json={"cart_ids": cart_ids}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["removed_lines"], 4)
+        for cart_id in cart_ids:
+            self.assertEqual(client.get(f"/api/carts/{cart_id}").json()["items"], [])
+        for item_id in item_ids:
+            self.assertEqual(client.get(f"/api/items/{item_id}").json()["stock"], stock)
+
+        # Single-cart clear goes through the same path
+        client.post(f"/api/carts/{cart_ids[0]}/items", json={"item_id": item_ids[0], "quantity": 3}, headers=headers)
+        self.assertEqual(client.delete(f"/api/carts/{cart_ids[0]}/items").status_code, 401)
+        response = client.delete(f"/api/carts/{cart_ids[0]}/items", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get(f"/api/items/{item_ids[0]}").json()["stock"], stock)
+
+    def test_reservations_expire_and_checkout_commits_stock(self):
+        headers = self.authenticate()
+        item_id = client.post("/api/items/", json={"name": "Held Item", "price": 2.0}, headers=headers).json()["id"]
+        stock = client.get(f"/api/items/{item_id}").json()["stock"]
+        cart_id = client.post("/api/carts/?user_id=testuser", headers=headers).json()["id"]
+        client.post(f"/api/carts/{cart_id}/items", json={"item_id": item_id, "quantity": 3}, headers=headers)
+        self.assertEqual(client.get(f"/api/items/{item_id}").json()["stock"], stock - 3)
+
+        # Let the hold expire; the sweeper releases it and publishes the freed stock
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE cart_items SET reserved_until = '2000-01-01 00:00:00' WHERE cart_id = :id"), {"id": cart_id})
+
+        async def sweep():
+            try:
+                async with TestingAsyncSessionLocal() as db:
+                    return await release_expired_holds(db, batch_size=10)
+            finally:
+                await async_engine.dispose()
+
+        self.assertEqual(asyncio.run(sweep()), 1)
+        self.assertEqual(client.get(f"/api/items/{item_id}").json()["stock"], stock)
+        self.assertEqual(len(client.get(f"/api/carts/{cart_id}").json()["items"]), 1)
+
+        # Checkout is where stock is actually taken
+        response = client.post("/api/orders/checkout", headers=headers)
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(client.get(f"/api/items/{item_id}").json()["stock"], stock - 3)
+        with engine.connect() as conn:
+            on_hand = conn.execute(text("SELECT stock FROM items WHERE id = :id"), {"id": item_id}).scalar_one()
+        self.assertEqual(on_hand, stock - 3)
+
+    def test_concurrent_adds_never_oversell(self):
+        headers = self.authenticate()
+        item_response = client.post("/api/items/", json={"name": "Limited Item", "price": 1.0}, headers=headers)
+        item_id = item_response.json()["id"]
+        cart_id = client.post("/api/carts/?session_id=test_session", headers=headers).json()["id"]
+        stock = client.get(f"/api/items/{item_id}").json()["stock"]
+
+        async def add_one():
+            async with TestingAsyncSessionLocal() as db:
+                return await add_item_to_cart(db, cart_id=cart_id, item_id=item_id, quantity=1)
+
+        async def add_concurrently():
+            try:
+                return await asyncio.gather(*(add_one() for _ in range(stock + 150)))
+            finally:
+                # Close the pooled connections opened on this event loop
+                await async_engine.dispose()
+
+        errors = asyncio.run(add_concurrently())
+        self.assertEqual(sum(1 for error in errors if error is None), stock)
+        with engine.connect() as conn:
+            remaining = conn.execute(text("SELECT stock FROM items WHERE id = :id"), {"id": item_id}).scalar_one()
+            lines = conn.execute(
+                text("SELECT quantity FROM cart_items WHERE cart_id = :cart_id AND item_id = :item_id"),
+                {"cart_id": cart_id, "item_id": item_id},
+            ).scalars().all()
+        # Adds only reserve: on-hand stock is untouched and everything is held by the cart
+        self.assertEqual(remaining, stock)
+        self.assertEqual(lines, [stock])
+        self.assertEqual(client.get(f"/api/items/{item_id}").json()["stock"], 0)
+
+        # Partial removal gives exactly that quantity back
+        response = client.delete(f"/api/carts/{cart_id}/items/{item_id}?quantity=20", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get(f"/api/items/{item_id}").json()["stock"], 20)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,57 @@
+import time
+import unittest
+from datetime import datetime
+
+from app.schemas.item import Item
+from app.services.catalog_cache import CatalogCache
+
+
+def make_item(item_id, stock=10):
+    return Item(id=item_id, name=f"Item {item_id}", price=1.0, stock=stock, created_at=datetime.now())
+
+
+class TestCatalogCache(unittest.TestCase):
+
+    def test_page_reflects_stock_patch(self):
+        cache = CatalogCache(ttl_seconds=60, max_items=10)
+        cache.put_page(("offset", 0, 100), [make_item(1), make_item(2)])
+        cache.patch_stock(2, 3)
+        page = cache.get_page(("offset", 0, 100))
+        self.assertEqual([i.stock for i in page], [10, 3])
+        self.assertEqual(cache.get_item(2).stock, 3)
+
+    def test_rows_loaded_before_a_write_are_not_stored(self):
+        cache = CatalogCache(ttl_seconds=60, max_items=10)
+        version = cache.version
+        cache.patch_stock(1, 3)  # commits while the (older) row is being loaded
+        cache.put_item(make_item(1), version)
+        cache.put_page(("offset", 0, 100), [make_item(1)], version)
+        self.assertIsNone(cache.get_item(1))
+        self.assertIsNone(cache.get_page(("offset", 0, 100)))
+        cache.put_item(make_item(1, stock=3), cache.version)
+        self.assertEqual(cache.get_item(1).stock, 3)
+
+    def test_lru_eviction_invalidates_page(self):
+        cache = CatalogCache(ttl_seconds=60, max_items=2)
+        cache.put_page(("offset", 0, 2), [make_item(1), make_item(2)])
+        cache.put_item(make_item(3))  # evicts item 1
+        self.assertIsNone(cache.get_item(1))
+        self.assertIsNone(cache.get_page(("offset", 0, 2)))
+
+    def test_ttl_expiry(self):
+        cache = CatalogCache(ttl_seconds=0.01, max_items=10)
+        cache.put_item(make_item(1))
+        time.sleep(0.02)
+        self.assertIsNone(cache.get_item(1))
+
+    def test_delete_drops_pages(self):
+        cache = CatalogCache(ttl_seconds=60, max_items=10)
+        cache.put_page(("offset", 0, 100), [make_item(1)])
+        version = cache.version
+        cache.item_deleted(1)
+        self.assertIsNone(cache.get_page(("offset", 0, 100)))
+        self.assertGreater(cache.version, version)
+
+
+if __name__ == '__main__':
+    unittest.main()
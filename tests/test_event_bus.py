@@ -0,0 +1,98 @@
+import asyncio
+import json
+import unittest
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.db.db import create_async_db_engine
+from app.models.bus_event import BusEvent
+from app.services.event_bus import EventBus, InMemoryBackend, TableBackend
+from tests.support import TEST_DATABASE_URL
+
+
+class TestEventBus(unittest.TestCase):
+
+    def test_memory_bus_dispatches_locally(self):
+        async def scenario():
+            bus = EventBus(InMemoryBackend())
+            local, remote_only = [], []
+            bus.subscribe("stock", local.append)
+            bus.subscribe("stock", remote_only.append, local=False)
+            await bus.start()
+            await bus.publish("stock", {"items": {1: 5}})
+            await bus.stop()
+            self.assertEqual(local, [{"items": {1: 5}}])
+            self.assertEqual(remote_only, [])
+        asyncio.run(scenario())
+
+    def test_table_backend_delivers_to_other_workers(self):
+        async def scenario():
+            async_engine = create_async_db_engine(TEST_DATABASE_URL)
+            session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+            try:
+                first = EventBus(TableBackend(session_factory, poll_seconds=0.01))
+                second = EventBus(TableBackend(session_factory, poll_seconds=0.01))
+                first_seen, second_seen = [], []
+                first.subscribe("stock", first_seen.append)
+                second.subscribe("stock", second_seen.append)
+                await first.start()
+                await second.start()
+                await first.publish("stock", {"items": {"7": 3}})
+                await first.publish("stock", {"items": {"7": 2}})
+                for _ in range(100):
+                    if len(second_seen) == 2:
+                        break
+                    await asyncio.sleep(0.01)
+                await first.stop()
+                await second.stop()
+                # Each worker applies its own events once; the other gets them in order
+                self.assertEqual(first_seen, [{"items": {"7": 3}}, {"items": {"7": 2}}])
+                self.assertEqual(second_seen, [{"items": {"7": 3}}, {"items": {"7": 2}}])
+            finally:
+                await async_engine.dispose()
+        asyncio.run(scenario())
+
+    def test_table_backend_delivers_events_that_commit_late(self):
+        async def scenario():
+            async_engine = create_async_db_engine(TEST_DATABASE_URL)
+            session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+            try:
+                backend = TableBackend(session_factory)
+                await backend.start("reader", lambda *event: None)
+                await backend.stop()
+                seen = []
+                deliver = lambda origin, channel, payload: seen.append(payload)
+                base = backend._last_id
+                # id base+5 commits first; base+2 was assigned earlier but commits after the poll
+                for event_id in (base + 5, base + 2):
+                    async with session_factory() as db:
+                        await db.execute(insert(BusEvent).values(
+                            id=event_id, origin="writer", channel="stock", payload=json.dumps({"id": event_id})
+                        ))
+                        await db.commit()
+                    await backend.poll("reader", deliver)
+                await backend.poll("reader", deliver)
+                self.assertEqual(seen, [{"id": base + 5}, {"id": base + 2}])
+            finally:
+                await async_engine.dispose()
+        asyncio.run(scenario())
+
+    def test_publish_failure_is_logged_not_raised(self):
+        class BrokenBackend(InMemoryBackend):
+            async def publish(self, origin, channel, payload):
+                raise ConnectionError("database went away")
+
+        async def scenario():
+            bus = EventBus(BrokenBackend())
+            seen = []
+            bus.subscribe("stock", seen.append)
+            await bus.start()
+            with self.assertLogs("app.services.event_bus", level="ERROR"):
+                await bus.publish("stock", {"items": {1: 5}})
+            self.assertEqual(seen, [{"items": {1: 5}}])
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,34 +1,9 @@
-import os
 import unittest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 from app.main import app
-from app.db.db import Base, get_db
-
-# Ensure test.db exists
-TEST_DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'test.db')
-if not os.path.exists(TEST_DB_PATH):
-    open(TEST_DB_PATH, 'a').close()
-
-# Use SQLite for testing
-TEST_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
-
-engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Recreate schema to ensure it's up-to-date with models
-# Base.metadata.drop_all(bind=engine)  # Commented out for safety on real DB
-Base.metadata.create_all(bind=engine)
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()  # type: ignore
-
-app.dependency_overrides[get_db] = override_get_db
+from app.db.db import Base
+from tests.support import engine
 
 client = TestClient(app)
 
@@ -1,6 +1,7 @@
 import unittest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.utils.metrics import Histogram
 
 client = TestClient(app)
 
@@ -12,5 +13,40 @@ class TestHealthCheck(unittest.TestCase):
         data = response.json()
         self.assertEqual(data["status"], "healthy")
 
+    def test_pool_stats(self):
+        response = client.get("/health/pool")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn("sync", data)
+        self.assertIn("async", data)
+        self.assertIn("checked_out", data["async"])
+
+    def test_metrics(self):
+        client.get("/health")
+        client.get("/api/items/999999")
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        text = response.text
+        self.assertIn('http_requests_total{method="GET",route="/health",status="200"}', text)
+        # Labelled by route template, not by the requested path
+        self.assertIn('http_requests_total{method="GET",route="/api/items/{item_id}",status="404"}', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/health",le="+Inf"}', text)
+        self.assertIn("db_queries_per_request_count", text)
+        self.assertIn('cache_hit_ratio{cache="catalog"}', text)
+        self.assertIn("websocket_connections 0", text)
+        self.assertNotIn("set-cookie", response.headers)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        rows = {labels.get("le", name): value for name, labels, value in histogram.samples("latency", {})}
+        self.assertEqual(rows["0.1"], 2)
+        self.assertEqual(rows["1"], 3)
+        self.assertEqual(rows["+Inf"], 4)
+        self.assertEqual(rows["latency_sum"], 3.65)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,41 @@
+import time
+import unittest
+
+from app.services.identity import Identity, IdentityCache
+
+
+class TestIdentityCache(unittest.TestCase):
+
+    def test_lookup_and_invalidate(self):
+        cache = IdentityCache(ttl_seconds=60, max_entries=10)
+        alice = Identity(id="B0001", username="alice", email="alice@example.com")
+        cache.put_identity("username", "alice", alice)
+        cache.put_identity("id", "B0001", alice)
+        self.assertEqual(cache.get_identity("username", "alice"), alice)
+        self.assertIsNone(cache.get_identity("username", "bob"))
+        # Invalidating by any identifier drops every lookup that resolved to the user
+        cache.invalidate("B0001")
+        self.assertIsNone(cache.get_identity("username", "alice"))
+        self.assertIsNone(cache.get_identity("id", "B0001"))
+
+    def test_entries_expire(self):
+        cache = IdentityCache(ttl_seconds=0.01, max_entries=10)
+        cache.put_identity("username", "alice", Identity(id="B0001", username="alice", email="alice@example.com"))
+        time.sleep(0.02)
+        self.assertIsNone(cache.get_identity("username", "alice"))
+
+    def test_claims_never_outlive_the_token(self):
+        cache = IdentityCache(ttl_seconds=60, max_entries=10)
+        cache.put_claims("expired", {"sub": "alice", "exp": time.time() - 1})
+        cache.put_claims("valid", {"sub": "alice", "exp": time.time() + 60})
+        self.assertIsNone(cache.get_claims("expired"))
+        self.assertEqual(cache.get_claims("valid")["sub"], "alice")
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = IdentityCache(ttl_seconds=0, max_entries=10)
+        cache.put_identity("username", "alice", Identity(id="B0001", username="alice", email="alice@example.com"))
+        self.assertIsNone(cache.get_identity("username", "alice"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from app.utils import images
+from app.utils.images import ImageManifest
+
+
+class TestImageManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifest = ImageManifest(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def touch(self, name):
+        open(os.path.join(self.tmp.name, name), 'w').close()
+
+    def test_find_by_slug(self):
+        self.touch('Bluetooth_Speaker.png')
+        self.touch('gaming-mouse.jpg')
+        self.touch('notes.txt')
+        self.manifest.refresh()
+        self.assertEqual(self.manifest.find('Bluetooth Speaker'), 'images/items/Bluetooth_Speaker.png')
+        self.assertEqual(self.manifest.find('Gaming Mouse'), 'images/items/gaming-mouse.jpg')
+        self.assertIsNone(self.manifest.find('Notes'))
+
+    def test_prefers_exact_name_then_extension_order(self):
+        self.touch('Laptop_Stand.png')
+        self.touch('laptop-stand.webp')
+        self.touch('laptop-stand.jpg')
+        self.manifest.refresh()
+        self.assertEqual(self.manifest.find('Laptop Stand'), 'images/items/laptop-stand.jpg')
+
+    def test_picks_up_new_files_when_directory_changes(self):
+        self.manifest.refresh()
+        self.assertIsNone(self.manifest.find('Smartwatch'))
+        self.touch('smartwatch.png')
+        # Force the throttled mtime check to run and make the mtime change visible
+        os.utime(self.tmp.name, (0, 0))
+        self.manifest._checked_at -= images.MANIFEST_CHECK_INTERVAL
+        self.assertEqual(self.manifest.find('Smartwatch'), 'images/items/smartwatch.png')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,32 +1,13 @@
-import os
+import asyncio
 import unittest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 from app.main import app
-from app.db.db import Base, get_db
-
-# Ensure test.db exists
-TEST_DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'test.db')
-if not os.path.exists(TEST_DB_PATH):
-    open(TEST_DB_PATH, 'a').close()
-
-# Use SQLite for testing
-TEST_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
-
-engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base.metadata.create_all(bind=engine)
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()  # type: ignore
-
-app.dependency_overrides[get_db] = override_get_db
+from app.db.db import Base
+from app.services.catalog_cache import catalog_cache
+from app.services.search import InMemorySearchBackend
+from app.utils.http_cache import content_etag
+from tests.support import engine
 
 client = TestClient(app)
 
@@ -36,6 +17,7 @@ def truncate_tables(engine):
         conn.execute(text("BEGIN TRANSACTION;"))
         conn.execute(text("DELETE FROM cart_items;"))
         conn.execute(text("DELETE FROM carts;"))
+        conn.execute(text("DELETE FROM item_tags;"))
         conn.execute(text("DELETE FROM items;"))
         conn.execute(text("DELETE FROM users;"))
         conn.execute(text("COMMIT;"))
@@ -118,6 +100,99 @@ class TestItemsAPI(unittest.TestCase):
         get_response = client.get(f"/api/items/{item_id}")
         self.assertEqual(get_response.status_code, 404)
 
+    def test_read_items_cursor_pagination(self):
+        created = [
+            client.post("/api/items/", json={"name": f"Paged Item {i}", "price": 1.0}).json()["id"]
+            for i in range(3)
+        ]
+        first = client.get("/api/items/?limit=2")
+        self.assertEqual(first.status_code, 200)
+        cursor = first.headers.get("X-Next-Cursor")
+        self.assertIsNotNone(cursor)
+        second = client.get(f"/api/items/?limit=2&cursor={cursor}")
+        self.assertEqual(second.status_code, 200)
+        ids = [i["id"] for i in first.json()] + [i["id"] for i in second.json()]
+        self.assertEqual(ids, sorted(created))
+        self.assertNotIn("X-Next-Cursor", second.headers)
+
+    def test_read_items_invalid_cursor(self):
+        response = client.get("/api/items/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_items(self):
+        headphones = client.post("/api/items/", json={"name": "Wireless Headphones", "price": 99.0, "description": "Noise cancelling"}).json()
+        speaker = client.post("/api/items/", json={"name": "Bluetooth Speaker", "price": 49.0, "description": "Wireless and waterproof"}).json()
+        client.post("/api/items/", json={"name": "Gaming Mouse", "price": 19.0})
+
+        response = client.get("/api/items/search?q=wireless")
+        self.assertEqual(response.status_code, 200)
+        # A match in the name ranks above a match in the description
+        self.assertEqual([i["id"] for i in response.json()], [headphones["id"], speaker["id"]])
+
+        # Prefix match on the last word, all words required
+        response = client.get("/api/items/search?q=bluetooth spea")
+        self.assertEqual([i["id"] for i in response.json()], [speaker["id"]])
+
+        client.put(f"/api/items/{speaker['id']}", json={"name": "Portable Speaker", "description": "Waterproof"})
+        self.assertEqual([i["id"] for i in client.get("/api/items/search?q=wireless").json()], [headphones["id"]])
+
+        client.delete(f"/api/items/{headphones['id']}")
+        self.assertEqual(client.get("/api/items/search?q=wireless").json(), [])
+
+    def test_filter_items_by_tags_with_facets(self):
+        headphones = client.post("/api/items/", json={"name": "Headphones", "price": 99.0, "tags": ["Audio", "wireless"]}).json()
+        speaker = client.post("/api/items/", json={"name": "Speaker", "price": 49.0, "tags": ["audio", "portable"]}).json()
+        client.post("/api/items/", json={"name": "Mouse", "price": 19.0, "tags": ["gaming", "wireless"]})
+        self.assertEqual(headphones["tags"], ["audio", "wireless"])
+
+        response = client.get("/api/items/?tag=audio")
+        self.assertEqual(sorted(i["id"] for i in response.json()), sorted([headphones["id"], speaker["id"]]))
+        response = client.get("/api/items/?tag=audio&tag=wireless")
+        self.assertEqual([i["id"] for i in response.json()], [headphones["id"]])
+
+        facets = client.get("/api/items/facets?tag=audio").json()
+        self.assertEqual(facets["total"], 2)
+        counts = {f["name"]: f["count"] for f in facets["tags"]}
+        self.assertEqual(counts, {"audio": 2, "wireless": 1, "portable": 1})
+
+        client.put(f"/api/items/{speaker['id']}", json={"tags": ["portable"]})
+        response = client.get("/api/items/?tag=audio")
+        self.assertEqual([i["id"] for i in response.json()], [headphones["id"]])
+
+    def test_in_memory_search_backend(self):
+        backend = InMemorySearchBackend()
+        backend.index_item(1, "Wireless Headphones", "Noise cancelling", "audio,wireless")
+        backend.index_item(2, "Bluetooth Speaker", "Wireless sound", "audio")
+        ranked = asyncio.run(backend.search(None, ["wireless"], limit=10, offset=0))
+        self.assertEqual(ranked, [1, 2])
+        self.assertEqual(asyncio.run(backend.search(None, ["audio", "blue"], limit=10, offset=0)), [2])
+        backend.remove_item(2)
+        self.assertEqual(asyncio.run(backend.search(None, ["audio"], limit=10, offset=0)), [1])
+
+    def test_conditional_get_uses_etags(self):
+        item_id = client.post("/api/items/", json={"name": "Etag Item", "price": 3.0}).json()["id"]
+        for url in ("/api/items/", f"/api/items/{item_id}"):
+            response = client.get(url)
+            etag = response.headers["ETag"]
+            self.assertEqual(response.headers["Cache-Control"], "public, no-cache")
+            # A strong ETag: it is the hash of exactly the bytes sent
+            self.assertEqual(etag, content_etag(response.content))
+            cached = client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached.content, b"")
+        # Any catalog write changes the ETag
+        client.put(f"/api/items/{item_id}", json={"price": 4.0})
+        response = client.get(f"/api/items/{item_id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["price"], 4.0)
+        # ETags come from the content, not this process's cache state
+        etag = response.headers["ETag"]
+        catalog_cache.clear()
+        self.assertEqual(client.get(f"/api/items/{item_id}", headers={"If-None-Match": etag}).status_code, 304)
+        # A missing item is a 404 whatever the client sends
+        client.delete(f"/api/items/{item_id}")
+        self.assertEqual(client.get(f"/api/items/{item_id}", headers={"If-None-Match": "*"}).status_code, 404)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.core.config import settings
 
 client = TestClient(app)
 
@@ -35,6 +36,47 @@ class TestOrdersAPI(unittest.TestCase):
         list_resp = client.get('/api/orders/my', headers=headers)
         self.assertEqual(list_resp.status_code, 200)
         self.assertTrue(any(o['id'] == order['id'] for o in list_resp.json()))
+    def test_checkout_many_lines_clears_cart(self):
+        headers = self.authenticate()
+        cart_id = client.post('/api/carts/?user_id=buyer', headers=headers).json()['id']
+        prices = [1.5, 2.0, 4.25]
+        for i, price in enumerate(prices):
+            item_id = client.post('/api/items/', json={'name': f'Bulk Item {i}', 'price': price}, headers=headers).json()['id']
+            client.post(f'/api/carts/{cart_id}/items', json={'item_id': item_id, 'quantity': i + 1}, headers=headers)
+        order_resp = client.post('/api/orders/checkout', headers=headers)
+        self.assertEqual(order_resp.status_code, 200, order_resp.text)
+        order = order_resp.json()
+        self.assertEqual(len(order['items']), 3)
+        self.assertAlmostEqual(order['total_amount'], sum(p * (i + 1) for i, p in enumerate(prices)))
+        self.assertTrue(all(line['item']['name'].startswith('Bulk Item') for line in order['items']))
+        self.assertEqual(client.get(f'/api/carts/{cart_id}', headers=headers).json()['items'], [])
+        # Nothing left to check out
+        self.assertEqual(client.post('/api/orders/checkout', headers=headers).status_code, 400)
+
+    def test_fast_serialization_matches_default(self):
+        headers = self.authenticate()
+        cart_id = client.post('/api/carts/?user_id=buyer', headers=headers).json()['id']
+        for i in range(3):
+            item_id = client.post('/api/items/', json={'name': f'Fast Item {i}', 'price': 2.5, 'tags': ['fast', f't{i}']}, headers=headers).json()['id']
+            client.post(f'/api/carts/{cart_id}/items', json={'item_id': item_id, 'quantity': i + 1}, headers=headers)
+
+        def fetch_all():
+            cart = client.get(f'/api/carts/{cart_id}', headers=headers).json()
+            items = client.get('/api/items/?limit=1000').json()
+            search = client.get('/api/items/search?q=fast').json()
+            orders = client.get('/api/orders/my?limit=5', headers=headers)
+            return cart, items, search, orders.json(), orders.headers.get('x-next-cursor')
+
+        self.assertEqual(client.post('/api/orders/checkout', headers=headers).status_code, 200)
+        client.post(f'/api/carts/{cart_id}/items', json={'item_id': item_id, 'quantity': 1}, headers=headers)
+        default = fetch_all()
+        settings.fast_serialization = True
+        try:
+            fast = fetch_all()
+        finally:
+            settings.fast_serialization = False
+        self.assertEqual(len(default[0]['items']), 1)
+        self.assertEqual(fast, default)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import time
+import unittest
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.db.db import create_async_db_engine
+from app.main import app
+from app.utils.sessions import MemorySessionStore, ServerSessionMiddleware, TableSessionStore
+from tests.support import TEST_DATABASE_URL
+
+
+def make_app(store, touch_seconds=300.0):
+    session_app = FastAPI()
+
+    @session_app.get("/login")
+    def login(request: Request):
+        request.session["username"] = "alice"
+        return {}
+
+    @session_app.get("/guest")
+    def guest(request: Request):
+        request.session["session_id"] = "guest-cart"
+        return {}
+
+    @session_app.get("/me")
+    def me(request: Request):
+        return {"username": request.session.get("username")}
+
+    @session_app.get("/logout")
+    def logout(request: Request):
+        request.session.clear()
+        return {}
+
+    @session_app.get("/health")
+    def health(request: Request):
+        return {"username": request.session.get("username")}
+
+    session_app.add_middleware(ServerSessionMiddleware, store=store, touch_seconds=touch_seconds)
+    return session_app
+
+
+class TestServerSessions(unittest.TestCase):
+
+    def test_cookie_holds_only_an_id(self):
+        store = MemorySessionStore(ttl_seconds=60)
+        client = TestClient(make_app(store))
+        response = client.get("/login")
+        session_id = response.cookies["session"]
+        self.assertNotIn("alice", session_id)
+        self.assertEqual(asyncio.run(store.get(session_id)).data, {"username": "alice"})
+        self.assertEqual(client.get("/me").json(), {"username": "alice"})
+
+    def test_login_and_logout_get_a_new_session_id(self):
+        store = MemorySessionStore(ttl_seconds=60)
+        client = TestClient(make_app(store))
+        guest_id = client.get("/guest").cookies["session"]
+        login_id = client.get("/login").cookies["session"]
+        self.assertNotEqual(login_id, guest_id)
+        # The pre-login id is gone: a planted cookie cannot ride along into the logged-in session
+        self.assertIsNone(asyncio.run(store.get(guest_id)))
+        self.assertEqual(asyncio.run(store.get(login_id)).data, {"session_id": "guest-cart", "username": "alice"})
+
+    def test_unchanged_session_is_not_written_back(self):
+        store = MemorySessionStore(ttl_seconds=60)
+        client = TestClient(make_app(store))
+        client.get("/login")
+        response = client.get("/me")
+        self.assertNotIn("set-cookie", response.headers)
+        # Past the touch interval the session is rewritten once to slide its expiry
+        client = TestClient(make_app(store, touch_seconds=0))
+        client.cookies = {"session": list(store._sessions)[0]}
+        self.assertIn("set-cookie", client.get("/me").headers)
+
+    def test_skipped_paths_do_no_session_work(self):
+        store = MemorySessionStore(ttl_seconds=60)
+        client = TestClient(make_app(store))
+        client.get("/login")
+        response = client.get("/health")
+        self.assertEqual(response.json(), {"username": None})
+        self.assertNotIn("set-cookie", response.headers)
+        self.assertNotIn("set-cookie", TestClient(app).get("/health").headers)
+
+    def test_cleared_session_is_deleted(self):
+        store = MemorySessionStore(ttl_seconds=60)
+        client = TestClient(make_app(store))
+        client.get("/login")
+        response = client.get("/logout")
+        self.assertIn("Max-Age=0", response.headers["set-cookie"])
+        self.assertEqual(len(store._sessions), 0)
+
+    def test_memory_store_expires_sessions(self):
+        store = MemorySessionStore(ttl_seconds=0.01)
+        asyncio.run(store.set("abc", {"username": "alice"}))
+        time.sleep(0.02)
+        self.assertIsNone(asyncio.run(store.get("abc")))
+
+    def test_table_store_round_trip(self):
+        async def scenario():
+            async_engine = create_async_db_engine(TEST_DATABASE_URL)
+            try:
+                store = TableSessionStore(60, session_factory=async_sessionmaker(bind=async_engine, expire_on_commit=False))
+                await store.set("table-session", {"username": "alice"})
+                await store.set("table-session", {"username": "bob"})
+                self.assertEqual((await store.get("table-session")).data, {"username": "bob"})
+                await store.delete("table-session")
+                self.assertIsNone(await store.get("table-session"))
+            finally:
+                await async_engine.dispose()
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
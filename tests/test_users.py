@@ -1,32 +1,19 @@
-import os
+import asyncio
+import threading
 import unittest
+from passlib.context import CryptContext
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from app.main import app
-from app.db.db import Base, get_db
-
-# Ensure test.db exists
-TEST_DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'test.db')
-if not os.path.exists(TEST_DB_PATH):
-    open(TEST_DB_PATH, 'a').close()
-
-# Use SQLite for testing
-TEST_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
-
-engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base.metadata.create_all(bind=engine)
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()  # type: ignore
-
-app.dependency_overrides[get_db] = override_get_db
+from app.api import users as users_api
+from app.core.security import PasswordHasher, PasswordHashingBusy, pwd_context
+from app.utils.rate_limit import TokenBucketLimiter
+from app.db.db import Base, create_async_db_engine
+from app.db.migrations import next_id_number
+from app.services.id_allocator import IdAllocator
+from app.services.identity import resolve_identity
+from tests.support import TEST_DATABASE_URL, engine
 
 client = TestClient(app)
 
@@ -77,6 +64,45 @@ class TestUsersAPI(unittest.TestCase):
         data = response.json()
         self.assertIn("access_token", data)
 
+    def test_login_rehashes_outdated_hash(self):
+        client.post("/api/users/", json={"username": "rehashuser", "email": "rehash@example.com", "password": "password123"})
+        old_hash = CryptContext(schemes=["scrypt"], scrypt__default_rounds=4).hash("password123")
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE users SET hashed_password = :hash WHERE username = 'rehashuser'"), {"hash": old_hash})
+        response = client.post("/api/users/token", data={"username": "rehashuser", "password": "password123"})
+        self.assertEqual(response.status_code, 200)
+        with engine.connect() as conn:
+            new_hash = conn.execute(text("SELECT hashed_password FROM users WHERE username = 'rehashuser'")).scalar_one()
+        self.assertNotEqual(new_hash, old_hash)
+        self.assertFalse(pwd_context.needs_update(new_hash))
+
+    def test_username_never_resolves_to_another_users_id(self):
+        victim_id = client.post("/api/users/", json={"username": "victim", "email": "victim@example.com", "password": "password123"}).json()["id"]
+        attacker_id = client.post("/api/users/", json={"username": victim_id, "email": "attacker@example.com", "password": "password123"}).json()["id"]
+
+        async def resolve():
+            resolve_engine = create_async_db_engine(TEST_DATABASE_URL)
+            try:
+                async with async_sessionmaker(bind=resolve_engine)() as db:
+                    return await resolve_identity(db, victim_id), await resolve_identity(db, victim_id, by="id")
+            finally:
+                await resolve_engine.dispose()
+        by_username, by_id = asyncio.run(resolve())
+        self.assertEqual(by_username.id, attacker_id)
+        self.assertEqual(by_id.username, "victim")
+
+    def test_token_login_is_rate_limited(self):
+        limiter = users_api.login_account_limiter
+        users_api.login_account_limiter = TokenBucketLimiter(rate_per_minute=1)
+        try:
+            form = {"username": "nobody", "password": "wrong"}
+            self.assertEqual(client.post("/api/users/token", data=form).status_code, 401)
+            response = client.post("/api/users/token", data=form)
+            self.assertEqual(response.status_code, 429)
+            self.assertGreater(int(response.headers["retry-after"]), 0)
+        finally:
+            users_api.login_account_limiter = limiter
+
     def test_get_user_by_id(self):
         # Register user
         reg = client.post(
@@ -103,5 +129,59 @@ class TestUsersAPI(unittest.TestCase):
         self.assertEqual(data["email"], "test4@example.com")
 
 
+
+class TestPasswordHashing(unittest.TestCase):
+
+    def test_token_bucket(self):
+        limiter = TokenBucketLimiter(rate_per_minute=60, capacity=2)
+        self.assertEqual(limiter.acquire("1.2.3.4"), 0)
+        self.assertEqual(limiter.acquire("1.2.3.4"), 0)
+        self.assertGreater(limiter.acquire("1.2.3.4"), 0)
+        self.assertEqual(limiter.acquire("5.6.7.8"), 0)
+        self.assertEqual(TokenBucketLimiter(rate_per_minute=0).acquire("1.2.3.4"), 0)
+
+    def test_saturated_hasher_refuses_and_times_out(self):
+        release = threading.Event()
+
+        async def scenario():
+            hasher = PasswordHasher(workers=1, queue_size=0, timeout_seconds=0.05)
+            blocked = asyncio.ensure_future(hasher.run(release.wait))
+            await asyncio.sleep(0.01)
+            # The only worker is busy and nothing may queue: refused without waiting
+            with self.assertRaises(PasswordHashingBusy):
+                await hasher.run(len, "x")
+            with self.assertRaises(PasswordHashingBusy):
+                await blocked
+            release.set()
+            await asyncio.sleep(0.01)
+            self.assertEqual(await hasher.run(len, "x"), 1)
+            self.assertEqual(hasher.stats()["rejected"], 1)
+            self.assertEqual(hasher.stats()["timeouts"], 1)
+        asyncio.run(scenario())
+
+
+class TestUserIdAllocator(unittest.TestCase):
+
+    def test_workers_get_disjoint_blocks(self):
+        async def allocate():
+            allocator_engine = create_async_db_engine(TEST_DATABASE_URL)
+            session_factory = async_sessionmaker(bind=allocator_engine, expire_on_commit=False)
+            try:
+                async with session_factory() as db:
+                    await db.execute(text("DELETE FROM id_counters WHERE name = 'test-users'"))
+                    await db.commit()
+                first = IdAllocator("test-users", "T", 2)
+                second = IdAllocator("test-users", "T", 2)
+                async with session_factory() as db:
+                    return [await first.next_id(db), await second.next_id(db), await first.next_id(db), await first.next_id(db)]
+            finally:
+                await allocator_engine.dispose()
+        self.assertEqual(asyncio.run(allocate()), ["T0001", "T0003", "T0002", "T0005"])
+
+    def test_counter_starts_after_existing_ids(self):
+        self.assertEqual(next_id_number(["B0007", "B0012", "Bx", None], "B"), 13)
+        self.assertEqual(next_id_number([], "B"), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,14 @@
+import asyncio
+import gzip
+import os
+import tempfile
 import unittest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from app.main import app
+from app.services import catalog_view
+from app.services.reservations import publish_available
+from app.utils.compression import PrecompressedStaticFiles
 
 client = TestClient(app)
 
@@ -17,6 +25,23 @@ class TestWebRoutes(unittest.TestCase):
         response = client.get("/")
         self.assertIn(response.status_code, [200, 307, 302])
 
+    def test_home_page_reflects_catalog_changes(self):
+        item_id = client.post("/api/items/", json={"name": "Snapshot Item", "price": 3.5}).json()["id"]
+        self.assertIn("Snapshot Item", client.get("/").text)
+        client.put(f"/api/items/{item_id}", json={"name": "Renamed Snapshot Item"})
+        self.assertIn("Renamed Snapshot Item", client.get("/").text)
+        client.delete(f"/api/items/{item_id}")
+        self.assertNotIn("Snapshot Item", client.get("/").text)
+
+    def test_home_page_patches_stock_without_rebuilding(self):
+        item_id = client.post("/api/items/", json={"name": "Stock Snapshot Item", "price": 2.0}).json()["id"]
+        client.get("/")
+        snapshot = catalog_view._snapshot
+        asyncio.run(publish_available({item_id: 4}))
+        self.assertIn(f'<span id="item-stock-{item_id}">4</span>', client.get("/").text)
+        self.assertIs(catalog_view._snapshot, snapshot)
+        client.delete(f"/api/items/{item_id}")
+
     def test_cart_page(self):
         response = client.get("/cart")
         self.assertIn(response.status_code, [200, 307, 302, 401])  # 401 if not logged in
@@ -29,5 +54,34 @@ class TestWebRoutes(unittest.TestCase):
         response = client.get("/logout")
         self.assertIn(response.status_code, [200, 307, 302])
 
+    def test_large_responses_are_compressed(self):
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["vary"])
+        # Below the size threshold responses go out as they are
+        self.assertNotIn("content-encoding", client.get("/health", headers={"Accept-Encoding": "gzip"}).headers)
+
+    def test_precompressed_static_variants(self):
+        with tempfile.TemporaryDirectory() as directory:
+            css = b"body { color: black; }\n" * 200
+            with open(os.path.join(directory, "site.css"), "wb") as f:
+                f.write(css)
+            with open(os.path.join(directory, "site.css.gz"), "wb") as f:
+                f.write(gzip.compress(css))
+            static_app = FastAPI()
+            static_app.mount("/static", PrecompressedStaticFiles(directory=directory))
+            static_client = TestClient(static_app)
+
+            response = static_client.get("/static/site.css", headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(response.headers["content-encoding"], "gzip")
+            self.assertTrue(response.headers["content-type"].startswith("text/css"))
+            self.assertEqual(response.content, css)
+            cached = static_client.get("/static/site.css", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]})
+            self.assertEqual(cached.status_code, 304)
+
+            plain = static_client.get("/static/site.css", headers={"Accept-Encoding": "identity"})
+            self.assertNotIn("content-encoding", plain.headers)
+            self.assertEqual(plain.content, css)
+
 if __name__ == '__main__':
     unittest.main()
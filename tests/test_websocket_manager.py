@@ -0,0 +1,130 @@
+import asyncio
+import json
+import unittest
+
+from app.websocket_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, blocked=False, broken=False):
+        self.sent = []
+        self.closed_with = None
+        self.broken = broken
+        self.unblock = asyncio.Event()
+        if not blocked:
+            self.unblock.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.broken:
+            raise RuntimeError("connection reset")
+        await self.unblock.wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def settle():
+    # Let the writer tasks run
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestConnectionManager(unittest.TestCase):
+
+    def test_slow_client_does_not_delay_others(self):
+        async def scenario():
+            manager = ConnectionManager(queue_size=10)
+            fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+            await manager.connect(fast)
+            await manager.connect(slow)
+            for i in range(3):
+                await manager.broadcast({"type": "stock_update", "item_id": i, "stock": 5})
+            await settle()
+            self.assertEqual([json.loads(m)["item_id"] for m in fast.sent], [0, 1, 2])
+            self.assertEqual(slow.sent, [])
+            slow.unblock.set()
+            await settle()
+            self.assertEqual(len(slow.sent), 3)
+        asyncio.run(scenario())
+
+    def test_drop_oldest_keeps_latest_messages(self):
+        async def scenario():
+            manager = ConnectionManager(queue_size=2, slow_client_policy="drop_oldest")
+            slow = FakeWebSocket(blocked=True)
+            await manager.connect(slow)
+            await manager.broadcast("m0")
+            await settle()  # m0 is in flight, the queue is empty
+            for i in range(1, 5):
+                await manager.broadcast(f"m{i}")
+            self.assertEqual(manager.dropped_messages, 2)
+            slow.unblock.set()
+            await settle()
+            self.assertEqual(slow.sent, ["m0", "m3", "m4"])
+        asyncio.run(scenario())
+
+    def test_disconnect_policy_closes_slow_client(self):
+        async def scenario():
+            manager = ConnectionManager(queue_size=1, slow_client_policy="disconnect")
+            slow = FakeWebSocket(blocked=True)
+            await manager.connect(slow)
+            for i in range(3):
+                await manager.broadcast(f"m{i}")
+            await settle()
+            self.assertNotIn(slow, manager.active_connections)
+            self.assertEqual(slow.closed_with, 1013)
+            self.assertEqual(manager.stats()["slow_disconnects"], 1)
+        asyncio.run(scenario())
+
+    def test_dead_socket_is_removed(self):
+        async def scenario():
+            manager = ConnectionManager()
+            dead = FakeWebSocket(broken=True)
+            await manager.connect(dead)
+            await manager.broadcast("hello")
+            await settle()
+            self.assertEqual(manager.stats()["connections"], 0)
+        asyncio.run(scenario())
+
+    def test_stock_changes_are_coalesced_per_item(self):
+        async def scenario():
+            manager = ConnectionManager(coalesce_seconds=0.01)
+            watcher = FakeWebSocket()
+            await manager.connect(watcher)
+            for stock in range(10, 0, -1):
+                manager.stock_changed(1, stock)
+            manager.stock_changed(2, 7)
+            await settle()
+            self.assertEqual(watcher.sent, [])
+            await asyncio.sleep(0.02)
+            await settle()
+            self.assertEqual(len(watcher.sent), 1)
+            self.assertEqual(json.loads(watcher.sent[0]), {"type": "stock_batch", "items": {"1": 1, "2": 7}})
+        asyncio.run(scenario())
+
+    def test_subscribed_clients_only_get_watched_items(self):
+        async def scenario():
+            manager = ConnectionManager()
+            everything, watcher, idle = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            for websocket in (everything, watcher, idle):
+                await manager.connect(websocket)
+            manager.handle_client_message(watcher, json.dumps({"subscribe": [1, 2]}))
+            manager.handle_client_message(idle, json.dumps({"subscribe": []}))
+            manager.handle_client_message(idle, "not json")
+            manager.handle_client_message(watcher, json.dumps({"subscribe": "3"}))
+            manager.stock_changed(1, 4)
+            manager.stock_changed(3, 9)
+            await settle()
+            self.assertEqual([json.loads(m)["items"] for m in everything.sent], [{"1": 4}, {"3": 9}])
+            self.assertEqual([json.loads(m)["items"] for m in watcher.sent], [{"1": 4}])
+            self.assertEqual(idle.sent, [])
+            manager.disconnect(watcher)
+            self.assertEqual(manager.stats()["watched_items"], 0)
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()